@@ -0,0 +1,141 @@
+'''
+Import-time benchmark of the CARP entry points.
+
+Imports every entry point in a fresh interpreter (python -X importtime), so
+nothing is cached between measurements, and reports the median import time
+and which heavy third-party modules got loaded on the way. Heavy modules that
+an entry point should never pull in (e.g. Qt for the headless and worker
+paths) are errors, as is any import slower than --max-ms, so the exit code
+can be used to catch startup regressions.
+
+Usage (from the CARP directory):
+    python bench/imports.py --repeats 5 --max-ms 500
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tomllib
+from datetime import datetime
+
+CARP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# third-party modules worth tracking, by top level package
+HEAVY = ('PySide6', 'pyqtgraph', 'pandas', 'tables', 'caen_felib', 'scipy', 'matplotlib')
+
+# entry point -> heavy modules it must not load
+ENTRY_POINTS = {
+    'core.io'          : HEAVY,
+    'felib.digitiser'  : HEAVY,
+    'core.worker'      : HEAVY,
+    'core.process'     : HEAVY,
+    'core.headless'    : HEAVY,
+    'core.decoder'     : HEAVY,
+    'core.controller'  : ('pandas', 'tables', 'caen_felib'),
+}
+
+
+def import_once(module : str) -> tuple:
+    '''
+    Import module in a new interpreter, returns its cumulative import time (s)
+    and the heavy packages loaded.
+    '''
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & set({HEAVY!r}))))")
+    env = dict(os.environ, CARP_DIR = CARP_DIR, QT_QPA_PLATFORM = os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd = CARP_DIR, env = env,
+                            capture_output = True, text = True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        _, total, name = line[len('import time:'):].split('|')
+        if name.strip() == module:
+            cumulative = int(total) * 1e-6
+    return cumulative, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def carp_version() -> dict:
+    '''
+    Project version and git commit (as in bench/pipeline.py, which imports the GUI).
+    '''
+    with open(os.path.join(CARP_DIR, 'pyproject.toml'), 'rb') as f:
+        version = tomllib.load(f)['project']['version']
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = CARP_DIR,
+                                capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'version' : version, 'commit' : commit}
+
+
+def cli_startup() -> float:
+    '''
+    Wall time of bin/carp --help, argument parsing included.
+    '''
+    env = dict(os.environ, CARP_DIR = CARP_DIR)
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(CARP_DIR, 'bin', 'carp'), '--help'], env = env,
+                   capture_output = True, check = True)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'CARP import-time benchmark')
+    parser.add_argument('--modules', nargs = '+', default = list(ENTRY_POINTS), help = 'entry points to import')
+    parser.add_argument('--repeats', type = int,   default = 5,    help = 'fresh imports per entry point')
+    parser.add_argument('--max-ms',  type = float, default = None, help = 'fail if any median import is slower')
+    parser.add_argument('--output',  default = None, help = 'JSON results file (default bench/results/<date>.json)')
+    args = parser.parse_args()
+
+    results  = {}
+    failures = []
+    for module in args.modules:
+        times = []
+        for _ in range(args.repeats):
+            elapsed, loaded = import_once(module)
+            times.append(elapsed)
+        median    = statistics.median(times)
+        forbidden = sorted(set(loaded) & set(ENTRY_POINTS.get(module, ())))
+        results[module] = {'median_ms' : median * 1e3,
+                           'min_ms'    : min(times) * 1e3,
+                           'max_ms'    : max(times) * 1e3,
+                           'loaded'    : loaded}
+        print(f"{module:<18} | median {median * 1e3:>8.1f} ms | min {min(times) * 1e3:>8.1f} ms | "
+              f"heavy: {', '.join(loaded) or '-'}")
+        if forbidden:
+            failures.append(f"{module} loads {', '.join(forbidden)}")
+        if args.max_ms is not None and median * 1e3 > args.max_ms:
+            failures.append(f"{module} takes {median * 1e3:.1f} ms (> {args.max_ms:.0f} ms)")
+
+    startup = statistics.median(cli_startup() for _ in range(args.repeats))
+    print(f"{'carp --help':<18} | median {startup * 1e3:>8.1f} ms")
+
+    output = args.output or os.path.join(CARP_DIR, 'bench', 'results', f"imports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    with open(output, 'w') as f:
+        json.dump({'carp'       : carp_version(),
+                   'python'     : platform.python_version(),
+                   'platform'   : platform.platform(),
+                   'date'       : datetime.now().isoformat(),
+                   'arguments'  : vars(args),
+                   'cli_ms'     : startup * 1e3,
+                   'results'    : results,
+                   'failures'   : failures}, f, indent = 2)
+    print(f'Results written to {output}')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
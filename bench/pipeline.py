@@ -0,0 +1,283 @@
+'''
+End-to-end throughput benchmark of the acquisition pipeline.
+
+Runs AcquisitionWorker against the simulated digitiser (dig_name = 'debug')
+and drives Controller.data_handling headless at a fixed refresh rate, for
+every combination of record length, channel count and trigger rate given.
+Per scenario it measures events/s, MB/s, per-stage latency percentiles and
+dropped events, and writes everything to a JSON file so results of different
+versions can be compared.
+
+Both readout paths of Digitiser.read_batch are measured, each labelled in the
+results: 'dpp' reads the decoded DPP endpoint one event per read_data call
+(the default), 'raw' reads whole buffers from the RAW endpoint and decodes
+them (raw_readout = True). The simulator generates the pulses (and for 'raw' encodes the buffers)
+inside the endpoint calls, so the readout times include that cost. The time
+spent in the endpoint is measured separately and readout_us_per_event is
+CARP's own readout cost per event without it.
+
+Usage (from the CARP directory):
+    python bench/pipeline.py --record-lengths 1024 4096 --channels 1 4 --rates 1e3 1e5 --readout raw dpp
+'''
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+from datetime import datetime
+from queue import Queue
+from threading import Event
+from types import SimpleNamespace
+
+import numpy as np
+
+CARP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(CARP_DIR)
+
+from core.commands import Command, CommandType
+from core.controller import Controller
+from core.ringbuffer import RingBuffer
+from core.worker import AcquisitionWorker
+from ui.decimation import XAxisCache, minmax_decimate
+from ui.oscilloscope import newest_per_channel
+
+
+PERCENTILES = (50, 90, 99)
+
+
+class HeadlessScreen:
+    '''
+    Stand-in for OscilloScopeScreen doing the same decimation, without drawing.
+    '''
+    def __init__(self, shown : set, n_points : int = 2000):
+        self.shown    = shown
+        self.n_points = n_points
+        self.x_axes   = XAxisCache()
+
+    def update_ch(self, y, ch = 0):
+        minmax_decimate(self.x_axes.get(len(y)), y, self.n_points)
+
+    def update_channels(self, batch):
+        for ch, i in newest_per_channel(batch.channel, self.shown).items():
+            self.update_ch(batch.waveforms[i][:int(batch.wf_size[i])], ch)
+
+
+def latency_summary(samples : list) -> dict:
+    '''
+    Percentiles and maximum (in ms) of a list of latencies in seconds.
+    '''
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1e3
+    return {**{f'p{p}' : float(np.percentile(ms, p)) for p in PERCENTILES},
+            'max' : float(ms.max()), 'n' : len(ms)}
+
+
+def write_configs(tmp_dir : str, record_length : int, n_ch : int, rate : float,
+                  batch_size : int, output_format : str, analysis : bool = False,
+                  readout : str = 'raw') -> tuple:
+    '''
+    Write the digitiser and recording configs of one scenario.
+    '''
+    dig_config = os.path.join(tmp_dir, 'dig.conf')
+    rec_config = os.path.join(tmp_dir, 'rec.conf')
+    with open(dig_config, 'w') as f:
+        f.write(f"[required]\ndig_name = 'debug'\ndig_gen = 1\ncon_type = 'usb'\n"
+                f"[simulation]\nsim_n_ch = {n_ch}\nsim_rate = {rate}\n")
+    with open(rec_config, 'w') as f:
+        f.write(f"[required]\nrecord_length = {record_length}\npre_trigger = {record_length // 8}\n"
+                f"trigger_mode = 'SELFTRIG'\n"
+                f"[readout]\nbatch_size = {batch_size}\nraw_readout = {readout == 'raw'}\n"
+                f"[analysis]\nanalysis = {analysis}\n"
+                f"[output]\noutput_dir = '{tmp_dir}'\noutput_format = '{output_format}'\n"
+                f"[channel_settings]\n")
+        for ch in range(n_ch):
+            f.write(f"ch{ch} = {{'enabled': True, 'self_trigger': True, 'threshold': 100, 'polarity': 'positive'}}\n")
+    return dig_config, rec_config
+
+
+def wait_for(condition, timeout : float = 10.0):
+    t0 = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError('Pipeline did not reach the expected state.')
+        time.sleep(0.01)
+
+
+def run_scenario(record_length : int, n_ch : int, rate : float, duration : float,
+                 fps : float, batch_size : int, record : str, analysis : bool = False,
+                 readout_path : str = 'raw') -> dict:
+    '''
+    Run the pipeline for one scenario and return its measurements.
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dig_config, rec_config = write_configs(tmp_dir, record_length, n_ch, rate, batch_size, record or 'h5', analysis, readout_path)
+
+        cmd_buffer = Queue()
+        ring       = RingBuffer()
+        stop_event = Event()
+        worker     = AcquisitionWorker(cmd_buffer = cmd_buffer, ring = ring, stop_event = stop_event)
+
+        # headless stand-in for the Controller, data_handling is the real one
+        display = SimpleNamespace(display_reader = ring.reader('display'),
+                                  display_metrics = worker.metrics.stage('display'),
+                                  frame_events   = 64,
+                                  update_persistence = lambda : None,
+                                  update_spectrum    = lambda : None,
+                                  frames         = 0,
+                                  main_window    = SimpleNamespace(screen = HeadlessScreen(set(range(n_ch)))))
+
+        worker.start()
+        cmd_buffer.put(Command(CommandType.CONNECT, (dig_config, rec_config)))
+        wait_for(lambda : ring.data is not None)
+
+        # time every readout from the worker thread
+        digitiser  = worker.digitiser
+        readout    = []
+        events_out = [0]
+        acquire    = digitiser.acquire
+        def timed_acquire(*args, **kwargs):
+            t0 = time.perf_counter()
+            batch = acquire(*args, **kwargs)
+            readout.append(time.perf_counter() - t0)
+            if batch is not None:
+                events_out[0] += len(batch)
+            return batch
+        digitiser.acquire = timed_acquire
+
+        # time spent in the simulated endpoint (pulse generation, RAW encoding), which
+        # on hardware is the board and FELib, to separate it from CARP's own cost
+        endpoint_time = [0.0]
+        def timed(call):
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return call(*args, **kwargs)
+                finally:
+                    endpoint_time[0] += time.perf_counter() - t0
+            return wrapper
+        digitiser.endpoint.has_data  = timed(digitiser.endpoint.has_data)
+        digitiser.endpoint.read_data = timed(digitiser.endpoint.read_data)
+
+        cmd_buffer.put(Command(CommandType.RECORD_START if record else CommandType.START))
+        wait_for(lambda : digitiser.isAcquiring)
+
+        # display loop on this thread, at the GUI refresh rate
+        display_time, display_age = [], []
+        tick  = digitiser.dig.tick  # ns per timestamp count
+        t_end = time.perf_counter() + duration
+        t0    = time.perf_counter()
+        while time.perf_counter() < t_end:
+            t_frame = time.perf_counter()
+            newest  = display.display_reader.ring.written
+            Controller.data_handling(display)
+            display_time.append(time.perf_counter() - t_frame)
+            if newest:
+                # age of the newest displayed event since its trigger
+                ts = int(ring.data['TIMESTAMP'][(newest - 1) % ring.capacity])
+                display_age.append(time.perf_counter() - digitiser.dig.t0 - ts * tick / 1e9)
+            time.sleep(max(0, 1 / fps - (time.perf_counter() - t_frame)))
+        elapsed = time.perf_counter() - t0
+
+        board_lost = digitiser.dig.lost
+        overruns   = ring.overruns()
+        n_events   = events_out[0]
+        analysed   = worker.features.written
+        metrics    = worker.metrics.snapshot()
+
+        cmd_buffer.put(Command(CommandType.STOP))
+        cmd_buffer.put(Command(CommandType.EXIT))
+        worker.join(timeout = 10)
+
+    return {
+        'record_length'    : record_length,
+        'n_ch'             : n_ch,
+        'trigger_rate'     : rate,
+        'batch_size'       : batch_size,
+        'readout_path'     : readout_path,
+        'record'           : record,
+        'analysis'         : analysis,
+        'events_analysed'  : analysed,
+        'duration'         : elapsed,
+        'events'           : n_events,
+        'events_per_s'     : n_events / elapsed,
+        'readout_us_per_event' : (sum(readout) - endpoint_time[0]) / max(n_events, 1) * 1e6,
+        'endpoint_s'       : endpoint_time[0],
+        'MB_per_s'         : n_events * ring.data.dtype.itemsize / elapsed / 1e6,
+        'dropped_on_board' : int(board_lost),
+        'reader_overruns'  : overruns,
+        'display_fps'      : display.frames / elapsed,
+        'display_skipped'  : display.display_reader.skipped,
+        'latency_ms'       : {'readout'         : latency_summary(readout),
+                              'display'         : latency_summary(display_time),
+                              'trigger_display' : latency_summary(display_age)},
+        'metrics'          : metrics,
+    }
+
+
+def carp_version() -> dict:
+    '''
+    Project version and git commit, so results can be compared between versions.
+    '''
+    with open(os.path.join(CARP_DIR, 'pyproject.toml'), 'rb') as f:
+        version = tomllib.load(f)['project']['version']
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = CARP_DIR,
+                                capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'version' : version, 'commit' : commit}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'CARP acquisition pipeline throughput benchmark')
+    parser.add_argument('--record-lengths', type = int,   nargs = '+', default = [1024, 4096], help = 'record lengths (ns)')
+    parser.add_argument('--channels',       type = int,   nargs = '+', default = [1, 4],       help = 'number of channels')
+    parser.add_argument('--rates',          type = float, nargs = '+', default = [1e3, 1e5],   help = 'total trigger rates (Hz)')
+    parser.add_argument('--duration',       type = float, default = 5.0,  help = 'seconds per scenario')
+    parser.add_argument('--fps',            type = float, default = 30.0, help = 'display refresh rate')
+    parser.add_argument('--batch-size',     type = int,   default = 256,  help = 'events per readout')
+    parser.add_argument('--record',         choices = ['h5', 'raw'], default = None, help = 'also record to disk')
+    parser.add_argument('--analysis',       action = 'store_true', help = 'run the online pulse analysis')
+    parser.add_argument('--readout',        choices = ['raw', 'dpp'], nargs = '+', default = ['raw', 'dpp'],
+                        help = 'readout paths: RAW endpoint buffers, or the DPP endpoint one event per call')
+    parser.add_argument('--output',         default = None, help = 'JSON results file (default bench/results/<date>.json)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.WARNING, format = '%(levelname)-8s | %(asctime)s | %(message)s')
+
+    results = []
+    for record_length in args.record_lengths:
+        for n_ch in args.channels:
+            for rate in args.rates:
+                for readout in args.readout:
+                    result = run_scenario(record_length, n_ch, rate, args.duration, args.fps, args.batch_size,
+                                          args.record, args.analysis, readout)
+                    results.append(result)
+                    print(f"{readout:<3} | reclen {record_length:>6} ns | {n_ch} ch | {rate:>10.0f} Hz || "
+                          f"{result['events_per_s']:>10.0f} events/s | {result['MB_per_s']:>8.2f} MB/s | "
+                          f"readout p99 {result['latency_ms']['readout'].get('p99', 0):.2f} ms, "
+                          f"{result['readout_us_per_event']:.2f} us/event outside the endpoint | "
+                          f"lost {result['dropped_on_board']} | overruns {result['reader_overruns']} | "
+                          f"display {result['display_fps']:.1f} fps, {result['display_skipped']} skipped")
+
+    output = args.output or os.path.join(CARP_DIR, 'bench', 'results', f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    with open(output, 'w') as f:
+        json.dump({'carp'      : carp_version(),
+                   'python'    : platform.python_version(),
+                   'numpy'     : np.__version__,
+                   'platform'  : platform.platform(),
+                   'date'      : datetime.now().isoformat(),
+                   'arguments' : vars(args),
+                   'results'   : results}, f, indent = 2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
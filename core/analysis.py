@@ -0,0 +1,179 @@
+'''
+Online pulse analysis: per-event features computed on whole batches of waveforms.
+'''
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
+
+import numpy as np
+
+from core.ringbuffer import RingBuffer, RingReader
+from core.tracker import StageMetrics
+from core import profiling
+
+
+# per-event features, SEQ is the event's position in the event ring buffer stream
+FEATURE_DTYPE = np.dtype([
+    ('SEQ',       np.uint64),
+    ('BOARD',     np.uint8),
+    ('CHANNEL',   np.uint8),
+    ('TIMESTAMP', np.uint64),
+    ('BASELINE',  np.float32),   # ADCs
+    ('AMPLITUDE', np.float32),   # ADCs above baseline, in the pulse polarity
+    ('PEAK_TIME', np.float32),   # ns from the start of the waveform
+    ('INTEGRAL',  np.float32),   # ADC x ns after the pre-trigger
+    ('RISE_TIME', np.float32),   # ns, 10% to 90% of the amplitude
+])
+
+
+def crossing_time(signal : np.ndarray, level : np.ndarray, start : int) -> np.ndarray:
+    '''
+    Time (in samples, linearly interpolated) at which each row of signal first
+    reaches its level, searching from sample start onwards.
+    '''
+    rows  = np.arange(len(signal))
+    above = signal[:, start:] >= level[:, None]
+    i     = np.argmax(above, axis = 1) + start
+    prev  = np.maximum(i - 1, 0)
+    y0, y1 = signal[rows, prev], signal[rows, i]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        frac = np.where(y1 > y0, (level - y0) / (y1 - y0), 0)
+    return prev + np.clip(frac, 0, 1)
+
+
+def analyse(waveforms   : np.ndarray,
+            polarity    : np.ndarray,
+            pre_trigger : int,
+            period      : float) -> dict:
+    '''
+    Pulse features of a (n_events, n_samples) block of waveforms, fully vectorised.
+
+    Parameters
+    ----------
+
+    waveforms (ndarray)    :  ADC samples, one event per row
+    polarity (ndarray)     :  +1 or -1 per event, the sign of the pulses
+    pre_trigger (int)      :  number of pre-trigger samples, used for the baseline
+    period (float)         :  sampling period in ns
+
+    Returns
+    -------
+
+    features (dict)        :  BASELINE, AMPLITUDE, PEAK_TIME, INTEGRAL and RISE_TIME arrays
+    '''
+    pre_trigger = int(np.clip(pre_trigger, 1, waveforms.shape[1] - 1))
+    wf = waveforms.astype(np.float32)
+
+    baseline = wf[:, :pre_trigger].mean(axis = 1)
+    signal   = (wf - baseline[:, None]) * polarity[:, None].astype(np.float32)
+
+    peak      = signal.argmax(axis = 1)
+    amplitude = signal[np.arange(len(signal)), peak]
+    integral  = signal[:, pre_trigger:].sum(axis = 1) * period
+
+    t10 = crossing_time(signal, 0.1 * amplitude, pre_trigger)
+    t90 = crossing_time(signal, 0.9 * amplitude, pre_trigger)
+
+    return {'BASELINE'  : baseline,
+            'AMPLITUDE' : amplitude,
+            'PEAK_TIME' : peak * period,
+            'INTEGRAL'  : integral,
+            'RISE_TIME' : (t90 - t10) * period}
+
+
+def channel_polarity(rec_dict : dict, boards = (0,)) -> dict:
+    '''
+    Pulse sign (+1 or -1) of each (board, channel) configured in the recording
+    config, every board is configured with the same channel settings.
+    '''
+    polarity = {}
+    for key, value in rec_dict.items():
+        if key.startswith('ch') and key[2:].isdigit() and isinstance(value, dict):
+            for board in boards:
+                polarity[board, int(key[2:])] = -1 if value.get('polarity') == 'negative' else 1
+    return polarity
+
+
+class AnalysisStage(Thread):
+    '''
+    Analyses the events of its ring buffer reader on a pool of worker threads
+    (NumPy releases the GIL for the heavy lifting) and publishes the features, in
+    event order, to a features ring buffer that recording and display can read.
+    '''
+
+    def __init__(self,
+                 reader      : RingReader,
+                 features    : RingBuffer,
+                 polarity    : dict,
+                 pre_trigger : int,
+                 period      : float,
+                 n_workers   : int = 2,
+                 metrics     : StageMetrics = None):
+        super().__init__(daemon = True)
+        self.reader      = reader
+        self.features    = features
+        self.pre_trigger = pre_trigger
+        self.period      = period
+        self.n_workers   = n_workers
+        self.metrics     = metrics or StageMetrics('analysis')
+        self.stop_event  = Event()
+
+        # polarity lookup by board and channel number, positive unless configured otherwise
+        self.polarity = np.ones((256, 256), dtype = np.int8)
+        for (board, ch), sign in polarity.items():
+            self.polarity[board, ch] = sign
+
+    def stop(self):
+        self.stop_event.set()
+
+    def process(self, batch):
+        '''
+        Analyse one batch, split over the worker pool, and publish its features.
+        '''
+        seq0     = self.reader.cursor - len(batch)
+        chunks   = np.array_split(np.arange(len(batch)), min(self.n_workers, len(batch)))
+        polarity = self.polarity[batch.board, batch.channel]
+        jobs     = [self.pool.submit(analyse,
+                                     batch.waveforms[c[0] : c[-1] + 1],
+                                     polarity[c[0] : c[-1] + 1],
+                                     self.pre_trigger, self.period) for c in chunks]
+        results = [job.result() for job in jobs]
+        features = {name : np.concatenate([r[name] for r in results]) for name in results[0]}
+        features['SEQ']       = np.arange(seq0, seq0 + len(batch))
+        features['BOARD']     = batch.board
+        features['CHANNEL']   = batch.channel
+        features['TIMESTAMP'] = batch.timestamp
+
+        # a block can wrap around the end of the features buffer, so publish in pieces
+        done = 0
+        while done < len(batch):
+            rows = self.features.reserve(len(batch) - done).data
+            n = len(rows)
+            for name, values in features.items():
+                rows[name] = values[done : done + n]
+            self.features.commit(n)
+            done += n
+
+    @profiling.profile_thread('analysis')
+    def run(self):
+        logging.info(f"Analysis stage started with {self.n_workers} workers.")
+        with ThreadPoolExecutor(max_workers = self.n_workers) as self.pool:
+            while True:
+                batch = self.reader.read(self.features.reserve_max)
+                if batch is None:
+                    # analyse everything pending before exiting
+                    if self.stop_event.is_set():
+                        break
+                    self.stop_event.wait(0.005)
+                    continue
+                try:
+                    t0 = time.perf_counter()
+                    self.process(batch)
+                    self.metrics.record(t0, len(batch), batch.nbytes)
+                except Exception as e:
+                    logging.exception(f"Analysis failed: {e}")
+
+        if self.reader.overruns:
+            logging.warning(f"Analysis fell behind, {self.reader.overruns} events were not analysed.")
+        logging.info("Analysis stage exited.")
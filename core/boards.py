@@ -0,0 +1,133 @@
+'''
+Parallel readout of several digitisers, merged by timestamp into one event stream.
+'''
+import logging
+import time
+from threading import Thread, Event
+
+import numpy as np
+
+from core.ringbuffer import RingBuffer
+from core.tracker import Tracker, StageMetrics
+from core import profiling
+from felib.digitiser import Digitiser
+
+
+class BoardReader(Thread):
+    '''
+    Reads one digitiser into its own ring buffer for as long as it acquires,
+    tracking the board's event rate.
+    '''
+
+    def __init__(self, digitiser : Digitiser, ring : RingBuffer, timeout : int = 100,
+                 metrics : StageMetrics = None):
+        super().__init__(daemon = True, name = f'board{digitiser.board}')
+        self.digitiser  = digitiser
+        self.ring       = ring
+        self.timeout    = timeout   # ms
+        self.tracker    = Tracker(name = f'board {digitiser.board}')
+        self.metrics    = metrics or StageMetrics(f'readout board {digitiser.board}')
+        self.stop_event = Event()
+        self.error      = None   # the digitiser error that ended the readout, if it failed
+
+    def stop(self):
+        self.stop_event.set()
+
+    @profiling.profile_thread('board')
+    def run(self):
+        logging.info(f"Readout of board {self.digitiser.board} started.")
+        while self.digitiser.isAcquiring and not self.stop_event.is_set():
+            try:
+                t0    = time.perf_counter()
+                out   = self.ring.reserve(self.digitiser.batch_size)
+                with profiling.span('acquire'):
+                    batch = self.digitiser.acquire(self.timeout, out)
+                if batch is None:
+                    continue
+                self.ring.commit(len(batch))
+                self.metrics.record(t0, len(batch), batch.nbytes)
+                self.tracker.track(batch.nbytes, len(batch))
+            except self.digitiser.errors.Error as e:
+                if not self.digitiser.isAcquiring:
+                    break   # disarmed while reading
+                logging.exception(f"Readout of board {self.digitiser.board} failed: {e}")
+                self.error = e
+                break
+            except Exception as e:
+                # not a board failure, skip this read
+                logging.exception(f"Readout of board {self.digitiser.board}: {e}")
+                self.stop_event.wait(self.timeout * 1e-3)
+        logging.info(f"Readout of board {self.digitiser.board} stopped.")
+
+
+class TimestampMerger:
+    '''
+    Merges the event streams of several boards into one ring buffer in timestamp order.
+
+    Events are held back until every board has reported a later timestamp (the
+    watermark), so the output stays ordered as long as each board's own stream
+    is. A board that has been silent for idle_timeout seconds no longer holds
+    the others back, its events arriving later than the watermark are still
+    passed on and counted in late.
+    '''
+
+    def __init__(self, readers : list, out : RingBuffer, idle_timeout : float = 0.5):
+        self.readers      = readers
+        self.out          = out
+        self.idle_timeout = idle_timeout
+        self.pending      = [np.empty(0, dtype = out.data.dtype) for _ in readers]
+        self.newest       = np.zeros(len(readers), dtype = np.uint64)
+        self.last_active  = np.full(len(readers), time.perf_counter())
+        self.emitted      = 0    # newest timestamp passed on so far
+        self.late         = 0
+
+    def collect(self):
+        '''
+        Copy what every board produced since the last call into its pending events.
+        '''
+        now = time.perf_counter()
+        for i, reader in enumerate(self.readers):
+            new = []
+            while (batch := reader.read()) is not None:
+                new.append(batch.events)
+            if new:
+                self.pending[i]     = np.concatenate([self.pending[i], *new])
+                self.newest[i]      = max(self.newest[i], self.pending[i]['TIMESTAMP'].max())
+                self.last_active[i] = now
+        return now
+
+    def merge(self, flush : bool = False) -> int:
+        '''
+        Pass every pending event up to the watermark (everything if flush) to the
+        output ring buffer in timestamp order. Returns the number of events passed on.
+        '''
+        now    = self.collect()
+        active = (now - self.last_active) < self.idle_timeout
+        if flush or not active.any():
+            watermark = np.iinfo(np.uint64).max
+        else:
+            watermark = self.newest[active].min()
+
+        ready = []
+        for i, pending in enumerate(self.pending):
+            mask = pending['TIMESTAMP'] <= watermark
+            if mask.any():
+                ready.append(pending[mask])
+                self.pending[i] = pending[~mask]
+        if not ready:
+            return 0
+
+        # each board's events are already in order, a stable sort merges the runs
+        events = np.concatenate(ready)
+        events = events[np.argsort(events['TIMESTAMP'], kind = 'stable')]
+        self.late    += int(np.count_nonzero(events['TIMESTAMP'] < self.emitted))
+        self.emitted  = max(self.emitted, int(events['TIMESTAMP'][-1]))
+
+        # a block can wrap around the end of the output buffer, so publish in pieces
+        done = 0
+        while done < len(events):
+            rows = self.out.reserve(len(events) - done).data
+            rows[:] = events[done : done + len(rows)]
+            self.out.commit(len(rows))
+            done += len(rows)
+        return len(events)
@@ -0,0 +1,211 @@
+'''
+Event building: groups hits of different channels (and boards) that fall within
+a coincidence window into built events.
+'''
+import logging
+import time
+from threading import Thread, Event
+
+import numpy as np
+
+from core.ringbuffer import RingBuffer, RingReader
+from core.tracker import StageMetrics
+from core import profiling
+
+
+# one row per built event, its hits carry the same EVENT_ID in the hits stream
+BUILT_EVENT_DTYPE = np.dtype([
+    ('EVENT_ID',     np.uint64),
+    ('TIMESTAMP',    np.uint64),   # of the first hit
+    ('SPAN',         np.uint64),   # last hit - first hit
+    ('MULTIPLICITY', np.uint16),   # number of hits, saturating
+])
+
+# bins of the multiplicity histogram, the last one counts every larger multiplicity too
+MULTIPLICITY_BINS = 256
+
+
+def hit_dtype(event_dtype : np.dtype) -> np.dtype:
+    '''
+    The event dtype with the EVENT_ID of the built event each hit belongs to.
+    '''
+    return np.dtype(event_dtype.descr + [('EVENT_ID', np.uint64)])
+
+
+def time_order(timestamps : np.ndarray, sources : np.ndarray) -> np.ndarray:
+    '''
+    Indices sorting hits by timestamp, where the hits of each source are already
+    in time order. A stable sort on the source splits the hits into k sorted runs,
+    which a stable (run merging) sort on the timestamp then merges in O(n log k).
+    '''
+    by_source = np.argsort(sources, kind = 'stable')
+    return by_source[np.argsort(timestamps[by_source], kind = 'stable')]
+
+
+def group_hits(timestamps : np.ndarray, window : int) -> np.ndarray:
+    '''
+    Start index of every group of time ordered hits, a hit joins the group of the
+    previous hit when it is at most window later.
+    '''
+    gaps = np.diff(timestamps.astype(np.int64)) > window
+    return np.concatenate(([0], np.flatnonzero(gaps) + 1))
+
+
+class EventBuilder(Thread):
+    '''
+    Streams hits from its ring buffer reader into built events.
+
+    Hits are held back until every source (board, channel) has reported a later
+    timestamp, so no hit of a group can still be on its way when the group is
+    built. A source silent for idle_timeout seconds no longer holds the others
+    back. Built hits are published in time order with their EVENT_ID to hits,
+    and one row per built event to events. Events with fewer than
+    min_multiplicity hits are counted but their hits are dropped, so they
+    never reach the disk.
+    '''
+
+    def __init__(self,
+                 reader           : RingReader,
+                 hits             : RingBuffer,
+                 events           : RingBuffer,
+                 window           : int,
+                 min_multiplicity : int   = 1,
+                 idle_timeout     : float = 0.5,
+                 metrics          : StageMetrics = None):
+        super().__init__(daemon = True)
+        self.reader           = reader
+        self.hits             = hits
+        self.events           = events
+        self.window           = window
+        self.min_multiplicity = min_multiplicity
+        self.idle_timeout     = idle_timeout
+        self.metrics          = metrics or StageMetrics('event building')
+        self.stop_event       = Event()
+
+        self.pending     = np.empty(0, dtype = reader.ring.data.dtype)
+        # newest timestamp and last activity per source, source = board * 256 + channel
+        self.newest      = np.zeros(256 * 256, dtype = np.uint64)
+        self.last_active = np.full(256 * 256, -np.inf)
+        self.next_id     = 0
+        self.built       = 0
+        self.dropped     = 0
+        self.multiplicity = np.zeros(MULTIPLICITY_BINS, dtype = np.uint64)
+
+    def stop(self):
+        '''
+        Build everything still pending and exit. Does not wait.
+        '''
+        self.stop_event.set()
+
+    def collect(self) -> bool:
+        '''
+        Copy the newly arrived hits into the pending ones and note the newest
+        timestamp of every source. Returns whether any hit arrived.
+        '''
+        new = []
+        while (batch := self.reader.read()) is not None:
+            new.append(batch.events)
+        if not new:
+            return False
+        new = np.concatenate(new)
+        sources = new['BOARD'].astype(np.intp) * 256 + new['CHANNEL']
+        np.maximum.at(self.newest, sources, new['TIMESTAMP'])
+        self.last_active[sources] = time.perf_counter()
+        self.pending = np.concatenate([self.pending, new])
+        return True
+
+    def build(self, flush : bool = False) -> int:
+        '''
+        Build every group of pending hits that can no longer grow (all of them
+        if flush) and publish it. Returns the number of built events.
+        '''
+        if len(self.pending) == 0:
+            return 0
+        pending = self.pending
+        pending = pending[time_order(pending['TIMESTAMP'], pending['BOARD'].astype(np.intp) * 256 + pending['CHANNEL'])]
+        timestamps = pending['TIMESTAMP']
+
+        starts = group_hits(timestamps, self.window)
+        ends   = np.append(starts[1:], len(pending))
+        if not flush:
+            active = self.last_active > time.perf_counter() - self.idle_timeout
+            if not active.any():
+                flush = True
+            else:
+                # a group is complete once every active source is more than a window past it
+                watermark = int(self.newest[active].min())
+                closed = timestamps[ends - 1].astype(np.int64) + self.window < watermark
+                n_closed = int(np.count_nonzero(closed))
+                starts, ends = starts[:n_closed], ends[:n_closed]
+        if len(starts) == 0:
+            self.pending = pending
+            return 0
+
+        n_hits = int(ends[-1])
+        self.pending = pending[n_hits:]
+        pending      = pending[:n_hits]
+
+        multiplicity = ends - starts
+        event_id     = np.arange(self.next_id, self.next_id + len(starts), dtype = np.uint64)
+        self.next_id += len(starts)
+        self.built   += len(starts)
+        np.add.at(self.multiplicity, np.minimum(multiplicity, MULTIPLICITY_BINS - 1), 1)
+
+        keep = multiplicity >= self.min_multiplicity
+        hit_keep = np.repeat(keep, multiplicity)
+        self.dropped += int(np.count_nonzero(~hit_keep))
+
+        events = np.empty(int(np.count_nonzero(keep)), dtype = BUILT_EVENT_DTYPE)
+        events['EVENT_ID']     = event_id[keep]
+        events['TIMESTAMP']    = timestamps[starts[keep]]
+        events['SPAN']         = timestamps[ends[keep] - 1] - timestamps[starts[keep]]
+        events['MULTIPLICITY'] = np.minimum(multiplicity[keep], np.iinfo(np.uint16).max)
+
+        hits = np.empty(int(np.count_nonzero(hit_keep)), dtype = self.hits.data.dtype)
+        for name in pending.dtype.names:
+            hits[name] = pending[name][hit_keep]
+        hits['EVENT_ID'] = np.repeat(event_id, multiplicity)[hit_keep]
+
+        self.publish(self.hits, hits)
+        self.publish(self.events, events)
+        return len(starts)
+
+    @staticmethod
+    def publish(ring : RingBuffer, rows : np.ndarray):
+        '''
+        Write rows to a ring buffer, in pieces where the block wraps.
+        '''
+        done = 0
+        while done < len(rows):
+            block = ring.reserve(len(rows) - done).data
+            block[:] = rows[done : done + len(block)]
+            ring.commit(len(block))
+            done += len(block)
+
+    @profiling.profile_thread('event building')
+    def run(self):
+        logging.info(f"Event builder started (window {self.window}, minimum multiplicity {self.min_multiplicity}).")
+        hits_before = self.hits.written
+        while not self.stop_event.is_set():
+            arrived = False
+            try:
+                t0 = time.perf_counter()
+                arrived = self.collect()
+                if self.build():
+                    self.metrics.record(t0, int(self.hits.written - hits_before))
+                hits_before = self.hits.written
+            except Exception as e:
+                logging.exception(f"Event building failed: {e}")
+            if not arrived:
+                self.stop_event.wait(0.005)
+        try:
+            self.collect()
+            self.build(flush = True)
+        except Exception as e:
+            logging.exception(f"Event building failed: {e}")
+
+        if self.reader.overruns:
+            logging.warning(f"Event builder fell behind, {self.reader.overruns} hits were not built.")
+        counts = {(f'{m}+' if m == MULTIPLICITY_BINS - 1 else m) : int(n) for m, n in enumerate(self.multiplicity) if n}
+        logging.info(f"Event builder exited: {self.built} events built, {self.dropped} hits dropped, "
+                     f"multiplicities {counts}.")
@@ -7,6 +7,9 @@ class CommandType(Enum):
     CONNECT = auto()
     UPDATE = auto()
     CH_DISPLAY = auto()
+    EXIT = auto()
+    RECORD_START = auto()
+    RECORD_STOP = auto()
     
 @dataclass
 class Command:
@@ -1,32 +1,21 @@
 import numpy as np
 import logging
+import os
 import time
+from datetime import datetime
 #from caen_felib import lib, device, error
 from typing import Optional
 
-from PySide6.QtWidgets import (
-    QComboBox,
-    QFrame,
-    QMainWindow,
-    QPushButton,
-    QWidget,
-    QVBoxLayout,
-    QHBoxLayout,
-    QGroupBox,
-    QLabel,
-    QApplication
-)
-
-from PySide6.QtCore import QTimer, QWaitCondition, QMutex, Signal, QThread, QObject
-
-from caen_felib import lib, device, error
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QTimer
 
 from core.io import read_config_file
 from core.logging import setup_logging
 from core.commands import CommandType, Command
+from core import profiling
 from core.worker import AcquisitionWorker
-from core.tracker import Tracker
-from felib.digitiser import Digitiser
+from core.process import WorkerProcess
+from core.ringbuffer import RingBuffer
 from ui import oscilloscope
 
 from threading import Thread, Event, Lock
@@ -35,14 +24,17 @@ from queue import Queue, Empty
 class Controller:
     def __init__(self, 
                  dig_config: Optional[str] = None, 
-                 rec_config: Optional[str] = None):
+                 rec_config: Optional[str] = None,
+                 display_fps: float = 30,
+                 worker_process: bool = False):
         '''
-        Initialise controller for GUI and digitiser
+        Initialise controller for GUI and digitiser.
+        display_fps is the target refresh rate of the display.
+        worker_process runs the acquisition worker in its own process rather than a thread.
         '''
 
-        # Initialise logging and tracking
+        # Initialise logging
         setup_logging()
-        self.tracker = Tracker()
         logging.info("Controller initialising.")
 
         # Digitiser configuration
@@ -51,18 +43,27 @@ class Controller:
 
         # Thread-safe communication channels
         self.cmd_buffer = Queue(maxsize=10)
-        self.display_buffer = Queue(maxsize=1024)
+        self.ring = RingBuffer()
+        self.display_reader = self.ring.reader('display')
+        self.persistence_reader = self.ring.reader('persistence')
+        self.spectrum_reader = self.ring.reader('spectrum')
         self.stop_event = Event()
 
         # Acquisition worker
-        self.worker = AcquisitionWorker(
+        worker_class = WorkerProcess if worker_process else AcquisitionWorker
+        self.worker = worker_class(
             cmd_buffer=self.cmd_buffer,
-            display_buffer=self.display_buffer,
+            ring=self.ring,
             stop_event=self.stop_event,
         )
 
-        # Set the callback to the controller's data_handling method
-        self.worker.data_ready_callback = self.data_handling
+        self.features_reader = self.worker.features.reader('display')
+
+        # metrics of every stage, the display records its own
+        self.metrics = self.worker.metrics
+        self.metrics.watch('events', self.ring)
+        self.metrics.watch('features', self.worker.features)
+        self.display_metrics = self.metrics.stage('display')
 
         # Start thread and log
         self.worker.start()
@@ -72,66 +73,242 @@ class Controller:
         self.app = QApplication([])
         self.main_window = oscilloscope.MainWindow(controller = self)
 
+        # display refresh runs on the GUI thread, decoupled from the worker
+        self.frame_events   = 64   # newest events picked up per frame
+        self.persistence_on     = False
+        self.persistence_events = 512  # newest events added to the persistence view per frame
+        self.spectrum_on    = False
+        self.frames         = 0
+        self.last_fps_check = time.perf_counter()
+        self.refresh_timer  = QTimer()
+        self.refresh_timer.timeout.connect(self.data_handling)
+        self.refresh_timer.start(int(1000 / display_fps))
+
         self.fps_timer  = QTimer()
         self.fps_timer.timeout.connect(self.update_fps)
-        self.spf = 1 # seconds per frame
+        self.fps_timer.start(1000)
 
         self.connect_digitiser()
 
 
+    @profiling.timed('data_handling')
     def data_handling(self):
         '''
-        Visualise data.
+        Visualise data, called by the refresh timer on the GUI thread.
+        Only the newest events in the ring buffer are drawn, everything that
+        arrived since the last frame is counted as skipped by the display reader.
         '''
-        while True:
-            try:
-                # non-blocking read from display queue
-                data = self.display_buffer.get_nowait()
-            except Empty:
-                break
+        t0 = time.perf_counter()
+        self.update_persistence()
+        self.update_spectrum()
 
-            try:
-                wf_size, ADCs = data
+        skipped = self.display_reader.skipped
+        # non-blocking read from the ring buffer
+        data = self.display_reader.latest(self.frame_events)
+        if data is None:
+            return
 
-                # update visuals
-                self.main_window.screen.update_ch(np.arange(0, wf_size, dtype=wf_size.dtype), ADCs)
-                
-                # ping the tracker (make this optional)
-                self.tracker.track(ADCs.nbytes)
+        try:
+            # update visuals with the most recent event of each shown channel
+            with profiling.span('refresh oscilloscope'):
+                self.main_window.screen.update_channels(data)
+            self.frames += 1
 
-            except Exception as e:
-                logging.exception(f"Error updating display: {e}")
+            # everything that arrived since the last frame went through the display
+            n_events = len(data) + self.display_reader.skipped - skipped
+            self.display_metrics.record(t0, n_events, n_events * data.data.dtype.itemsize)
+
+        except Exception as e:
+            logging.exception(f"Error updating display: {e}")
 
 
     def update_fps(self):
         '''
-        Update the FPS label in the GUI
+        Update the FPS label in the GUI with the rendered frames per second,
+        along with the pipeline metrics.
+        '''
+        now = time.perf_counter()
+        fps = self.frames / (now - self.last_fps_check)
+        self.frames = 0
+        self.last_fps_check = now
+        self.main_window.control_panel.stats_box.fps_label.setText(f"FPS: {fps:.2f}")
+        self.main_window.control_panel.stats_box.show_metrics(self.metrics.snapshot())
+        self.update_pulse_stats()
+
+    def update_pulse_stats(self):
+        '''
+        Show the mean pulse features of the events analysed since the last update.
         '''
-        fps = 1 / self.spf
-        self.main_window.stats_box.fps_label.setText(f"FPS: {fps:.2f}")
+        features = self.features_reader.latest(self.features_reader.ring.capacity)
+        if features is None:
+            return
+        events = features.events
+        self.main_window.control_panel.stats_box.pulse_label.setText(
+            f"Amplitude: {events['AMPLITUDE'].mean():.1f} ADC | "
+            f"Rise time: {events['RISE_TIME'].mean():.1f} ns")
 
+    @profiling.timed('refresh persistence')
+    def update_persistence(self):
+        '''
+        Add the waveforms of the shown channels that arrived since the last frame
+        (at most persistence_events of them) to the persistence view.
+        '''
+        if not self.persistence_on:
+            self.persistence_reader.skip()
+            return
+        data = self.persistence_reader.latest(self.persistence_events)
+        screen = self.main_window.persistence
+        if data is not None:
+            shown = np.isin(data.channel, list(self.main_window.screen.shown))
+            screen.histogram.fill(data.waveforms[shown])
+        screen.histogram.apply_decay()
+        screen.refresh()
+
+    def configure_persistence(self):
+        '''
+        Set up the persistence histogram from the recording config:
+            persistence_bins  (time bins, ADC bins)
+            persistence_range (min, max) ADCs
+            persistence_decay decay time in seconds, 0 to accumulate forever
+        '''
+        rec_dict  = (read_config_file(self.rec_config) if self.rec_config else None) or {}
+        histogram = self.main_window.persistence.histogram
+        histogram.time_bins, histogram.adc_bins = rec_dict.get('persistence_bins', (512, 256))
+        histogram.adc_range = rec_dict.get('persistence_range', (0, 16384))
+        histogram.decay     = float(rec_dict.get('persistence_decay', 0))
+        histogram.length    = 0  # rebinned on the next fill
+
+    def set_persistence(self, enabled):
+        '''
+        Show or hide the persistence view.
+        '''
+        self.persistence_on = enabled
+        self.main_window.persistence.setVisible(enabled)
+        if enabled:
+            self.persistence_reader.skip()
+            self.main_window.persistence.histogram.reset()
+
+    def reset_persistence(self):
+        self.main_window.persistence.histogram.reset()
+
+    @profiling.timed('refresh spectrum')
+    def update_spectrum(self):
+        '''
+        Add every event that arrived since the last frame to the energy spectrum,
+        whether or not it is shown, and redraw it if shown.
+        '''
+        spectrum = self.main_window.spectrum
+        while (data := self.spectrum_reader.read()) is not None:
+            spectrum.spectrum.fill(data.board, data.channel, data.energy)
+        if self.spectrum_on:
+            spectrum.refresh(self.main_window.screen.shown)
+
+    def configure_spectrum(self):
+        '''
+        Set up the energy spectrum from the recording config:
+            spectrum_bins  number of bins per channel
+            spectrum_range (min, max) energy
+        '''
+        rec_dict = (read_config_file(self.rec_config) if self.rec_config else None) or {}
+        n_boards = len(self.dig_config) if isinstance(self.dig_config, (list, tuple)) else 1
+        self.main_window.spectrum.spectrum.configure(bins         = rec_dict.get('spectrum_bins', 4096),
+                                                     energy_range = rec_dict.get('spectrum_range', (0, 65536)),
+                                                     n_boards     = n_boards)
+        self.spectrum_reader.skip()
+
+    def set_spectrum(self, enabled):
+        '''
+        Show or hide the energy spectrum, it keeps accumulating while hidden.
+        '''
+        self.spectrum_on = enabled
+        self.main_window.spectrum.setVisible(enabled)
+
+    def reset_spectrum(self):
+        self.main_window.spectrum.spectrum.reset()
+
+    def save_spectrum(self):
+        '''
+        Save the energy spectrum as CSV in the output directory of the recording config.
+        '''
+        rec_dict   = (read_config_file(self.rec_config) if self.rec_config else None) or {}
+        output_dir = rec_dict.get('output_dir', os.path.join(os.environ.get('CARP_DIR', '.'), 'data'))
+        os.makedirs(output_dir, exist_ok = True)
+        path = os.path.join(output_dir, f"spectrum_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        try:
+            self.main_window.spectrum.spectrum.save(path)
+            logging.info(f"Energy spectrum saved to {path}.")
+        except Exception as e:
+            logging.exception(f"Saving the energy spectrum failed: {e}")
+
+    def set_display_channels(self):
+        '''
+        Show a curve and a toggle for every enabled channel in the recording config.
+        '''
+        rec_dict = read_config_file(self.rec_config) if self.rec_config else None
+        channels = [int(key[2:]) for key, value in (rec_dict or {}).items()
+                    if key.startswith('ch') and key[2:].isdigit() and value.get('enabled')]
+
+        screen = self.main_window.screen
+        for ch in list(screen.shown):
+            screen.set_channel_visible(ch, False)
+        for ch in channels:
+            screen.set_channel_visible(ch, True)
+        self.main_window.control_panel.channel_display.set_channels(channels)
+
+    def set_channel_display(self, ch, visible):
+        '''
+        Called by the channel toggles.
+        '''
+        self.display_command(Command(CommandType.CH_DISPLAY, (ch, visible)))
+
+    def display_command(self, cmd: Command):
+        '''
+        Handles the display commands, which act on the GUI thread rather than the worker:
+            - CH_DISPLAY (ch, visible)
+        '''
+        match cmd.type:
+            case CommandType.CH_DISPLAY:
+                self.main_window.screen.set_channel_visible(*cmd.args)
+            case _:
+                logging.warning(f"Unknown display command: {cmd.type}")
+
+    @profiling.profile_thread('gui')
     def run_app(self):
+        '''
+        Run the GUI until its window is closed, then stop the worker.
+        '''
         self.main_window.show()
-        return self.app.exec()
+        result = self.app.exec()
+        self.shutdown()
+        return result
     
     def connect_digitiser(self):
         '''
-        Connect to the digitiser using the provided configuration file.
-        This is a placeholder function and should be replaced with actual
-        digitiser connection logic.
-
-        Need to allow for changing config files after initial application launch.
+        Connect to the digitiser (simulated if dig_name is 'debug') using the
+        selected config files. The worker connects and configures the boards;
+        later config changes are applied with update_config.
         '''
-
-        # Load in new configs
-        # self.dig_dict = some other dig_config
-        # self.rec_dict = some other rec_config
-
         self.cmd_buffer.put(Command(CommandType.CONNECT, (self.dig_config, self.rec_config)))
+        self.configure_display()
 
+    def update_config(self):
+        '''
+        Apply the selected config files to the connected digitiser, writing only
+        the parameters that changed instead of reconnecting.
+        '''
+        self.cmd_buffer.put(Command(CommandType.UPDATE, (self.dig_config, self.rec_config)))
+        self.configure_display()
+
+    def configure_display(self):
+        '''
+        Set the display up for the current recording config.
+        '''
         # Only add to the main window if it exists
         if hasattr(self, 'main_window'):
             self.main_window.control_panel.acquisition.update()
+            self.set_display_channels()
+            self.configure_persistence()
+            self.configure_spectrum()
 
 
     def start_acquisition(self):
@@ -148,6 +325,20 @@ class Controller:
         logging.info("Stopping acquisition.")
         self.cmd_buffer.put(Command(CommandType.STOP))
 
+    def start_recording(self):
+        '''
+        Start recording to disk (starts acquisition if needed).
+        '''
+        logging.info("Starting recording.")
+        self.cmd_buffer.put(Command(CommandType.RECORD_START))
+
+    def stop_recording(self):
+        '''
+        Stop recording to disk, acquisition keeps running.
+        '''
+        logging.info("Stopping recording.")
+        self.cmd_buffer.put(Command(CommandType.RECORD_STOP))
+
     def shutdown(self):
         '''
         Carefully shut down acquisition and worker thread.
@@ -157,6 +348,8 @@ class Controller:
         self.stop_event.set()
         self.worker.join(timeout=2)
         if self.worker.is_alive():
-            logging.warning("AcquisitionWorker did not stop cleanly.")
-        else:
-            logging.info("Controller shutdown complete.")
+            # the worker exits once the recorders have closed the run files, which
+            # a busy recording may take a while to do, never cut it short
+            logging.info("Waiting for the run files to be closed.")
+            self.worker.join()
+        logging.info("Controller shutdown complete.")
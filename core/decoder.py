@@ -0,0 +1,135 @@
+'''
+Decoding stage for RAW readout: turns undecoded board buffers into events, on
+a pool of worker threads while acquiring, or offline from a buffer file.
+'''
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
+
+import felib.dig1 as dig1
+import felib.dig2 as dig2
+from core.rawfile import read_buffers
+from core.ringbuffer import RingBuffer, RingReader
+from core.tracker import StageMetrics
+from core import profiling
+from felib.batch import EventBatch
+
+
+def decoder(dig_gen : int):
+    '''
+    Decoding function for the RAW buffers of the given digitiser generation.
+    '''
+    return dig2.decode if int(dig_gen) == 2 else dig1.decode
+
+
+class DecodeStage(Thread):
+    '''
+    Decodes the buffers of its ring buffer reader, several at once on a pool of
+    worker threads, and publishes their events in readout order to the event
+    ring buffer that display, analysis and recording read.
+    '''
+
+    def __init__(self,
+                 reader        : RingReader,
+                 ring          : RingBuffer,
+                 decode,
+                 record_length : int,
+                 n_workers     : int = 2,
+                 metrics       : StageMetrics = None):
+        super().__init__(daemon = True)
+        self.reader        = reader
+        self.ring          = ring
+        self.decode        = decode
+        self.record_length = record_length
+        self.n_workers     = n_workers
+        self.metrics       = metrics or StageMetrics('decoding')
+        self.stop_event    = Event()
+        self.n_buffers     = 0
+        self.n_events      = 0
+
+    def stop(self):
+        '''
+        Decode everything pending and exit. Does not wait.
+        '''
+        self.stop_event.set()
+
+    def process(self, batch):
+        '''
+        Decode a batch of buffers in parallel and publish their events.
+        '''
+        t0 = time.perf_counter()
+        n_events = self.n_events
+        buffers = batch.events
+        jobs = [self.pool.submit(self.decode, row['DATA'][:row['SIZE']], self.record_length) for row in buffers]
+        for job, board in zip(jobs, buffers['BOARD']):
+            events = job.result()
+            events['BOARD'] = board
+
+            # a block can wrap around the end of the event buffer, so publish in pieces
+            done = 0
+            while done < len(events):
+                rows = self.ring.reserve(len(events) - done).data
+                rows[:] = events[done : done + len(rows)]
+                self.ring.commit(len(rows))
+                done += len(rows)
+            self.n_events += len(events)
+        self.n_buffers += len(batch)
+        self.metrics.record(t0, self.n_events - n_events, int(buffers['SIZE'].sum()))
+
+    @profiling.profile_thread('decoding')
+    def run(self):
+        logging.info(f"Decoding stage started with {self.n_workers} workers.")
+        with ThreadPoolExecutor(max_workers = self.n_workers) as self.pool:
+            while True:
+                batch = self.reader.read(self.n_workers)
+                if batch is None:
+                    if self.stop_event.is_set():
+                        break
+                    self.stop_event.wait(0.005)
+                    continue
+                try:
+                    self.process(batch)
+                except Exception as e:
+                    logging.exception(f"Decoding failed: {e}")
+
+        if self.reader.overruns:
+            logging.warning(f"Decoding fell behind, {self.reader.overruns} buffers were not decoded.")
+        logging.info(f"Decoding stage exited: {self.n_buffers} buffers, {self.n_events} events decoded.")
+
+
+def decode_file(path : str, writer, n_workers : int = 4) -> int:
+    '''
+    Decode a buffer file (see core.rawfile.BufferWriter) into writer (an H5Writer
+    or RawWriter of formats.event_dtype), decoding n_workers buffers at once.
+    Returns the number of events decoded.
+    '''
+    buffers, metadata = read_buffers(path)
+    decode = decoder(metadata.get('dig_gen', 1))
+    reclen = int(metadata['reclen'])
+
+    n_events = 0
+    with ThreadPoolExecutor(max_workers = n_workers) as pool:
+        pending = []
+        for board, n, data in buffers:
+            pending.append((board, pool.submit(decode, data, reclen)))
+            if len(pending) < n_workers:
+                continue
+            n_events += write_decoded(writer, pending)
+            pending = []
+        n_events += write_decoded(writer, pending)
+    return n_events
+
+
+def write_decoded(writer, pending : list) -> int:
+    '''
+    Write the events of decoding jobs, in order, tagged with their board.
+    '''
+    n_events = 0
+    for board, job in pending:
+        events = job.result()
+        events['BOARD'] = board
+        if len(events):
+            writer.write(EventBatch(events, len(events)))
+        n_events += len(events)
+    return n_events
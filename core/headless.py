@@ -0,0 +1,149 @@
+'''
+Headless data acquisition for unattended runs: connect, configure, acquire and
+record for a duration or number of events, without Qt or pyqtgraph loaded.
+'''
+import logging
+import signal
+import sys
+import time
+from queue import Queue
+from threading import Event
+from typing import Optional
+
+from core.commands import Command, CommandType
+from core.logging import setup_logging
+from core.ringbuffer import RingBuffer
+from core.worker import AcquisitionWorker
+
+
+# seconds between progress updates, and between progress lines when not on a terminal
+PROGRESS_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10.0
+
+
+class HeadlessRun:
+    '''
+    Runs the acquisition worker without a GUI until the duration has passed,
+    n_events events were read out, or SIGINT/SIGTERM arrives. The signal
+    handlers only set an event, the run is stopped (recorders flushed and files
+    closed) from the main thread. A second signal exits immediately.
+    '''
+
+    def __init__(self,
+                 dig_config,
+                 rec_config  : str,
+                 duration    : Optional[float] = None,
+                 n_events    : Optional[int]   = None,
+                 record      : bool            = True,
+                 connect_timeout : float       = 30.0):
+        self.dig_config  = dig_config
+        self.rec_config  = rec_config
+        self.duration    = duration
+        self.n_events    = n_events
+        self.record      = record
+        self.connect_timeout = connect_timeout
+
+        self.cmd_buffer = Queue()
+        self.ring       = RingBuffer()
+        self.stop_event = Event()
+        self.interrupt  = Event()
+        self.worker     = AcquisitionWorker(cmd_buffer = self.cmd_buffer, ring = self.ring, stop_event = self.stop_event)
+        self.tty        = sys.stderr.isatty()
+
+    def handle_signal(self, signum, frame):
+        if self.interrupt.is_set():
+            # a second signal: give up on a clean stop
+            raise SystemExit(1)
+        self.interrupt.set()
+
+    def send(self, cmd_type : CommandType, *args):
+        self.cmd_buffer.put(Command(cmd_type, args))
+
+    def connect(self) -> bool:
+        '''
+        Connect and configure the digitiser(s), waiting until the ring buffer is allocated.
+        '''
+        self.send(CommandType.CONNECT, self.dig_config, self.rec_config)
+        deadline = time.perf_counter() + self.connect_timeout
+        while self.ring.data is None:
+            if self.interrupt.is_set() or time.perf_counter() > deadline or not self.worker.is_alive():
+                return False
+            time.sleep(0.05)
+        return self.worker.digitiser is not None and self.worker.digitiser.isConnected
+
+    def done(self, elapsed : float, events : int) -> bool:
+        if self.interrupt.is_set():
+            logging.info("Interrupted, stopping the run.")
+            return True
+        if self.duration is not None and elapsed >= self.duration:
+            return True
+        return self.n_events is not None and events >= self.n_events
+
+    def progress(self, elapsed : float, events : int) -> str:
+        '''
+        One line summary of the run so far.
+        '''
+        snapshot = self.worker.metrics.snapshot()
+        readout  = snapshot['stages'].get('readout', {})
+        drops    = sum(queue['drops'] for queue in snapshot['queues'].values())
+        fill     = max((queue['fill'] for queue in snapshot['queues'].values()), default = 0)
+        target   = ''
+        if self.duration is not None:
+            target = f' / {self.duration:.0f} s'
+        elif self.n_events is not None:
+            target = f' ({events / self.n_events:.0%})'
+        return (f"{elapsed:8.1f} s{target} | {events:>12} events | {readout.get('rate', 0):>10.0f} ev/s | "
+                f"{readout.get('MB_per_s', 0):>7.1f} MB/s | {drops} dropped | queues {fill:.0%} full")
+
+    def run(self) -> int:
+        '''
+        Run to completion, returns the exit code.
+        '''
+        handlers = {signum : signal.signal(signum, self.handle_signal) for signum in (signal.SIGINT, signal.SIGTERM)}
+        self.worker.start()
+        try:
+            if not self.connect():
+                logging.error("Digitiser connection failed, nothing recorded.")
+                return 1
+
+            start_events = self.worker.readout_metrics.events
+            self.send(CommandType.RECORD_START if self.record else CommandType.START)
+            t0 = time.perf_counter()
+            last_log = t0
+            while True:
+                elapsed = time.perf_counter() - t0
+                events  = self.worker.readout_metrics.events - start_events
+                line    = self.progress(elapsed, events)
+                if self.tty:
+                    sys.stderr.write(f'\r{line}')
+                    sys.stderr.flush()
+                elif time.perf_counter() - last_log >= PROGRESS_LOG_INTERVAL:
+                    logging.info(line)
+                    last_log = time.perf_counter()
+                if self.done(elapsed, events) or not self.worker.is_alive():
+                    break
+                self.interrupt.wait(PROGRESS_INTERVAL)
+            if self.tty:
+                sys.stderr.write('\n')
+            logging.info(f"Run finished: {line}")
+            return 0
+        finally:
+            # STOP writes what is pending and closes the run files
+            self.send(CommandType.STOP)
+            self.send(CommandType.EXIT)
+            self.worker.join(timeout = 30)
+            if self.worker.is_alive():
+                # still closing the run files, never cut that short
+                logging.info("Waiting for the run files to be closed.")
+                self.worker.join()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+
+def run_headless(dig_config, rec_config : str, duration : Optional[float] = None,
+                 n_events : Optional[int] = None, record : bool = True) -> int:
+    '''
+    Set up logging and run headless, returns the exit code.
+    '''
+    setup_logging()
+    return HeadlessRun(dig_config, rec_config, duration = duration, n_events = n_events, record = record).run()
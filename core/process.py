@@ -0,0 +1,156 @@
+'''
+Runs the AcquisitionWorker in its own process, so the GUI can stall without
+the readout losing triggers.
+
+Commands go to the worker process over a pipe, events and features come back
+through shared memory ring buffers, and log records (errors included) are
+forwarded to the main process' handlers through a queue. Metrics snapshots of
+the worker's stages are sent back every METRICS_INTERVAL seconds.
+'''
+import logging
+import multiprocessing as mp
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+
+from core.ringbuffer import RingBuffer
+from core.tracker import Metrics
+from core import profiling
+
+
+# seconds between metrics snapshots sent by the worker process
+METRICS_INTERVAL = 1.0
+
+
+class PipeCommandBuffer:
+    '''
+    The worker process' end of the command pipe, with the get interface of a Queue.
+    '''
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, timeout : float = None):
+        if self.conn.poll(timeout):
+            return self.conn.recv()
+        raise Empty
+
+    def get_nowait(self):
+        return self.get(0)
+
+
+def run_worker_process(conn, log_queue, stop_event):
+    '''
+    Entry point of the worker process. Runs the acquisition hot loop until EXIT.
+    '''
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(logging.DEBUG)
+
+    # imported here so the GUI process doesn't need to for this module
+    from core.worker import AcquisitionWorker
+
+    # notices are sent from the worker and the metrics thread
+    send_lock = Lock()
+    def send(notice):
+        with send_lock:
+            conn.send(notice)
+
+    ring = RingBuffer(shared = True)
+    ring.on_allocate = lambda layout: send(('events', layout))
+    worker = AcquisitionWorker(cmd_buffer = PipeCommandBuffer(conn), ring = ring, stop_event = stop_event)
+    worker.features = RingBuffer(shared = True)
+    worker.features.on_allocate = lambda layout: send(('features', layout))
+
+    def send_metrics():
+        while not stop_event.wait(METRICS_INTERVAL):
+            try:
+                send(('metrics', worker.metrics.snapshot()))
+            except (OSError, ValueError):
+                break
+    Thread(target = send_metrics, daemon = True).start()
+
+    try:
+        worker.run()
+    except Exception as e:
+        logging.exception(f"Worker process failed: {e}")
+    finally:
+        # atexit doesn't run in multiprocessing children
+        profiling.write_report()
+        ring.release()
+        worker.features.release()
+        conn.close()
+
+
+class WorkerProcess(Thread):
+    '''
+    Drop-in replacement of AcquisitionWorker that runs it in a separate process.
+
+    This thread stays in the main process: it forwards the commands put in
+    cmd_buffer to the worker process and attaches ring and features to the
+    shared memory the worker process allocates, so the controller reads them
+    exactly as with the threaded worker.
+    '''
+
+    def __init__(self, cmd_buffer: Queue, ring: RingBuffer, stop_event: Event):
+        super().__init__(daemon=True)
+        self.cmd_buffer = cmd_buffer
+        self.ring = ring
+        self.features = RingBuffer()
+        self.metrics = Metrics()
+        self.stop_event = stop_event
+
+        # spawn, forking a process with Qt running is not safe
+        ctx = mp.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.log_queue = ctx.Queue()
+        self.process_stop = ctx.Event()
+        self.process = ctx.Process(target = run_worker_process,
+                                   args   = (child_conn, self.log_queue, self.process_stop),
+                                   name   = 'AcquisitionWorker',
+                                   daemon = True)
+        self.log_listener = QueueListener(self.log_queue, *logging.getLogger().handlers)
+
+    def handle_notice(self, notice):
+        '''
+        Messages from the worker process: the layout of a newly allocated ring
+        buffer, or a snapshot of its metrics.
+        '''
+        name, layout = notice
+        match name:
+            case 'events':
+                self.ring.attach(layout)
+            case 'features':
+                self.features.attach(layout)
+            case 'metrics':
+                self.metrics.update_remote(layout)
+            case _:
+                logging.warning(f"Unknown notice from the worker process: {name}")
+
+    def run(self):
+        self.log_listener.start()
+        self.process.start()
+        logging.info(f"AcquisitionWorker process started (pid {self.process.pid}).")
+        try:
+            while self.process.is_alive():
+                if self.stop_event.is_set():
+                    self.process_stop.set()
+                try:
+                    self.conn.send(self.cmd_buffer.get(timeout=0.01))
+                except Empty:
+                    pass
+                while self.conn.poll():
+                    self.handle_notice(self.conn.recv())
+        except (EOFError, OSError) as e:
+            # the pipe closes when the worker process exits, only an error if unexpected
+            if not self.stop_event.is_set():
+                logging.error(f"Lost the connection to the worker process: {e}")
+        except Exception as e:
+            logging.exception(f"Worker process communication failed: {e}")
+
+        # the worker process exits once its recorders have closed the run files
+        self.process.join()
+        if self.process.exitcode:
+            logging.error(f"AcquisitionWorker process exited with code {self.process.exitcode}.")
+        self.ring.release()
+        self.features.release()
+        self.log_listener.stop()
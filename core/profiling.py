@@ -0,0 +1,185 @@
+'''
+Opt-in profiling of the acquisition and display threads.
+
+Profiling is enabled by setting CARP_PROFILE to a report directory before CARP
+is imported (bin/carp --profile does this), so a worker process started later
+inherits it. CARP_PROFILE_MODE selects how threads are profiled:
+    cprofile : a cProfile per profiled thread (default)
+    sample   : the stacks of all threads are sampled every CARP_PROFILE_INTERVAL seconds
+
+Code registers itself through:
+    @profile_thread('name')  the thread entry point (e.g. run) to profile as a whole
+    @timed('name')           a function whose calls are timed as a span
+    with span('name'):       a block timed as a span
+
+With profiling disabled the decorators return the function untouched and span()
+returns a shared no-op context, so the cost is close to zero.
+
+The report (report_<process>.txt, plus a .prof file per cProfiled thread for
+pstats/snakeviz) is written at shutdown, or by calling write_report().
+'''
+import atexit
+import cProfile
+import functools
+import io
+import logging
+import multiprocessing as mp
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from core.tracker import LatencyHistogram
+
+
+REPORT_DIR = os.environ.get('CARP_PROFILE')
+ENABLED    = bool(REPORT_DIR)
+MODE       = os.environ.get('CARP_PROFILE_MODE', 'cprofile')
+INTERVAL   = float(os.environ.get('CARP_PROFILE_INTERVAL', 0.005))
+TOP        = 25     # functions listed per thread in the report
+
+NULL_SPAN = nullcontext()
+
+spans    = {}   # (thread, span) -> [LatencyHistogram, total seconds]
+profiles = {}   # (profile, thread) -> pstats.Stats
+samples  = {}   # thread -> Counter of sampled stacks
+sampler  = None
+
+
+class Span:
+    '''
+    Times a block and adds it to the span statistics of the current thread.
+    '''
+    __slots__ = ('key', 't0')
+
+    def __init__(self, name : str):
+        self.key = (threading.current_thread().name, name)
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        stats = spans.setdefault(self.key, [LatencyHistogram(), 0.0])
+        stats[0].record(elapsed)
+        stats[1] += elapsed
+        return False
+
+
+def span(name : str):
+    '''
+    Context manager timing a block as the span name, a no-op when disabled.
+    '''
+    return Span(name) if ENABLED else NULL_SPAN
+
+
+def timed(name : str):
+    '''
+    Decorator timing every call of a function as the span name.
+    '''
+    def decorate(func):
+        if not ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profile_thread(name : str):
+    '''
+    Decorator profiling the thread that runs a function (e.g. Thread.run) for
+    as long as it runs, with cProfile unless sampling.
+    '''
+    def decorate(func):
+        if not ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if MODE == 'sample':
+                start_sampler()
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                stats = pstats.Stats(profile)
+                key = (name, threading.current_thread().name)
+                if key in profiles:
+                    profiles[key].add(stats)
+                else:
+                    profiles[key] = stats
+        return wrapper
+    return decorate
+
+
+def start_sampler():
+    '''
+    Start sampling the stacks of every thread, once per process.
+    '''
+    global sampler
+    if sampler is not None:
+        return
+    sampler = threading.Thread(target = sample, name = 'profiler', daemon = True)
+    sampler.start()
+
+
+def sample():
+    own = threading.get_ident()
+    while True:
+        names = {thread.ident : thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < 8:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            samples.setdefault(names.get(ident, str(ident)), Counter())[tuple(stack)] += 1
+        time.sleep(INTERVAL)
+
+
+def write_report():
+    '''
+    Write the span statistics and the profile of every thread to REPORT_DIR.
+    '''
+    if not ENABLED:
+        return
+    os.makedirs(REPORT_DIR, exist_ok = True)
+    process = mp.current_process().name
+    path = os.path.join(REPORT_DIR, f'report_{process}.txt')
+    with open(path, 'w') as f:
+        f.write(f'CARP profile of {process} (pid {os.getpid()}, mode {MODE})\n\n')
+
+        f.write('Spans (ms)\n')
+        f.write(f"{'thread':<24} {'span':<24} {'calls':>9} {'total':>10} {'mean':>8} {'p50':>8} {'p99':>8} {'max':>8}\n")
+        for (thread, name), (histogram, total) in sorted(spans.items(), key = lambda item: -item[1][1]):
+            s = histogram.summary()
+            f.write(f"{thread:<24} {name:<24} {s['n']:>9} {total * 1e3:>10.1f} {s['mean']:>8.3f} "
+                    f"{s['p50']:>8.3f} {s['p99']:>8.3f} {s['max']:>8.3f}\n")
+
+        for (name, thread), stats in profiles.items():
+            f.write(f'\n\nThread {name} ({thread}), top {TOP} by cumulative time\n')
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(TOP)
+            f.write(stream.getvalue())
+            stats.dump_stats(os.path.join(REPORT_DIR, f"{process}_{name}_{thread}.prof".replace(' ', '_')))
+
+        for thread, counter in samples.items():
+            total = sum(counter.values())
+            f.write(f'\n\nThread {thread}, {total} samples, top {TOP} stacks\n')
+            for stack, count in counter.most_common(TOP):
+                f.write(f'{count / total:>7.1%}  ' + ' <- '.join(stack) + '\n')
+    logging.info(f"Profile written to {path}.")
+
+
+if ENABLED:
+    atexit.register(write_report)
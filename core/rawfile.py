@@ -0,0 +1,184 @@
+'''
+Minimal append-only raw run format for the highest rate runs.
+
+Layout:
+    fixed HEADER_SIZE byte header
+        magic (8 bytes) | version (u32) | header size (u32) | record size (u32) |
+        number of events (u64, filled in on close) | JSON length (u32) | JSON
+        the JSON holds the record fields (name, type, shape) and the run metadata
+    fixed-size records, each one event of formats.event_dtype, back to back
+
+Buffer files (RAW readout recorded undecoded) share the header, with their own
+magic and a record size of 0, followed by variable size records:
+    board (u8) | number of events (u32) | size in bytes (u64) | the board's RAW buffer
+they are decoded offline with bin/carp-decode.
+'''
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC       = b'CARPRAW\0'
+BUFFER_MAGIC = b'CARPBUF\0'
+VERSION     = 1
+HEADER_SIZE = 4096
+HEADER_FMT  = '<8sIIIQI'    # magic, version, header size, record size, n_events, JSON length
+N_EVENTS_OFFSET = struct.calcsize('<8sIII')
+BUFFER_FMT  = '<BIQ'        # board, n_events, size
+
+
+class RawWriter:
+    '''
+    Appends event batches as raw fixed-size records through a large write buffer,
+    so the disk sees few, large, sequential writes.
+    '''
+
+    def __init__(self, 
+                 path         : str,
+                 dtype        : np.dtype,
+                 metadata     : dict,
+                 buffer_bytes : int = 16 * 1024 * 1024):
+        self.path     = path
+        self.dtype    = dtype
+        self.n_events = 0
+
+        fields = [[name, dtype[name].base.str, list(dtype[name].shape)] for name in dtype.names]
+        info = json.dumps({'fields'   : fields,
+                           'metadata' : metadata}, default = str).encode()
+        header = struct.pack(HEADER_FMT, MAGIC, VERSION, HEADER_SIZE, dtype.itemsize, 0, len(info)) + info
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"Raw file header too large ({len(header)} > {HEADER_SIZE} bytes).")
+
+        self.file = open(path, 'wb', buffering = buffer_bytes)
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+        logging.info(f"Recording raw records of {dtype.itemsize} bytes to {path}.")
+
+    def write(self, batch):
+        '''
+        Append a batch of events (written straight from the batch memory).
+        '''
+        self.file.write(np.ascontiguousarray(batch.events).view(np.uint8))
+        self.n_events += len(batch)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        # record the number of events in the header, readers fall back on the file size
+        self.file.seek(N_EVENTS_OFFSET)
+        self.file.write(struct.pack('<Q', self.n_events))
+        self.file.close()
+        logging.info(f"Closed {self.path} with {self.n_events} events.")
+
+
+class BufferWriter:
+    '''
+    Appends undecoded RAW buffers (rows of formats.raw_buffer_dtype) as they came
+    from the boards, only their valid bytes are written.
+    '''
+
+    def __init__(self,
+                 path         : str,
+                 metadata     : dict,
+                 buffer_bytes : int = 16 * 1024 * 1024):
+        self.path     = path
+        self.n_events = 0
+        self.n_buffers = 0
+
+        info = json.dumps({'metadata' : metadata}, default = str).encode()
+        header = struct.pack(HEADER_FMT, BUFFER_MAGIC, VERSION, HEADER_SIZE, 0, 0, len(info)) + info
+        if len(header) > HEADER_SIZE:
+            raise ValueError(f"Buffer file header too large ({len(header)} > {HEADER_SIZE} bytes).")
+
+        self.file = open(path, 'wb', buffering = buffer_bytes)
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+        logging.info(f"Recording undecoded buffers to {path}.")
+
+    def write(self, batch):
+        '''
+        Append a batch of buffers.
+        '''
+        for row in batch.events:
+            size = int(row['SIZE'])
+            self.file.write(struct.pack(BUFFER_FMT, row['BOARD'], row['N_EVENTS'], size))
+            self.file.write(row['DATA'][:size])
+            self.n_events += int(row['N_EVENTS'])
+        self.n_buffers += len(batch)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.seek(N_EVENTS_OFFSET)
+        self.file.write(struct.pack('<Q', self.n_events))
+        self.file.close()
+        logging.info(f"Closed {self.path} with {self.n_buffers} buffers ({self.n_events} events).")
+
+
+def read_buffers(path : str):
+    '''
+    Iterate over the buffers of a buffer file, yielding (board, n_events, data)
+    with data a uint8 array. A trailing partial buffer (from a run that didn't
+    close cleanly) is ignored.
+
+    Returns the generator and the run metadata.
+    '''
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+    magic, version, header_size, record_size, n_events, info_len = struct.unpack_from(HEADER_FMT, head)
+    if magic != BUFFER_MAGIC:
+        raise ValueError(f"{path} is not a CARP buffer file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported buffer file version {version} in {path}.")
+    metadata = json.loads(head[struct.calcsize(HEADER_FMT) : struct.calcsize(HEADER_FMT) + info_len])['metadata']
+
+    def buffers():
+        with open(path, 'rb') as f:
+            f.seek(HEADER_SIZE)
+            while len(head := f.read(struct.calcsize(BUFFER_FMT))) == struct.calcsize(BUFFER_FMT):
+                board, n, size = struct.unpack(BUFFER_FMT, head)
+                data = f.read(size)
+                if len(data) < size:
+                    break
+                yield board, n, np.frombuffer(data, dtype = np.uint8)
+
+    return buffers(), metadata
+
+
+def read_raw_header(path : str):
+    '''
+    Read the header of a raw run file.
+    Returns the record dtype and the run metadata.
+    '''
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+    magic, version, header_size, record_size, n_events, info_len = struct.unpack_from(HEADER_FMT, head)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a CARP raw file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported raw file version {version} in {path}.")
+
+    info  = json.loads(head[struct.calcsize(HEADER_FMT) : struct.calcsize(HEADER_FMT) + info_len])
+    dtype = np.dtype([(name, base, tuple(shape)) for name, base, shape in info['fields']])
+    if dtype.itemsize != record_size:
+        raise ValueError(f"Record size mismatch in {path}: {dtype.itemsize} != {record_size}.")
+    return dtype, info['metadata']
+
+
+def read_raw(path : str, mode : str = 'r'):
+    '''
+    Open a raw run file as a numpy.memmap structured array, nothing is loaded into memory
+    until it is accessed. The number of events comes from the file size, so files from
+    runs that didn't close cleanly can still be read (a trailing partial record is ignored).
+
+    Returns the memmap of events and the run metadata.
+    '''
+    dtype, metadata = read_raw_header(path)
+    n_events = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if n_events == 0:
+        return np.zeros(0, dtype = dtype), metadata
+    return np.memmap(path, dtype = dtype, mode = mode, offset = HEADER_SIZE, shape = (n_events,)), metadata
+
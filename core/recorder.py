@@ -0,0 +1,175 @@
+'''
+Recording stage: writes events from the ring buffer to disk on its own thread.
+'''
+import logging
+import os
+import time
+from datetime import datetime
+from threading import Thread, Event
+
+import numpy as np
+
+from core.ringbuffer import RingReader
+from felib.batch import EventBatch
+from core.tracker import StageMetrics
+from core import profiling
+
+
+# dataset name for each event field, other fields (e.g. pulse features) use their lower case name
+H5_DATASETS = {
+    'BOARD'          : 'board',
+    'CHANNEL'        : 'channel',
+    'TIMESTAMP'      : 'timestamps',
+    'ENERGY'         : 'energy',
+    'WAVEFORM_SIZE'  : 'waveform_size',
+    'ANALOG_PROBE_1' : 'waveforms',
+}
+
+
+def run_file_name(output_dir : str, extension : str) -> str:
+    '''
+    Unique file name for a run based on the current date and time.
+    '''
+    os.makedirs(output_dir, exist_ok = True)
+    return os.path.join(output_dir, f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+
+class H5Writer:
+    '''
+    Appends event batches to chunked, extendable HDF5 datasets (one per field).
+
+    Chunks hold chunk_bytes worth of events so that every append is a few large
+    sequential writes. Compression is off by default to sustain the highest MB/s,
+    any PyTables compression library (e.g. 'blosc2:lz4') can be given instead.
+    '''
+
+    def __init__(self, 
+                 path        : str,
+                 dtype       : np.dtype,
+                 metadata    : dict,
+                 chunk_bytes : int = 4 * 1024 * 1024,
+                 compression : str = None,
+                 complevel   : int = 1):
+        # PyTables is only loaded once a run is recorded to HDF5
+        import tables as tb
+
+        self.path = path
+        self.n_events = 0
+        self.file = tb.open_file(path, mode = 'w', title = 'CARP run')
+
+        filters = tb.Filters(complevel = complevel, complib = compression) if compression else None
+        chunk_events = max(1, chunk_bytes // dtype.itemsize)
+
+        self.datasets = {}
+        for field in dtype.names:
+            ds_name = H5_DATASETS.get(field, field.lower())
+            base, shape = dtype[field].base, dtype[field].shape
+            self.datasets[field] = self.file.create_earray(self.file.root, ds_name,
+                                                           atom       = tb.Atom.from_dtype(base),
+                                                           shape      = (0, *shape),
+                                                           chunkshape = (chunk_events, *shape),
+                                                           filters    = filters)
+
+        for key, value in metadata.items():
+            self.file.root._v_attrs[key] = value if isinstance(value, (int, float, str)) else str(value)
+
+        logging.info(f"Recording to {path} ({chunk_events} events per chunk).")
+
+    def write(self, batch):
+        '''
+        Append a batch of events.
+        '''
+        events = batch.events
+        for field, dataset in self.datasets.items():
+            dataset.append(events[field])
+        self.n_events += len(batch)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.root._v_attrs['n_events'] = self.n_events
+        self.file.close()
+        logging.info(f"Closed {self.path} with {self.n_events} events.")
+
+
+class Recorder(Thread):
+    '''
+    Writer thread. Drains its own ring buffer reader into a writer (H5Writer or RawWriter),
+    so the acquisition loop never waits on the disk. Events lost because the
+    writer fell a full buffer behind show up in the reader's overruns.
+
+    A slow write can take longer than the worker needs to lap the ring buffer, so
+    every block is copied out before it is written, and events the worker
+    overwrote before the copy completed are dropped and counted as overruns
+    instead of being written torn.
+
+    Not a daemon thread, so the interpreter can't exit before the file is closed.
+    '''
+
+    def __init__(self, 
+                 reader         : RingReader,
+                 writer,
+                 poll_interval  : float = 0.01,
+                 flush_interval : float = 5.0,
+                 metrics        : StageMetrics = None):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.metrics = metrics or StageMetrics('recording')
+        self.poll_interval  = poll_interval
+        self.flush_interval = flush_interval
+        self.stop_event = Event()
+        self.block = None   # events being written, copied out of the ring buffer
+
+    def stop(self):
+        '''
+        Ask the writer thread to write what is pending and close the file. Does not wait.
+        '''
+        self.stop_event.set()
+
+    @profiling.profile_thread('recording')
+    def run(self):
+        logging.info("Recorder thread started.")
+        last_flush = time.perf_counter()
+        try:
+            while True:
+                batch = self.reader.read(self.reader.ring.reserve_max)
+                if batch is None:
+                    if self.stop_event.is_set():
+                        break
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+                t0 = time.perf_counter()
+                batch = self.copy(batch)
+                if len(batch) == 0:
+                    continue
+                self.writer.write(batch)
+                self.metrics.record(t0, len(batch), batch.nbytes)
+
+                if time.perf_counter() - last_flush > self.flush_interval:
+                    self.writer.flush()
+                    last_flush = time.perf_counter()
+        except Exception as e:
+            logging.exception(f"Recording failed: {e}")
+        finally:
+            self.writer.close()
+
+        if self.reader.overruns:
+            logging.warning(f"Recorder fell behind, {self.reader.overruns} events were not written.")
+        logging.info("Recorder thread exited.")
+
+    def copy(self, batch : EventBatch) -> EventBatch:
+        '''
+        Copy a block just read into the recorder's own buffer, leaving out the
+        events the worker may have overwritten in the meantime.
+        '''
+        n     = len(batch)
+        start = self.reader.cursor - n
+        if self.block is None or self.block.dtype != batch.data.dtype or len(self.block) < n:
+            self.block = np.empty(max(n, self.reader.ring.reserve_max), dtype = batch.data.dtype)
+        self.block[:n] = batch.events
+        torn = self.reader.overwritten(start, n)
+        self.reader.overruns += torn
+        return EventBatch(self.block[torn : n], n - torn)
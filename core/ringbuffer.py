@@ -0,0 +1,311 @@
+'''
+Preallocated ring buffer of events shared between the acquisition worker and its consumers.
+'''
+import logging
+import time
+from multiprocessing import shared_memory
+from threading import Lock
+
+import numpy as np
+
+import felib.formats as formats
+from core.tracker import LatencyHistogram
+from felib.batch import EventBatch
+
+
+class RingBuffer:
+    '''
+    Fixed capacity event ring buffer with a single writer and any number of readers.
+
+    The writer reserves a contiguous block of slots, fills it in place (the digitiser
+    reads straight into it) and commits it. Each reader keeps its own cursor and gets
+    views into the buffer, so no event is copied between the worker and its consumers.
+    The writer never waits on readers: a reader that falls more than a buffer behind
+    skips forward and the lost events are counted in its overruns.
+
+    Views handed to readers are only valid until the writer laps them, consumers
+    that need the data for longer must copy it.
+
+    Every slot holds the time (time.perf_counter()) it was committed, so readers
+    measure how long events queued before they were read.
+
+    A shared ring buffer keeps its head and slots in a multiprocessing shared memory
+    segment, so a writer in another process can feed readers in this one. The writing
+    side allocates the segment and hands its layout() to the reading side, which
+    attach()es to it.
+    '''
+
+    # bytes reserved ahead of the slots in shared memory, the head lives at the start
+    SHM_HEADER = 64
+
+    def __init__(self, shared : bool = False):
+        self.data     = None
+        self.stamps   = None
+        self.capacity = 0
+        self.reserve_max = 0
+        # number of events committed since allocation, kept in an array so it can live
+        # in shared memory alongside the data
+        self.head     = np.zeros(1, dtype=np.uint64)
+        self.readers  = {}
+        self.lock     = Lock()
+
+        self.shared   = shared
+        self.shm      = None
+        self.owner    = False
+        self.on_allocate = None   # called with the layout() after every shared allocation
+
+    def allocate(self, 
+                 record_length     : int,
+                 n_ch              : int,
+                 slots_per_channel : int = 1024,
+                 reserve_max       : int = 256):
+        '''
+        (Re)allocate the slots for the given record length (samples) and number of
+        channels, unless they already have this layout. reserve_max is the largest
+        block the writer reserves at once, readers may lag by at most
+        capacity - reserve_max events.
+        '''
+        capacity = max(int(slots_per_channel) * int(n_ch), 2 * reserve_max)
+        self.ensure_slots(formats.event_dtype(record_length), capacity, reserve_max)
+
+    def allocate_slots(self, dtype : np.dtype, capacity : int, reserve_max : int):
+        '''
+        (Re)allocate capacity slots of any structured dtype, e.g. per-event features.
+        '''
+        dtype = np.dtype(dtype)
+        if self.shared:
+            shm = shared_memory.SharedMemory(create = True, size = self.stamps_offset(dtype, capacity) + capacity * 8)
+            head, data, stamps = self.map(shm, dtype, capacity)
+            head[0] = 0
+        else:
+            shm    = None
+            head   = np.zeros(1, dtype=np.uint64)
+            data   = np.zeros(capacity, dtype = dtype)
+            stamps = np.zeros(capacity, dtype = np.float64)
+        self.close(*self.swap(shm, True, head, data, stamps, capacity, reserve_max))
+        logging.info(f"Ring buffer allocated: {capacity} slots of {self.data.dtype.itemsize} bytes "
+                     f"({self.data.nbytes / 1e6:.1f} MB{', shared' if self.shared else ''}).")
+        if self.shared and self.on_allocate is not None:
+            self.on_allocate(self.layout())
+
+    def ensure_slots(self, dtype : np.dtype, capacity : int, reserve_max : int):
+        '''
+        Allocate as allocate_slots, unless the slots already have this layout, in
+        which case they are kept (with their readers and shared memory).
+        '''
+        if (self.data is not None and self.data.dtype == np.dtype(dtype)
+                and self.capacity == capacity and self.reserve_max == reserve_max):
+            return
+        self.allocate_slots(dtype, capacity, reserve_max)
+
+    def stamps_offset(self, dtype : np.dtype, capacity : int) -> int:
+        '''
+        Offset of the commit times in shared memory, 8 byte aligned after the slots.
+        '''
+        return -(-(self.SHM_HEADER + capacity * dtype.itemsize) // 8) * 8
+
+    def map(self, shm : shared_memory.SharedMemory, dtype : np.dtype, capacity : int) -> tuple:
+        '''
+        View the head, slots and commit times of a shared memory segment.
+        '''
+        head   = np.ndarray(1, dtype = np.uint64, buffer = shm.buf)
+        data   = np.ndarray(capacity, dtype = dtype, buffer = shm.buf, offset = self.SHM_HEADER)
+        stamps = np.ndarray(capacity, dtype = np.float64, buffer = shm.buf,
+                            offset = self.stamps_offset(dtype, capacity))
+        return head, data, stamps
+
+    def swap(self, shm, owner : bool, head, data, stamps, capacity : int, reserve_max : int,
+             skip : bool = False) -> tuple:
+        '''
+        Replace the slots by ready made ones in one step under the lock, so readers
+        see either the old or the new buffer, never a mix or none, and rewind the
+        readers (to the new head if skip). Returns the previous segment and its
+        ownership, to be closed once nothing reads from it.
+        '''
+        with self.lock:
+            old = (self.shm, self.owner)
+            self.shm, self.owner = shm, owner and shm is not None
+            self.head, self.data, self.stamps = head, data, stamps
+            self.capacity    = capacity
+            self.reserve_max = reserve_max
+            for reader in self.readers.values():
+                reader.reset()
+                if skip:
+                    reader.skip()
+        return old
+
+    def layout(self) -> dict:
+        '''
+        Everything another process needs to attach to this shared ring buffer.
+        '''
+        return {'name'        : self.shm.name,
+                'dtype'       : self.data.dtype,
+                'capacity'    : self.capacity,
+                'reserve_max' : self.reserve_max}
+
+    def attach(self, layout : dict):
+        '''
+        Read from a shared ring buffer allocated by another process. Readers
+        start at its current head.
+        '''
+        # map the new segment before letting go of the old one, readers keep
+        # reading the old slots until they are swapped
+        shm = shared_memory.SharedMemory(name = layout['name'])
+        head, data, stamps = self.map(shm, layout['dtype'], layout['capacity'])
+        # the allocating process owns the segment and unlinks it
+        old = self.swap(shm, False, head, data, stamps, layout['capacity'], layout['reserve_max'], skip = True)
+        self.close(*old)
+        logging.info(f"Attached to shared ring buffer {layout['name']} ({self.data.nbytes / 1e6:.1f} MB).")
+
+    def release(self):
+        '''
+        Let go of the shared memory segment, removing it if this process allocated it.
+        '''
+        if self.shm is None:
+            return
+        self.close(*self.swap(None, False, np.zeros(1, dtype=np.uint64), None, None,
+                              self.capacity, self.reserve_max))
+
+    @staticmethod
+    def close(shm, owner : bool):
+        '''
+        Close a shared memory segment no longer viewed by the ring buffer (if any),
+        removing it if this process allocated it.
+        '''
+        if shm is None:
+            return
+        try:
+            shm.close()
+        except BufferError:
+            # views are still held by a consumer, the mapping goes when they do
+            pass
+        if owner:
+            shm.unlink()
+
+    @property
+    def written(self):
+        return int(self.head[0])
+
+    def reserve(self, n : int):
+        '''
+        Return an empty EventBatch viewing the next free slots, at most n (and
+        reserve_max) long. Shorter than requested when the block would wrap.
+        '''
+        n   = min(n, self.reserve_max)
+        idx = self.written % self.capacity
+        return EventBatch(self.data[idx : idx + min(n, self.capacity - idx)])
+
+    def commit(self, n : int):
+        '''
+        Publish the first n events of the last reserved block to the readers.
+        '''
+        idx = self.written % self.capacity
+        self.stamps[idx : idx + n] = time.perf_counter()
+        self.head[0] += n
+
+    def reader(self, name : str):
+        '''
+        Create (or return the existing) reader with the given name. New readers
+        start at the current head and only see events committed from now on.
+        '''
+        with self.lock:
+            if name not in self.readers:
+                self.readers[name] = RingReader(self, name)
+            return self.readers[name]
+
+    def overruns(self):
+        '''
+        Number of events each reader lost to being lapped by the writer.
+        '''
+        return {name : reader.overruns for name, reader in self.readers.items()}
+
+
+class RingReader:
+    '''
+    Cursor into a RingBuffer for a single consumer.
+    '''
+
+    def __init__(self, ring : RingBuffer, name : str):
+        self.ring     = ring
+        self.name     = name
+        self.cursor   = ring.written
+        self.overruns = 0
+        self.skipped  = 0
+        self.wait     = LatencyHistogram()   # time events queued before being read
+
+    def reset(self):
+        self.cursor   = 0
+        self.overruns = 0
+        self.skipped  = 0
+        self.wait     = LatencyHistogram()
+
+    def skip(self):
+        '''
+        Drop everything pending, the next read only sees newly committed events.
+        '''
+        self.cursor = self.ring.written
+
+    def available(self):
+        return self.ring.written - self.cursor
+
+    def overwritten(self, start : int, n : int) -> int:
+        '''
+        How many of the n events read from position start the writer may have
+        overwritten since (it fills up to reserve_max slots past its head).
+        '''
+        lapped = self.ring.written + self.ring.reserve_max - self.ring.capacity - start
+        return min(max(0, lapped), n)
+
+    def _catch_up(self):
+        '''
+        Skip the events the writer may be overwriting and count them as overruns.
+        '''
+        head = self.ring.written
+        lag  = self.ring.capacity - self.ring.reserve_max
+        if head - self.cursor > lag:
+            self.overruns += head - self.cursor - lag
+            self.cursor    = head - lag
+        return head
+
+    def latest(self, max_events : int):
+        '''
+        Return an EventBatch viewing the newest pending events (at most max_events,
+        never across the end of the buffer) and skip everything older, or None if
+        nothing is pending. Skipped events are counted in skipped, they are not overruns.
+        '''
+        # under the lock, the slots may be swapped (see RingBuffer.swap) while reading
+        with self.ring.lock:
+            if self.ring.data is None:
+                return None
+            head = self.ring.written
+            pending = head - self.cursor
+            if pending <= 0:
+                return None
+
+            end = head % self.ring.capacity or self.ring.capacity
+            n   = min(pending, max_events, end, self.ring.capacity - self.ring.reserve_max)
+            self.skipped += pending - n
+            self.cursor   = head
+            self.wait.record(time.perf_counter() - self.ring.stamps[end - 1])
+            return EventBatch(self.ring.data[end - n : end], n)
+
+    def read(self, max_events : int = None):
+        '''
+        Return an EventBatch viewing the oldest unread events (up to max_events,
+        and never across the end of the buffer), or None if nothing is pending.
+        '''
+        with self.ring.lock:
+            if self.ring.data is None:
+                return None
+            head = self._catch_up()
+            n = head - self.cursor
+            if n <= 0:
+                return None
+            if max_events is not None:
+                n = min(n, max_events)
+
+            idx = self.cursor % self.ring.capacity
+            n   = min(n, self.ring.capacity - idx)
+            self.cursor += n
+            self.wait.record(time.perf_counter() - self.ring.stamps[idx])
+            return EventBatch(self.ring.data[idx : idx + n], n)
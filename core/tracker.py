@@ -1,3 +1,4 @@
+import json
 import logging
 import time
 from threading import Lock
@@ -9,25 +10,205 @@ class Tracker:
         - speed at which data is being collected
     '''
 
-    def __init__(self):
+    def __init__(self, name : str = ''):
+        self.name       = name   # prefixed to the log line, e.g. the board
+        self.rate       = 0      # events/sec over the last full second
         self.start_time = time.perf_counter()
         self.bytes_ps   = 0
         self.events_ps  = 0
         self.last_time  = self.start_time
         self.lock       = Lock()
 
-    def track(self, nbytes: int = 0):
+    def track(self, nbytes: int = 0, n_events: int = 1):
         '''
-        Tracker outputting the number of events that arrive per second
+        Tracker outputting the number of events that arrive per second.
+        A whole batch of n_events can be tracked in one call.
         '''
         with self.lock:
-            self.events_ps += 1
+            self.events_ps += n_events
             self.bytes_ps += nbytes
 
             t_check = time.perf_counter()
             if t_check - self.last_time >= 1.0:
                 MB = self.bytes_ps / 1000000
-                logging.info(f'|| {self.events_ps} events/sec || {MB:.2f} MB/sec ||')
+                self.rate = self.events_ps / (t_check - self.last_time)
+                prefix = f'{self.name} ' if self.name else ''
+                logging.info(f'{prefix}|| {self.events_ps} events/sec || {MB:.2f} MB/sec ||')
                 self.last_time = t_check
                 self.bytes_ps = 0
                 self.events_ps = 0
+
+
+class LatencyHistogram:
+    '''
+    Latency histogram with four buckets per power of two of microseconds (about
+    25% resolution from 1 us to hours), cheap enough to fill on every batch.
+    '''
+
+    N_BUCKETS = 160
+
+    def __init__(self):
+        self.counts = [0] * self.N_BUCKETS
+        self.n      = 0
+        self.total  = 0.0
+        self.max    = 0.0
+
+    @staticmethod
+    def bucket(us : int) -> int:
+        if us < 4:
+            return us
+        bits = us.bit_length()
+        return (bits - 2) * 4 + ((us >> (bits - 3)) & 3)
+
+    @staticmethod
+    def upper_edge(bucket : int) -> float:
+        '''
+        Upper edge of a bucket in seconds.
+        '''
+        if bucket < 4:
+            return (bucket + 1) * 1e-6
+        bits = bucket // 4 + 2
+        return ((bucket % 4 + 5) << (bits - 3)) * 1e-6
+
+    def record(self, seconds : float):
+        self.counts[min(self.bucket(int(seconds * 1e6)), self.N_BUCKETS - 1)] += 1
+        self.n     += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p : float) -> float:
+        '''
+        Upper bound (seconds) of the p-th percentile.
+        '''
+        if self.n == 0:
+            return 0.0
+        target = p / 100 * self.n
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.upper_edge(bucket), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        '''
+        Count, mean, percentiles and maximum, in ms.
+        '''
+        return {'n'    : self.n,
+                'mean' : self.total / self.n * 1e3 if self.n else 0.0,
+                'p50'  : self.percentile(50) * 1e3,
+                'p90'  : self.percentile(90) * 1e3,
+                'p99'  : self.percentile(99) * 1e3,
+                'max'  : self.max * 1e3}
+
+
+class StageMetrics:
+    '''
+    Counters, rate and latency histogram of one pipeline stage. Only the thread
+    running the stage records into it, readers just take snapshots.
+    '''
+
+    def __init__(self, name : str):
+        self.name    = name
+        self.events  = 0
+        self.bytes   = 0
+        self.batches = 0
+        self.latency = LatencyHistogram()
+
+        # rate over the last full second, as in Tracker
+        self.rate         = 0.0
+        self.bytes_rate   = 0.0
+        self.window_start = time.perf_counter()
+        self.window_events = 0
+        self.window_bytes  = 0
+
+    def record(self, t0 : float, n_events : int = 1, nbytes : int = 0):
+        '''
+        Record a batch of n_events processed since t0 (time.perf_counter()).
+        '''
+        now = time.perf_counter()
+        self.latency.record(now - t0)
+        self.events  += n_events
+        self.bytes   += nbytes
+        self.batches += 1
+        self.window_events += n_events
+        self.window_bytes  += nbytes
+        if now - self.window_start >= 1.0:
+            self.rate       = self.window_events / (now - self.window_start)
+            self.bytes_rate = self.window_bytes / (now - self.window_start)
+            self.window_start  = now
+            self.window_events = 0
+            self.window_bytes  = 0
+
+    def snapshot(self) -> dict:
+        # a stage that stopped recording has no current rate
+        stale = time.perf_counter() - self.window_start > 2.0
+        return {'events'     : self.events,
+                'bytes'      : self.bytes,
+                'batches'    : self.batches,
+                'rate'       : 0.0 if stale else self.rate,
+                'MB_per_s'   : 0.0 if stale else self.bytes_rate / 1e6,
+                'latency_ms' : self.latency.summary()}
+
+
+class Metrics:
+    '''
+    Metrics of the whole pipeline: a StageMetrics per stage (readout, analysis,
+    recording, display, ...) and, for every watched ring buffer, the fill level,
+    drops (overruns) and queueing latency of each of its readers.
+
+    Metrics recorded in another process (see core.process) are passed in as
+    snapshots through update_remote and merged into snapshot().
+    '''
+
+    def __init__(self):
+        self.stages = {}
+        self.rings  = {}
+        self.remote = {}
+        self.start_time = time.time()
+
+    def stage(self, name : str) -> StageMetrics:
+        '''
+        The metrics of a stage, created on first use.
+        '''
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def watch(self, name : str, ring):
+        '''
+        Report the readers of a ring buffer as queues named <name>/<reader>.
+        '''
+        self.rings[name] = ring
+
+    def update_remote(self, snapshot : dict):
+        self.remote = snapshot
+
+    def queues(self) -> dict:
+        queues = {}
+        for ring_name, ring in self.rings.items():
+            for reader_name, reader in list(ring.readers.items()):
+                capacity = ring.capacity or 1
+                queues[f'{ring_name}/{reader_name}'] = {
+                    'fill'       : min(1.0, max(0, reader.available()) / capacity),
+                    'drops'      : reader.overruns,
+                    'skipped'    : reader.skipped,
+                    'latency_ms' : reader.wait.summary(),
+                }
+        return queues
+
+    def snapshot(self) -> dict:
+        return {'time'   : time.time(),
+                'uptime' : time.time() - self.start_time,
+                'stages' : {**self.remote.get('stages', {}),
+                            **{name : stage.snapshot() for name, stage in list(self.stages.items())}},
+                'queues' : {**self.remote.get('queues', {}), **self.queues()}}
+
+    def dump(self, path : str):
+        '''
+        Write a snapshot of all metrics to a JSON file.
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent = 2)
+        logging.info(f"Metrics written to {path}.")
@@ -1,9 +1,20 @@
 from queue import Queue, Empty
 from threading import Thread, Event, Lock
 import logging
+import os
 import time
 from core.commands import CommandType, Command
+from core.ringbuffer import RingBuffer
+from core.recorder import Recorder, H5Writer, run_file_name
+from core.rawfile import RawWriter, BufferWriter
+from core.analysis import AnalysisStage, FEATURE_DTYPE, channel_polarity
+from core.boards import BoardReader, TimestampMerger
+from core.builder import EventBuilder, BUILT_EVENT_DTYPE, hit_dtype
+from core.decoder import DecodeStage
+from core.tracker import Tracker, Metrics
+from core import profiling
 from felib.digitiser import Digitiser
+import felib.formats as formats
 from core.io import read_config_file
 
 class AcquisitionWorker(Thread):
@@ -12,18 +23,61 @@ class AcquisitionWorker(Thread):
 
     This class is designed to be thread-safe and independent from Qt threading.
     All commands and data flow through thread-safe mechanisms (queue, locks, events).
+    Events are read straight into the ring buffer, which consumers read through their own cursors.
     '''
 
-    def __init__(self, cmd_buffer: Queue, display_buffer: Queue, stop_event: Event):
+    # idle backoff bounds (seconds) used when no data is available
+    IDLE_BACKOFF_MIN = 1e-4
+    IDLE_BACKOFF_MAX = 5e-2
+    # pause (seconds) between merges of several boards when none had new events
+    MERGE_INTERVAL = 1e-3
+
+    def __init__(self, cmd_buffer: Queue, ring: RingBuffer, stop_event: Event):
         super().__init__(daemon=True)
         self.digitiser = None
+        # with several boards each has a reader thread and ring buffer, merged into ring
+        self.digitisers = []
+        self.board_rings = []
+        self.board_readers = []
+        self.merger = None
         self.stop_event = stop_event
         self.cmd_buffer = cmd_buffer
-        self.display_buffer = display_buffer
-        self.data_buffer = Queue()
+        self.ring = ring
         self.data_ready_callback = None  # set by Controller
         self.dig_config = None
         self.rec_config = None
+        self.dig_dict = None
+        self.rec_dict = None
+        self.recorder = None
+        self.feature_recorder = None
+        self.finishing = []   # stopped recorders still writing, joined on exit
+
+        # undecoded RAW buffers, read into when decoding is deferred
+        self.buffers = RingBuffer()
+        self.decoder = None
+
+        # per-stage counters and latencies, and the queues between the stages
+        self.metrics = Metrics()
+        self.readout_metrics = self.metrics.stage('readout')
+        self.tracker = Tracker()
+        self.run_root = None
+
+        # per-event pulse features, filled by the analysis stage when enabled
+        self.features = RingBuffer()
+        self.analysis = None
+
+        # built hits and events, filled by the event builder when enabled
+        self.built_hits = RingBuffer()
+        self.built_events = RingBuffer()
+        self.builder = None
+        self.event_recorder = None
+
+        # readout behaviour, overwritten by the recording config on connect
+        self.readout_wait = 'block'
+        self.block_timeout = 100   # ms
+        self.backoff_min = self.IDLE_BACKOFF_MIN
+        self.backoff_max = self.IDLE_BACKOFF_MAX
+        self.backoff = self.backoff_min
 
     def enqueue_cmd(self, cmd_type: CommandType, *args):
         '''
@@ -35,8 +89,11 @@ class AcquisitionWorker(Thread):
         '''
         Handles commands sent to AcquisitionWorker. Currently supports the commands:
             - CONNECT
+            - UPDATE
             - START
             - STOP
+            - RECORD_START
+            - RECORD_STOP
             - EXIT
         '''
         logging.debug(f"Handling command: {cmd.type}")
@@ -45,10 +102,16 @@ class AcquisitionWorker(Thread):
             match cmd.type:
                 case CommandType.CONNECT:
                     self.connect_digitiser(*args)
+                case CommandType.UPDATE:
+                    self.update_config(*args)
                 case CommandType.START:
                     self.start_acquisition()
                 case CommandType.STOP:
-                    self.cleanup()
+                    self.stop_acquisition()
+                case CommandType.RECORD_START:
+                    self.start_recording()
+                case CommandType.RECORD_STOP:
+                    self.stop_recording()
                 case CommandType.EXIT:
                     self.stop_event.set()
                 case _:
@@ -59,47 +122,489 @@ class AcquisitionWorker(Thread):
     def start_acquisition(self):
         '''
         Starts digitiser acquisition. First checks to see if there is a digitiser connected.
-        If not already connected, connect using the config files. Finally, tell the digitiser
+        If not (never connected, or torn down after a fault), connect using the config files.
+        A connection kept from a previous STOP is only re-armed. Finally, tell the digitiser
         to start acquisition.
         '''
-        if self.digitiser is None:
+        if self.digitiser is None or not all(digitiser.isConnected for digitiser in self.digitisers):
             logging.info("No digitiser instance — reconnecting before start.")
             if self.dig_config is None or self.rec_config is None:
                 logging.error("No stored configuration — cannot reconnect digitiser.")
                 return
             self.connect_digitiser(self.dig_config, self.rec_config)
+            if self.digitiser is None:
+                return
+        if self.digitiser.isAcquiring:
+            logging.warning("Already acquiring.")
+            return
         try:
-            self.digitiser.start_acquisition()
+            for digitiser in self.digitisers:
+                digitiser.start_acquisition()
+            if len(self.digitisers) > 1:
+                self.start_boards()
             logging.info("Digitiser acquisition started successfully.")
         except Exception as e:
             logging.exception(f"Start acquisition failed: {e}")
+
+    def stop_acquisition(self):
+        '''
+        Disarm the boards and finish any recording. The connection, its configuration,
+        endpoint and read buffers, and the ring buffers are kept, so the next START
+        only re-arms. The processing stages are restarted to flush what they hold
+        back into the run files.
+        '''
+        self.disarm()
+        self.stop_stages()
+        if self.digitiser is not None and self.rec_dict is not None:
+            self.start_stages(self.rec_dict)
+        logging.info("Acquisition stopped, digitiser connection kept.")
+
+    def disarm(self):
+        '''
+        Disarm the boards and stop reading them out, leaving the processing stages
+        running.
+        '''
+        for digitiser in self.digitisers:
+            if digitiser.isAcquiring:
+                digitiser.stop_acquisition()
+        self.stop_boards()
+
+    def fault(self, error: Exception):
+        '''
+        Readout failed: close the connection, so that the next START reconnects
+        and reconfigures the boards from the stored configs.
+        '''
+        logging.error(f"Readout fault ({error}), closing the digitiser connection. The next START reconnects.")
+        self.cleanup()
+
+    def start_boards(self):
+        '''
+        Read every board out on its own thread and merge their events by timestamp.
+        '''
+        self.stop_boards()
+        rec_dict = self.rec_dict or {}
+        readers = []
+        for ring in self.board_rings:
+            reader = ring.reader('merge')
+            reader.skip()
+            readers.append(reader)
+        self.merger = TimestampMerger(readers, self.ring, idle_timeout = float(rec_dict.get('merge_idle_timeout', 0.5)))
+        self.board_readers = [BoardReader(digitiser, ring, self.block_timeout,
+                                          metrics = self.metrics.stage(f'readout board {digitiser.board}'))
+                              for digitiser, ring in zip(self.digitisers, self.board_rings)]
+        for reader in self.board_readers:
+            reader.start()
+
+    def stop_boards(self):
+        '''
+        Stop the board reader threads and pass on everything they left pending.
+        '''
+        for reader in self.board_readers:
+            reader.stop()
+        for reader in self.board_readers:
+            reader.join(timeout=5)
+        if self.merger is not None:
+            t0 = time.perf_counter()
+            self.record_merged(t0, self.merger.merge(flush = True))
+            if self.merger.late:
+                logging.warning(f"{self.merger.late} events arrived out of timestamp order.")
+        self.board_readers = []
+        self.merger = None
+
+    def record_merged(self, t0 : float, merged : int):
+        '''
+        Count events merged from several boards since t0. The merged stream is
+        the readout of the run, as a single board's is.
+        '''
+        if merged == 0:
+            return
+        nbytes = merged * self.ring.data.dtype.itemsize
+        self.metrics.stage('merge').record(t0, merged)
+        self.readout_metrics.record(t0, merged, nbytes)
+        self.tracker.track(nbytes, merged)
     
     def connect_digitiser(self, dig_config, rec_config):
         '''
-        Connect to digitiser with given configs.
+        Connect to digitiser with given configs. dig_config may be a list of
+        digitiser configs, one per board, to read several boards out together.
         '''
+        # an explicit reconnect closes the current connection first
+        if self.digitisers:
+            self.cleanup()
+
         # cache configs
         self.dig_config = dig_config
         self.rec_config = rec_config
 
-        # Load in configs
-        dig_dict = read_config_file(dig_config)
+        # Load in configs, one digitiser config per board
+        dig_configs = dig_config if isinstance(dig_config, (list, tuple)) else [dig_config]
+        dig_dicts = [read_config_file(config) for config in dig_configs]
         rec_dict = read_config_file(rec_config)
 
-        if dig_dict is None:
+        if any(dig_dict is None for dig_dict in dig_dicts):
             logging.error("Digitiser configuration file not found or invalid.")
             return
+        self.dig_dict = dig_dicts[0]
+        self.rec_dict = rec_dict
 
-        self.digitiser = Digitiser(dig_dict)
-        self.digitiser.connect()
+        self.digitisers = []
+        for board, dig_dict in enumerate(dig_dicts):
+            digitiser = Digitiser(dig_dict)
+            digitiser.board = board
+            digitiser.connect()
+            self.digitisers.append(digitiser)
+        self.digitiser = self.digitisers[0]
 
         # once connected, configure recording setup
         if rec_dict is None:
             logging.warning("No recording configuration file provided.")
         else:
-            if (self.digitiser is not None) and self.digitiser.isConnected:
-                self.digitiser.configure(dig_dict, rec_dict)
+            self.configure_boards(rec_dict)
+
+    def configure_boards(self, rec_dict: dict):
+        '''
+        Configure the connected boards for the recording config, size the ring
+        buffers and start the processing stages.
+        '''
+        self.configure_readout(rec_dict)
+        if all(digitiser.isConnected for digitiser in self.digitisers):
+            for digitiser in self.digitisers:
+                digitiser.configure(digitiser.dig_dict, rec_dict)
+            if len(self.digitisers) > 1 and any(digitiser.deferred for digitiser in self.digitisers):
+                logging.warning("Deferred decoding is only supported for a single board, decoding inline.")
+                for digitiser in self.digitisers:
+                    digitiser.deferred = False
+            self.allocate_ring(rec_dict)
+            self.start_stages(rec_dict)
+
+    def update_config(self, dig_config, rec_config):
+        '''
+        Apply changed configs to the connected boards without reconnecting: only
+        the parameters that changed are written, and the ADC is only recalibrated
+        if that is affected (see Digitiser.configure). Acquisition, if running, is
+        stopped for the change and started again. The boards are connected from
+        scratch if none are connected, or if the boards or their readout changed.
+        '''
+        dig_configs = dig_config if isinstance(dig_config, (list, tuple)) else [dig_config]
+        dig_dicts = [read_config_file(config) for config in dig_configs]
+        rec_dict = read_config_file(rec_config)
+        if any(dig_dict is None for dig_dict in dig_dicts) or rec_dict is None:
+            logging.error("Configuration file not found or invalid, configuration not updated.")
+            return
+
+        connection = ('dig_name', 'dig_gen', 'con_type', 'link_num', 'conet_node', 'vme_base_address', 'dig_authority')
+        readout = ('raw_readout', 'raw_decode', 'raw_buffer_bytes')
+        if (not self.digitisers or not all(digitiser.isConnected for digitiser in self.digitisers)
+                or len(dig_dicts) != len(self.digitisers)
+                or any(digitiser.dig_dict.get(key) != dig_dict.get(key)
+                       for digitiser, dig_dict in zip(self.digitisers, dig_dicts) for key in connection)
+                or any((self.rec_dict or {}).get(key) != rec_dict.get(key) for key in readout)):
+            logging.info("Boards or readout changed, connecting from scratch.")
+            self.connect_digitiser(dig_config, rec_config)
+            return
+
+        acquiring = self.digitiser.isAcquiring
+        if acquiring:
+            self.disarm()
+        self.stop_stages()
+
+        self.dig_config = dig_config
+        self.rec_config = rec_config
+        self.dig_dict = dig_dicts[0]
+        self.rec_dict = rec_dict
+        for digitiser, dig_dict in zip(self.digitisers, dig_dicts):
+            digitiser.dig_dict = dig_dict
+        t0 = time.perf_counter()
+        self.configure_boards(rec_dict)
+        logging.info(f"Configuration updated in {(time.perf_counter() - t0) * 1e3:.1f} ms.")
+
+        if acquiring:
+            self.start_acquisition()
+
+    def allocate_ring(self, rec_dict: dict):
+        '''
+        Size the ring buffer slots from the configured record length and number of channels.
+        '''
+        if self.digitiser.batch is None:
+            logging.error("Digitiser not configured, ring buffer not allocated.")
+            return
+        if len({digitiser.reclen for digitiser in self.digitisers}) > 1:
+            logging.error("Boards have different record lengths, ring buffer not allocated.")
+            return
+        slots_per_channel = int(rec_dict.get('ring_slots', 1024))
+        self.ring.allocate(record_length     = self.digitiser.reclen,
+                           n_ch              = sum(digitiser.dig_info['n_ch'] for digitiser in self.digitisers),
+                           slots_per_channel = slots_per_channel,
+                           reserve_max       = self.digitiser.batch_size)
+
+        self.board_rings = []
+        if len(self.digitisers) > 1:
+            for digitiser in self.digitisers:
+                ring = RingBuffer()
+                ring.allocate(record_length     = digitiser.reclen,
+                              n_ch              = digitiser.dig_info['n_ch'],
+                              slots_per_channel = slots_per_channel,
+                              reserve_max       = digitiser.batch_size)
+                self.board_rings.append(ring)
+                self.metrics.watch(f'board {digitiser.board}', ring)
+        self.watch_rings()
+
+        # whole board buffers, one per slot, when decoding is deferred
+        if self.digitiser.deferred:
+            slots = int(rec_dict.get('raw_ring_slots', 16))
+            self.buffers.ensure_slots(formats.raw_buffer_dtype(self.digitiser.raw_buffer_bytes),
+                                      capacity    = slots,
+                                      reserve_max = 1)
+            logging.info(f"RAW buffer ring: {slots} x {self.digitiser.raw_buffer_bytes / 2**20:.1f} MiB "
+                         f"= {self.buffers.data.nbytes / 2**20:.0f} MiB.")
+
+    def watch_rings(self):
+        '''
+        Report the fill level, drops and queueing latency of every ring buffer in use.
+        '''
+        self.metrics.watch('events', self.ring)
+        self.metrics.watch('features', self.features)
+        self.metrics.watch('built hits', self.built_hits)
+        self.metrics.watch('built events', self.built_events)
+        if self.digitiser is not None and self.digitiser.deferred:
+            self.metrics.watch('buffers', self.buffers)
+
+    def start_stages(self, rec_dict: dict):
+        '''
+        Start the processing stages enabled in the recording config.
+        '''
+        self.start_decoder(rec_dict)
+        # buffers left for offline decoding never reach the event stream
+        if not self.digitiser.deferred or self.decoder is not None:
+            self.start_analysis(rec_dict)
+            self.start_builder(rec_dict)
+
+    def stop_stages(self):
+        '''
+        Stop the processing stages, each once it has passed on what is pending,
+        upstream stages first, and then the recording of what they produced.
+        '''
+        self.stop_decoder()
+        self.stop_builder()
+        self.stop_analysis()
+        self.stop_recording()
+
+    def start_decoder(self, rec_dict: dict):
+        '''
+        Decode the undecoded buffers into the event ring buffer while acquiring,
+        if raw_decode = 'stage'. With raw_decode = 'offline' the buffers are only
+        recorded, to be decoded later with bin/carp-decode.
+        '''
+        self.stop_decoder()
+        if not self.digitiser.deferred or rec_dict.get('raw_decode') != 'stage' or self.buffers.data is None:
+            return
+        self.decoder = DecodeStage(reader        = self.buffers.reader('decode'),
+                                   ring          = self.ring,
+                                   decode        = self.digitiser.decode,
+                                   record_length = self.digitiser.reclen,
+                                   n_workers     = int(rec_dict.get('decode_workers', 2)),
+                                   metrics       = self.metrics.stage('decoding'))
+        self.decoder.reader.skip()
+        self.decoder.start()
+
+    def stop_decoder(self):
+        '''
+        Stop the decoding stage once it has decoded everything pending.
+        '''
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.decoder.join(timeout=5)
+            self.decoder = None
+
+    def start_analysis(self, rec_dict: dict):
+        '''
+        Start the online pulse analysis stage if enabled in the recording config.
+        Its features go to their own ring buffer, in the same order as the events.
+        '''
+        self.stop_analysis()
+        if not rec_dict.get('analysis', False) or self.ring.data is None:
+            return
+        self.features.ensure_slots(FEATURE_DTYPE, self.ring.capacity, self.ring.reserve_max)
+        period = 1e3 / self.digitiser.dig_info['sample_rate']   # ns
+        self.analysis = AnalysisStage(reader      = self.ring.reader('analysis'),
+                                      features    = self.features,
+                                      polarity    = channel_polarity(rec_dict, [d.board for d in self.digitisers]),
+                                      pre_trigger = int(int(rec_dict.get('pre_trigger', 0)) / period),
+                                      period      = period,
+                                      n_workers   = int(rec_dict.get('analysis_workers', 2)),
+                                      metrics     = self.metrics.stage('analysis'))
+        self.analysis.reader.skip()
+        self.analysis.start()
+
+    def stop_analysis(self):
+        if self.analysis is not None:
+            self.analysis.stop()
+            self.analysis.join(timeout=5)
+            self.analysis = None
+
+    def start_builder(self, rec_dict: dict):
+        '''
+        Start the event builder if enabled in the recording config. Recording then
+        writes the built hits (with their EVENT_ID) and the built events instead
+        of the raw event stream.
+        '''
+        self.stop_builder()
+        if not rec_dict.get('event_building', False) or self.ring.data is None:
+            return
+        self.built_hits.ensure_slots(hit_dtype(self.ring.data.dtype), self.ring.capacity, self.ring.reserve_max)
+        self.built_events.ensure_slots(BUILT_EVENT_DTYPE, self.ring.capacity, self.ring.reserve_max)
+        self.builder = EventBuilder(reader           = self.ring.reader('builder'),
+                                    hits             = self.built_hits,
+                                    events           = self.built_events,
+                                    window           = int(rec_dict.get('coincidence_window', 100)),
+                                    min_multiplicity = int(rec_dict.get('min_multiplicity', 1)),
+                                    idle_timeout     = float(rec_dict.get('merge_idle_timeout', 0.5)),
+                                    metrics          = self.metrics.stage('event building'))
+        self.builder.reader.skip()
+        self.builder.start()
+
+    def stop_builder(self):
+        '''
+        Stop the event builder once it has built everything pending.
+        '''
+        if self.builder is not None:
+            self.builder.stop()
+            self.builder.join(timeout=5)
+            self.builder = None
+
+    def start_recording(self):
+        '''
+        Start writing events to disk on a separate writer thread. Acquisition is
+        started first if it isn't running already.
+        '''
+        if self.recorder is not None and self.recorder.is_alive():
+            logging.warning("Already recording.")
+            return
+        if self.digitiser is None or not self.digitiser.isAcquiring:
+            self.start_acquisition()
+        if self.digitiser is None or self.ring.data is None:
+            logging.error("Digitiser not configured, cannot record.")
+            return
+
+        rec_dict = self.rec_dict or {}
+        output_dir = rec_dict.get('output_dir', os.path.join(os.environ.get('CARP_DIR', '.'), 'data'))
+        metadata = {**self.dig_dict, **rec_dict,
+                    **{f'dig_{key}' : value for key, value in self.digitiser.dig_info.items()},
+                    'reclen'   : self.digitiser.reclen,
+                    'n_boards' : len(self.digitisers)}
+        output_format = rec_dict.get('output_format', 'h5')
+        if output_format not in ('h5', 'raw'):
+            logging.error(f"Unknown output format '{output_format}', cannot record.")
+            return
+        path = run_file_name(output_dir, output_format)
+        root, ext = os.path.splitext(path)
+        self.run_root = root
+        recording = self.metrics.stage('recording')
+
+        if self.digitiser.deferred:
+            # the board buffers are archived undecoded, <run>.buf
+            self.recorder = Recorder(self.buffers.reader('recording'),
+                                     BufferWriter(f'{root}.buf',
+                                                  metadata     = metadata,
+                                                  buffer_bytes = int(rec_dict.get('buffer_bytes', 16 * 1024 * 1024))),
+                                     metrics = recording)
+        else:
+            # with event building only the built hits are written, alongside the built events
+            hits = self.built_hits if self.builder is not None else self.ring
+            self.recorder = Recorder(hits.reader('recording'),
+                                     self.make_writer(path, hits.data.dtype, metadata),
+                                     metrics = recording)
+        self.recorder.reader.skip()
+        self.recorder.start()
+
+        if self.builder is not None:
+            self.event_recorder = Recorder(self.built_events.reader('recording'),
+                                           self.make_writer(f'{root}_events{ext}', BUILT_EVENT_DTYPE, metadata),
+                                           metrics = self.metrics.stage('recording events'))
+            self.event_recorder.reader.skip()
+            self.event_recorder.start()
+
+        # features are written next to the run file, <run>_features.<ext>
+        if self.analysis is not None:
+            self.feature_recorder = Recorder(self.features.reader('recording'),
+                                             self.make_writer(f'{root}_features{ext}', FEATURE_DTYPE, metadata),
+                                             metrics = self.metrics.stage('recording features'))
+            self.feature_recorder.reader.skip()
+            self.feature_recorder.start()
+        self.digitiser.isRecording = True
+
+    def make_writer(self, path: str, dtype, metadata: dict):
+        '''
+        Writer of the configured output format for events of the given dtype.
+        '''
+        rec_dict = self.rec_dict or {}
+        if path.endswith('.h5'):
+            return H5Writer(path,
+                            dtype       = dtype,
+                            metadata    = metadata,
+                            chunk_bytes = int(rec_dict.get('chunk_bytes', 4 * 1024 * 1024)),
+                            compression = rec_dict.get('compression', None))
+        return RawWriter(path,
+                         dtype        = dtype,
+                         metadata     = metadata,
+                         buffer_bytes = int(rec_dict.get('buffer_bytes', 16 * 1024 * 1024)))
+
+    def stop_recording(self):
+        '''
+        Tell the writer thread to finish. The file is closed by the writer thread
+        itself once the pending events are written, so this never blocks on disk.
+        The metrics of the run are written next to it, <run>_metrics.json.
+        '''
+        for recorder in (self.recorder, self.feature_recorder, self.event_recorder):
+            if recorder is not None:
+                self.finishing.append(recorder)
+        self.finishing = [recorder for recorder in self.finishing if recorder.is_alive()]
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+            logging.info("Recording stopped.")
+            try:
+                self.metrics.dump(f'{self.run_root}_metrics.json')
+            except Exception as e:
+                logging.exception(f"Writing the run metrics failed: {e}")
+        if self.feature_recorder is not None:
+            self.feature_recorder.stop()
+            self.feature_recorder = None
+        if self.event_recorder is not None:
+            self.event_recorder.stop()
+            self.event_recorder = None
+        if self.digitiser is not None:
+            self.digitiser.isRecording = False
+
+    def configure_readout(self, rec_dict: dict):
+        '''
+        Set how the hot loop waits for data from the recording config.
+            - readout_wait = 'block' : block on the endpoint for up to block_timeout ms
+            - readout_wait = 'poll'  : poll the endpoint and back off exponentially
+                                       between idle_backoff_min and idle_backoff_max (s)
+        '''
+        self.readout_wait = rec_dict.get('readout_wait', 'block')
+        if self.readout_wait not in ('block', 'poll'):
+            logging.warning(f"Unknown readout_wait '{self.readout_wait}', defaulting to 'block'.")
+            self.readout_wait = 'block'
+        self.block_timeout = int(rec_dict.get('block_timeout', 100))
+        self.backoff_min = float(rec_dict.get('idle_backoff_min', self.IDLE_BACKOFF_MIN))
+        self.backoff_max = float(rec_dict.get('idle_backoff_max', self.IDLE_BACKOFF_MAX))
+        self.backoff = self.backoff_min
+        logging.info(f"Readout mode '{self.readout_wait}' (block timeout {self.block_timeout} ms, "
+                     f"backoff {self.backoff_min}-{self.backoff_max} s).")
+
+    def idle(self):
+        '''
+        Called when a readout returned no data. In poll mode, sleep for the current
+        backoff and double it up to the maximum. In block mode the endpoint already
+        waited, so return immediately.
+        '''
+        if self.readout_wait == 'poll':
+            time.sleep(self.backoff)
+            self.backoff = min(self.backoff * 2, self.backoff_max)
 
+    @profiling.profile_thread('worker')
     def run(self):
         '''
         Data acquisition hot loop. Hot loop runs until stop_event is set either manually
@@ -108,58 +613,107 @@ class AcquisitionWorker(Thread):
         logging.info("AcquisitionWorker thread started.")
         try:
             while not self.stop_event.is_set():
-                # Handle commands
+                acquiring = self.digitiser is not None and self.digitiser.isAcquiring
+
+                # Handle commands, only wait on the buffer when not acquiring
                 while True:
                     try:
-                        cmd = self.cmd_buffer.get(timeout=0.01)
+                        if acquiring:
+                            cmd = self.cmd_buffer.get_nowait()
+                        else:
+                            cmd = self.cmd_buffer.get(timeout=self.backoff_max)
                         self.handle_command(cmd)
                     except Empty:   # exit cmd loop if cmd buffer is empty
                         break
 
-                # Acquire data if running
-                if self.digitiser and self.digitiser.isAcquiring:
+                # Merge the boards' events if several are read out
+                if self.merger is not None:
+                    failed = [reader for reader in self.board_readers if reader.error is not None]
+                    if failed:
+                        self.fault(failed[0].error)
+                        continue
                     try:
-                        data = self.digitiser.acquire()
-                        if data is None:
+                        t0 = time.perf_counter()
+                        with profiling.span('merge'):
+                            merged = self.merger.merge()
+                        if merged == 0:
+                            time.sleep(self.MERGE_INTERVAL)
                             continue
+                        self.record_merged(t0, merged)
+                        if self.data_ready_callback:
+                            self.data_ready_callback()
+                    except Exception as e:
+                        logging.exception(f"Merging boards failed: {e}")
 
-                        # Non-blocking put to visual buffer
-                        if self.display_buffer.full():
-                            try:
-                                self.display_buffer.get_nowait()  # discard oldest
-                            except Empty:
-                                pass
+                # Acquire data if running
+                elif self.digitiser and self.digitiser.isAcquiring:
+                    try:
+                        timeout = self.block_timeout if self.readout_wait == 'block' else 0
+                        # read straight into the next free ring buffer slots,
+                        # whole undecoded buffers if decoding is deferred
+                        ring = self.buffers if self.digitiser.deferred else self.ring
+                        t0 = time.perf_counter()
+                        out = ring.reserve(self.digitiser.batch_size)
+                        with profiling.span('acquire'):
+                            batch = self.digitiser.acquire(timeout, out)
+                        if batch is None:
+                            self.idle()
+                            continue
+                        self.backoff = self.backoff_min
 
-                        # Push to display buffer (etc.)
-                        if not self.display_buffer.full():
-                            self.display_buffer.put_nowait(data)
+                        # publish to display, recording, etc. Never waits on readers.
+                        ring.commit(len(batch))
+                        if self.digitiser.deferred:
+                            n_events = int(batch.data['N_EVENTS'][:batch.n].sum())
+                            nbytes   = int(batch.data['SIZE'][:batch.n].sum())
+                        else:
+                            n_events, nbytes = len(batch), batch.nbytes
+                        self.readout_metrics.record(t0, n_events, nbytes)
+                        self.tracker.track(nbytes, n_events)
 
                         # Notify controller/UI
                         if self.data_ready_callback:
                             self.data_ready_callback()
 
+                    except self.digitiser.errors.Error as e:
+                        # the board or its connection failed
+                        logging.exception(f"Acquisition error: {e}")
+                        self.fault(e)
                     except Exception as e:
+                        # anything else (e.g. a malformed buffer) costs this read only,
+                        # back off so that a persistent one doesn't flood the log
                         logging.exception(f"Acquisition error: {e}")
-
-                # to avoid busy digitiser - add software timeout as member variable
-                time.sleep(1)
+                        time.sleep(self.backoff)
+                        self.backoff = min(self.backoff * 2, self.backoff_max)
 
         except Exception as e:
             logging.exception(f"Fatal error in AcquisitionWorker: {e}")
 
-        # when stop_event() is set, call destructor of digitiser inside cleanup()
+        # when stop_event() is set, call destructor of digitiser inside cleanup(),
+        # then wait for every recorder to close its file, however long the disk takes
         self.cleanup()
+        for recorder in self.finishing:
+            recorder.join()
         logging.info("AcquisitionWorker thread exited cleanly.")
 
     def cleanup(self):
         '''
-        Cleans up digitiser by calling stop_acquisition and its destructor. 
+        Cleans up digitiser by calling stop_acquisition and its destructor, on EXIT,
+        reconnect or a readout fault (STOP keeps the connection, see stop_acquisition).
+        Any ongoing recording is stopped.
         '''
+        if len(self.digitisers) > 1:
+            for digitiser in self.digitisers:
+                if digitiser.isAcquiring:
+                    digitiser.stop_acquisition()
+            self.stop_boards()
+        self.stop_stages()
         if self.digitiser:
             if self.digitiser.isAcquiring:
                 self.digitiser.stop_acquisition()
             del self.digitiser
             self.digitiser = None
-        logging.info("Digitiser fully cleaned up after STOP.")
+        self.digitisers = []
+        logging.info("Digitiser connection closed.")
 
 
@@ -0,0 +1,70 @@
+'''
+Container for blocks of events read out of the digitiser in one go.
+'''
+import numpy as np
+
+import felib.formats as formats
+
+
+class EventBatch():
+    '''
+    A block of events stored as a single structured NumPy array (see formats.event_dtype).
+    Only the first n rows are valid, the remaining rows are preallocated space
+    that the next readout fills.
+    '''
+
+    def __init__(self, data : np.ndarray, n : int = 0):
+        self.data = data
+        self.n    = n
+
+    @classmethod
+    def empty(cls, capacity : int, record_length : int):
+        '''
+        Preallocate a block able to hold capacity events of record_length samples.
+        '''
+        return cls(np.zeros(capacity, dtype = formats.event_dtype(record_length)))
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    @property
+    def events(self):
+        return self.data[:self.n]
+
+    @property
+    def board(self):
+        return self.data['BOARD'][:self.n]
+
+    @property
+    def channel(self):
+        return self.data['CHANNEL'][:self.n]
+
+    @property
+    def timestamp(self):
+        return self.data['TIMESTAMP'][:self.n]
+
+    @property
+    def energy(self):
+        return self.data['ENERGY'][:self.n]
+
+    @property
+    def wf_size(self):
+        return self.data['WAVEFORM_SIZE'][:self.n]
+
+    @property
+    def waveforms(self):
+        return self.data['ANALOG_PROBE_1'][:self.n]
+
+    @property
+    def nbytes(self):
+        return self.n * self.data.dtype.itemsize
+
+    def copy(self):
+        '''
+        Copy the valid events into a new batch, leaving this block free to be refilled.
+        '''
+        return EventBatch(self.data[:self.n].copy(), self.n)
@@ -0,0 +1,155 @@
+'''
+Generation 1 (dig1://) DPP-PSD RAW data: vectorised decoding of the board's
+binary aggregates into structured event arrays (see formats.event_dtype), so
+buffers read undecoded from the RAW endpoint can be decoded later, on another
+thread or offline.
+
+The RAW endpoint returns whole board aggregates of little endian 32-bit words:
+
+    board aggregate header    [31:28] 0xA              [27:0] size in words, header included
+                              [31:27] board id         [26] board fail   [7:0] channel pair mask
+                              [22:0] aggregate counter
+                              [31:0] aggregate time tag
+    then for every pair of channels set in the mask
+    pair aggregate header     [31] 1                   [21:0] size in words, header included
+                              [30] charge   [28] extras   [27] samples
+                              [26:24] extras format   [15:0] number of samples / 8
+    event                     [31] odd channel         [30:0] trigger time tag
+                              samples, 2 per word, [13:0] and [29:16]   (if samples)
+                              [31:16] extended time tag [9:0] fine time (if extras, format 0b010)
+                              [31:16] charge long      [14:0] charge short (if charge)
+
+Events of a pair aggregate all have the same size, so each is decoded with
+whole-array operations, the only Python loops are over aggregates.
+
+The layout above follows the DPP-PSD documentation and has not been checked
+against buffers from a real board yet, so RAW readout of gen 1 boards is
+opt-in (raw_readout = True). Timestamps only reach beyond 31 bits if the board
+writes the extras word in the extended time tag format, and dual trace mode is
+not handled.
+'''
+import numpy as np
+
+import felib.formats as formats
+
+
+BOARD_HEADER_TYPE = 0xA
+BOARD_HEADER_SIZE = 4
+PAIR_HEADER_SIZE  = 2
+SAMPLE_MASK       = 0x3fff
+TTT_BITS          = 31
+EXTRAS_TIMESTAMP  = 0b010   # extras word holds the extended time tag and fine time
+
+
+def decode(buffer : np.ndarray, record_length : int) -> np.ndarray:
+    '''
+    Decode a RAW buffer (uint8, whole board aggregates) into an array of
+    formats.event_dtype, in time order.
+    '''
+    words = np.frombuffer(buffer, dtype = '<u4')
+    decoded = []
+    pos = 0
+    while pos < len(words):
+        header = int(words[pos])
+        size   = header & 0xfffffff
+        if header >> 28 != BOARD_HEADER_TYPE or size < BOARD_HEADER_SIZE:
+            raise ValueError(f'Invalid board aggregate header {header:#010x} at word {pos}.')
+        mask = int(words[pos + 1]) & 0xff
+        decoded.extend(decode_board_aggregate(words[pos + BOARD_HEADER_SIZE : pos + size], mask, record_length))
+        pos += size
+    if not decoded:
+        return np.zeros(0, dtype = formats.event_dtype(record_length))
+
+    # a board aggregate holds its events channel pair by channel pair
+    events = np.concatenate(decoded)
+    return events[np.argsort(events['TIMESTAMP'], kind = 'stable')]
+
+
+def decode_board_aggregate(body : np.ndarray, mask : int, record_length : int) -> list:
+    '''
+    Decode the pair aggregates of one board aggregate (the words after its header).
+    '''
+    decoded = []
+    pos = 0
+    for pair in range(8):
+        if not (mask >> pair) & 1 or pos >= len(body):
+            continue
+        size = int(body[pos]) & 0x3fffff
+        decoded.append(decode_pair_aggregate(body[pos : pos + size], pair, record_length))
+        pos += size
+    return decoded
+
+
+def decode_pair_aggregate(words : np.ndarray, pair : int, record_length : int) -> np.ndarray:
+    '''
+    Decode the events of one pair aggregate (header included).
+    '''
+    format     = int(words[1])
+    charge     = (format >> 30) & 1
+    extras     = (format >> 28) & 1
+    samples    = (format >> 27) & 1
+    extras_fmt = (format >> 24) & 0x7
+    n_samples  = 8 * (format & 0xffff) if samples else 0
+
+    size = 1 + n_samples // 2 + extras + charge
+    rows = words[PAIR_HEADER_SIZE:]
+    rows = rows[: len(rows) - len(rows) % size].reshape(-1, size)
+
+    events = np.zeros(len(rows), dtype = formats.event_dtype(record_length))
+    events['CHANNEL']   = 2 * pair + (rows[:, 0] >> 31)
+    timestamp = (rows[:, 0] & ((1 << TTT_BITS) - 1)).astype(np.uint64)
+    if extras and extras_fmt == EXTRAS_TIMESTAMP:
+        timestamp |= (rows[:, 1 + n_samples // 2] >> 16).astype(np.uint64) << TTT_BITS
+    events['TIMESTAMP'] = timestamp
+    if charge:
+        events['ENERGY'] = rows[:, -1] >> 16
+
+    if n_samples:
+        pairs = rows[:, 1 : 1 + n_samples // 2]
+        waveforms = np.stack((pairs & SAMPLE_MASK, (pairs >> 16) & SAMPLE_MASK), axis = 2).reshape(len(rows), -1)
+        n = min(n_samples, record_length)
+        events['ANALOG_PROBE_1'][:, :n] = waveforms[:, :n]
+        events['WAVEFORM_SIZE'] = n
+    return events
+
+
+def event_size(record_length : int) -> int:
+    '''
+    Bytes per encoded event with waveform, extras and charge.
+    '''
+    return 4 * (1 + -(-record_length // 8) * 4 + 2)
+
+
+def encode(events : np.ndarray, counter : int = 0, board_id : int = 0) -> bytes:
+    '''
+    Encode events (formats.event_dtype) as one board aggregate with waveforms,
+    extended time tags and charge. The inverse of decode, used by the simulated
+    gen 1 board.
+    '''
+    n_samples = 8 * -(-events['ANALOG_PROBE_1'].shape[1] // 8)
+    format    = (1 << 30) | (1 << 28) | (1 << 27) | (EXTRAS_TIMESTAMP << 24) | (n_samples // 8)
+
+    body, mask = [], 0
+    for pair in np.unique(events['CHANNEL'] // 2):
+        pair_events = events[events['CHANNEL'] // 2 == pair]
+        n = len(pair_events)
+        rows = np.zeros((n, 1 + n_samples // 2 + 2), dtype = np.uint32)
+        timestamp = pair_events['TIMESTAMP'].astype(np.uint64)
+        rows[:, 0] = ((pair_events['CHANNEL'].astype(np.uint32) & 1) << 31) | (timestamp & ((1 << TTT_BITS) - 1)).astype(np.uint32)
+
+        samples = np.zeros((n, n_samples), dtype = np.uint32)
+        samples[:, :pair_events['ANALOG_PROBE_1'].shape[1]] = pair_events['ANALOG_PROBE_1'].astype(np.uint32) & SAMPLE_MASK
+        rows[:, 1 : 1 + n_samples // 2] = samples[:, 0::2] | (samples[:, 1::2] << 16)
+        rows[:, -2] = ((timestamp >> TTT_BITS) & 0xffff).astype(np.uint32) << 16
+        rows[:, -1] = pair_events['ENERGY'].astype(np.uint32) << 16
+
+        body.append(np.array([(1 << 31) | (rows.size + PAIR_HEADER_SIZE), format], dtype = np.uint32))
+        body.append(rows.ravel())
+        mask |= 1 << int(pair)
+
+    body = np.concatenate(body) if body else np.zeros(0, dtype = np.uint32)
+    header = np.array([(BOARD_HEADER_TYPE << 28) | (len(body) + BOARD_HEADER_SIZE),
+                       ((board_id & 0x1f) << 27) | mask,
+                       counter & 0x7fffff,
+                       0], dtype = np.uint32)
+    return np.concatenate((header, body)).astype('<u4').tobytes()
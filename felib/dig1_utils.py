@@ -18,16 +18,24 @@ def generate_digitiser_uri(dig_gen           :  int,
 
         dig_gen (int)           :  The digitiser generation (1 or 2)
         con_type (str)          :  The connection type (e.g., 'USB', 'VME', 'CONET')
-        link_num (int)          :  The link number for the connection
+        link_num (int)          :  The link number for the connection (the USB PID for gen 2)
         conet_node (int)        :  The CONET node number (default is 0)
         vme_base_address (int)  :  The VME base address (default is 0)
-        dig_authority (str)     :  The authority for the digitiser (default is 'caen.internal')
+        dig_authority (str)     :  The authority for the digitiser (default is 'caen.internal'),
+                                   for gen 2 over ethernet its host name or IP
 
     Returns:
     -------
         str: A URI string representing the digitiser connection.
     """
     dig_scheme = f'dig{dig_gen}'
+
+    # gen 2 boards are addressed by host name or IP, or by their USB PID
+    if dig_gen == 2:
+        if con_type.lower() in ('eth', 'ethernet'):
+            return f'{dig_scheme}://{dig_authority}'
+        return f'{dig_scheme}://{dig_authority}/{con_type}/{link_num}'
+
     dig_path   = f'{con_type}'
     dig_query = f'link_num={link_num}&conet_node={conet_node}&vme_base_address={vme_base_address}'
 
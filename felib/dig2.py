@@ -0,0 +1,125 @@
+'''
+Generation 2 (dig2://) DPP RAW data: vectorised decoding of the board's binary
+aggregates into structured event arrays (see formats.event_dtype), so gen 2
+boards feed the same pipeline as gen 1.
+
+The RAW endpoint returns whole aggregates of big endian 64-bit words:
+
+    aggregate header   [63:60] format (0x2, DPP)   [56] board fail
+                       [47:32] aggregate counter   [31:0] size in words, header included
+    event word 0       [62:56] channel             [47:0] timestamp
+    event word 1       [62] waveform present       [41:26] energy short
+                       [25:16] fine timestamp      [15:0] energy
+    waveform header    [11:0] number of waveform words (only if waveform present)
+    waveform words     4 samples of 16 bits each, the first in [15:0], ADC value in [13:0]
+
+Every aggregate is decoded with whole-array operations, the only Python loop
+is over aggregates (and over events only if their sizes differ within one).
+'''
+import numpy as np
+
+import felib.formats as formats
+
+
+DPP_FORMAT       = 0x2
+SAMPLES_PER_WORD = 4
+SAMPLE_MASK      = 0x3fff
+TIMESTAMP_MASK   = (1 << 48) - 1
+
+
+def decode(buffer : np.ndarray, record_length : int) -> np.ndarray:
+    '''
+    Decode a RAW buffer (uint8, whole aggregates) into an array of formats.event_dtype.
+    '''
+    words = np.frombuffer(buffer, dtype = '>u8').astype(np.uint64)
+    decoded = []
+    pos = 0
+    while pos < len(words):
+        header = int(words[pos])
+        size   = header & 0xffffffff
+        if header >> 60 != DPP_FORMAT or size == 0:
+            raise ValueError(f'Invalid aggregate header {header:#018x} at word {pos}.')
+        decoded.append(decode_aggregate(words[pos + 1 : pos + size], record_length))
+        pos += size
+    if not decoded:
+        return np.zeros(0, dtype = formats.event_dtype(record_length))
+    return np.concatenate(decoded)
+
+
+def event_size(body : np.ndarray, start : int) -> int:
+    '''
+    Number of words of the event starting at start.
+    '''
+    if (int(body[start + 1]) >> 62) & 1:
+        return 3 + (int(body[start + 2]) & 0xfff)
+    return 2
+
+
+def decode_aggregate(body : np.ndarray, record_length : int) -> np.ndarray:
+    '''
+    Decode the events of one aggregate (the words after its header).
+    '''
+    if len(body) < 2:
+        return np.zeros(0, dtype = formats.event_dtype(record_length))
+
+    # events of one aggregate normally share their size, then they are just rows
+    size = event_size(body, 0)
+    if len(body) % size == 0:
+        rows = body.reshape(-1, size)
+        waveform = (rows[:, 1] >> np.uint64(62)) & np.uint64(1)
+        if np.all(waveform == (size > 2)) and (size == 2 or np.all(rows[:, 2] & np.uint64(0xfff) == size - 3)):
+            return decode_events(rows, record_length)
+
+    # otherwise split them up first, grouping events of equal size
+    starts, sizes = [], []
+    pos = 0
+    while pos < len(body):
+        starts.append(pos)
+        sizes.append(event_size(body, pos))
+        pos += sizes[-1]
+    starts, sizes = np.array(starts), np.array(sizes)
+    events = np.zeros(len(starts), dtype = formats.event_dtype(record_length))
+    for size in np.unique(sizes):
+        idx = np.flatnonzero(sizes == size)
+        rows = body[starts[idx, None] + np.arange(size)]
+        events[idx] = decode_events(rows, record_length)
+    return events
+
+
+def decode_events(rows : np.ndarray, record_length : int) -> np.ndarray:
+    '''
+    Decode a (n_events, words per event) block of equally sized events.
+    '''
+    events = np.zeros(len(rows), dtype = formats.event_dtype(record_length))
+    events['CHANNEL']   = (rows[:, 0] >> 56) & 0x7f
+    events['TIMESTAMP'] = rows[:, 0] & TIMESTAMP_MASK
+    events['ENERGY']    = rows[:, 1] & 0xffff
+
+    if rows.shape[1] > 2:
+        shifts  = np.arange(SAMPLES_PER_WORD, dtype = np.uint64) * 16
+        samples = ((rows[:, 3:, None] >> shifts) & SAMPLE_MASK).reshape(len(rows), -1)
+        n = min(samples.shape[1], record_length)
+        events['ANALOG_PROBE_1'][:, :n] = samples[:, :n]
+        events['WAVEFORM_SIZE'] = n
+    return events
+
+
+def encode(events : np.ndarray, counter : int = 0) -> bytes:
+    '''
+    Encode events (formats.event_dtype, all with waveforms) as one RAW aggregate.
+    The inverse of decode, used by the simulated gen 2 board.
+    '''
+    n  = len(events)
+    nw = -(-events['ANALOG_PROBE_1'].shape[1] // SAMPLES_PER_WORD)
+    rows = np.zeros((n, 3 + nw), dtype = np.uint64)
+    rows[:, 0] = (events['CHANNEL'].astype(np.uint64) << 56) | (events['TIMESTAMP'].astype(np.uint64) & TIMESTAMP_MASK)
+    rows[:, 1] = (1 << 62) | events['ENERGY'].astype(np.uint64)
+    rows[:, 2] = nw
+
+    samples = np.zeros((n, nw * SAMPLES_PER_WORD), dtype = np.uint64)
+    samples[:, :events['ANALOG_PROBE_1'].shape[1]] = events['ANALOG_PROBE_1'].astype(np.uint64) & SAMPLE_MASK
+    shifts = np.arange(SAMPLES_PER_WORD, dtype = np.uint64) * 16
+    rows[:, 3:] = np.bitwise_or.reduce(samples.reshape(n, nw, SAMPLES_PER_WORD) << shifts, axis = 2)
+
+    header = (DPP_FORMAT << 60) | ((counter & 0xffff) << 32) | (rows.size + 1)
+    return np.concatenate(([np.uint64(header)], rows.ravel())).astype('>u8').tobytes()
@@ -9,10 +9,21 @@ from typing import Optional
 import time
 
 from felib.dig1_utils import generate_digitiser_uri
+from felib.batch import EventBatch
+from felib.swtrigger import SWTrigger
 
 import felib.formats as formats
+import felib.dig1 as dig1
+import felib.dig2 as dig2
+import felib.simulator as simulator
 
-from caen_felib import lib, device, error
+
+# largest RAW buffer read at once: about 40 ms of data at 100 MB/s
+RAW_BUFFER_BYTES = 4 * 1024 * 1024
+
+# parameters written by configure that invalidate the ADC calibration when changed
+# (channel offsets and input ranges would too, but are not set from the config)
+CALIBRATION_PARAMETERS = {'CH_ENABLED'}
 
 
 class Digitiser():
@@ -24,21 +35,18 @@ class Digitiser():
         self.dig_dict = dig_dict
         self.dig_name = dig_dict.get('dig_name')
         self.dig_gen = int(dig_dict.get('dig_gen'))
+        self.board = 0   # index of this board when several are read out together
 
         # check for debugger
         if self.dig_name == 'debug':
-            logging.debug('Debugging mode enabled. Digitiser will fake connection')
+            logging.debug('Debugging mode enabled. Digitiser will be simulated')
 
-        if self.dig_gen == 1:
+        if self.dig_gen in (1, 2):
             self.con_type = dig_dict.get('con_type')
             self.link_num = int(dig_dict.get('link_num', 0))
             self.conet_node = int(dig_dict.get('conet_node', 0))
             self.vme_base_address = dig_dict.get('vme_base_address', 0)
             self.dig_authority = dig_dict.get('dig_authority', 'caen.internal')
-        elif self.dig_gen == 2:
-            # not implemented yet, raise error
-            logging.error("Digitiser generation 2 not implemented yet.")
-            #raise NotImplementedError("Digitiser generation 2 not implemented yet.")
         else:
             logging.error("Invalid digitiser generation specified in the configuration.")
             #raise ValueError("Invalid digitiser generation specified in the configuration.")
@@ -50,6 +58,21 @@ class Digitiser():
         
         self.data_format = []
         self.endpoint = None
+        self.batch = None
+        self.sw_trigger = None
+
+        # gen 2 boards (and gen 1 DPP-PSD boards with raw_readout = True) are read out through the
+        # RAW endpoint. Buffers are decoded here, or passed on undecoded if deferred
+        self.raw = self.dig_gen == 2
+        self.deferred = False
+        self.decode = dig2.decode if self.dig_gen == 2 else dig1.decode
+        self.decoded = None
+
+        # parameter values written since the last RESET, (node, parameter) -> value,
+        # so a reconfiguration only writes what changed
+        self.applied = {}
+        self.written = []
+        self.calibrated = False
 
     def generate_uri(self):
         '''
@@ -57,7 +80,7 @@ class Digitiser():
         This is a wrapper for the generate_digitiser_uri function.
         '''
         # generate URI for each generation
-        if self.dig_gen == 1:
+        if self.dig_gen in (1, 2):
             return generate_digitiser_uri(
                 dig_gen=self.dig_gen,
                 con_type=self.con_type,
@@ -66,11 +89,6 @@ class Digitiser():
                 vme_base_address=self.vme_base_address,
                 dig_authority=self.dig_authority
             )
-        elif self.dig_gen == 2:
-            # not implemented yet, raise error
-            # you should never reach this code
-            logging.error("Digitiser generation 2 not implemented yet.")
-            #raise NotImplementedError("Digitiser generation 2 not implemented yet.")
         else:
             logging.error("Invalid digitiser generation specified in the configuration.")
             #raise ValueError("Invalid digitiser generation specified in the configuration.")
@@ -83,30 +101,36 @@ class Digitiser():
         
         logging.info(f'Attemping connection to digitiser {self.dig_name} at {self.URI}.')
         
-        # fake connection for debugging
-        if self.dig_name == 'debug':
-            self.dig = None
-            self.isConnected = True
-            self.dig_info = {
-                'n_ch'        : 4,
-                'sample_rate' : 1000,
-                'ADCs'        : 12,
-                'firmware'    : 'debug',
-            }
-            logging.info(f'Digitiser connected in debug mode.\n{self.dig_info}')
-            return None
-
         try:
-            self.dig = device.connect(self.URI)
+            # simulated device for debugging, behaves like a real board from here on
+            if self.dig_name == 'debug':
+                self.dig    = simulator.SimDevice(self.dig_dict)
+                self.errors = simulator
+            else:
+                # CAEN FELib is only loaded (and only needs to be installed) for real boards
+                from caen_felib import device, error
+                self.dig    = device.connect(self.URI)
+                self.errors = error
             self.dig.cmd.RESET()
+            # the board is back to its defaults
+            self.applied = {}
+            self.calibrated = False
             self.isConnected = True
             # extract relevant information from the digitiser
-            self.dig_info = {
-                'n_ch'        : int(self.dig.par.NUMCH.value),
-                'sample_rate' : float(self.dig.par.ADC_SAMPLRATE.value), # Msps
-                'ADCs'        : int(self.dig.par.ADC_NBIT.value),
-                'firmware'    : self.dig.par.FWTYPE.value,
-            }
+            if self.dig_gen == 2:
+                self.dig_info = {
+                    'n_ch'        : int(self.dig.par.NumCh.value),
+                    'sample_rate' : float(self.dig.par.ADC_SamplRate.value), # Msps
+                    'ADCs'        : int(self.dig.par.ADC_Nbit.value),
+                    'firmware'    : self.dig.par.FwType.value,
+                }
+            else:
+                self.dig_info = {
+                    'n_ch'        : int(self.dig.par.NUMCH.value),
+                    'sample_rate' : float(self.dig.par.ADC_SAMPLRATE.value), # Msps
+                    'ADCs'        : int(self.dig.par.ADC_NBIT.value),
+                    'firmware'    : self.dig.par.FWTYPE.value,
+                }
             logging.info(f'Digitiser connected.\n{self.dig_info}')
         except Exception as e:
             logging.exception(f"Failed to connect to digitiser.")
@@ -122,21 +146,28 @@ class Digitiser():
                   #trigger_level: Optional[str] = 'SWTRG'):
         '''
         Configure the digitiser with the provided settings and calibrate it.
+        Only parameters that differ from the applied configuration are written,
+        and the ADC is only recalibrated when one of CALIBRATION_PARAMETERS changed.
         '''        
 
         self.record_length = rec_dict.get('record_length')
         self.pre_trigger   = rec_dict.get('pre_trigger')
         self.trigger_mode  = rec_dict.get('trigger_mode')
+        self.batch_size    = int(rec_dict.get('batch_size', 256)) # max events per readout
+        self.written       = []
+
+        if self.dig_gen == 2:
+            return self.configure_dig2(rec_dict)
 
         try:
 
-            self.dig.par.RECLEN.value = f'{self.record_length}'
-            self.dig.par.STARTMODE.value = 'START_MODE_SW' # currently only software modes enabled
+            self.write('board', self.dig, 'RECLEN', self.record_length)
+            self.write('board', self.dig, 'STARTMODE', 'START_MODE_SW') # currently only software modes enabled
             match self.trigger_mode:
                 case 'SWTRIG':
-                    self.dig.par.TRG_SW_ENABLE.value = 'TRUE'
+                    self.write('board', self.dig, 'TRG_SW_ENABLE', 'TRUE')
                 case _:
-                    self.dig.par.TRG_SW_ENABLE.value = 'FALSE'
+                    self.write('board', self.dig, 'TRG_SW_ENABLE', 'FALSE')
 
             # configure channels
             for i, ch in enumerate(self.dig.ch):
@@ -147,24 +178,25 @@ class Digitiser():
                 if ch_dict is None:
                     continue
                 
-                ch.par.CH_ENABLED.value      = 'TRUE' if ch_dict['enabled'] else 'FALSE'
-                ch.par.CH_PRETRG.value = f'{self.pre_trigger}'
+                node = f'ch{i}'
+                self.write(node, ch, 'CH_ENABLED', 'TRUE' if ch_dict['enabled'] else 'FALSE')
+                self.write(node, ch, 'CH_PRETRG', self.pre_trigger)
 
                 # ensure self trigger only enabled when you don't have SWTRIG enabled
                 if ch_dict['self_trigger'] and self.trigger_mode != 'SWTRIG':
-                    ch.par.CH_SELF_TRG_ENABLE.value = 'TRUE'
-                    ch.par.CH_THRESHOLD.value       = str(ch_dict['threshold'])
+                    self.write(node, ch, 'CH_SELF_TRG_ENABLE', 'TRUE')
+                    self.write(node, ch, 'CH_THRESHOLD', ch_dict['threshold'])
                 else:
                     # doesn't reset by default! so forcing this here
-                    ch.par.CH_SELF_TRG_ENABLE.value = 'FALSE'
+                    self.write(node, ch, 'CH_SELF_TRG_ENABLE', 'FALSE')
                 
                 if ch_dict['polarity'] == 'positive':
-                    ch.par.CH_POLARITY.value        = 'POLARITY_POSITIVE'
+                    self.write(node, ch, 'CH_POLARITY', 'POLARITY_POSITIVE')
                 elif ch_dict['polarity'] == 'negative':
-                    ch.par.CH_POLARITY.value        = 'POLARITY_NEGATIVE'
+                    self.write(node, ch, 'CH_POLARITY', 'POLARITY_NEGATIVE')
 
                 else:
-                    ch.par.CH_SELF_TRG_ENABLE.value = 'FALSE'
+                    self.write(node, ch, 'CH_SELF_TRG_ENABLE', 'FALSE')
                 # technically customisable
                 
 
@@ -173,38 +205,150 @@ class Digitiser():
             reclen_ns = int(self.dig.par.RECLEN.value)
             self.reclen    = int(reclen_ns / int(1e3 / self.dig_info['sample_rate']))
 
+            # whole board buffers from the RAW endpoint, many events per read, decoded
+            # vectorised (felib.dig1). Opt-in until felib.dig1 is validated on a board
+            self.raw = bool(rec_dict.get('raw_readout', False))
+            if self.raw:
+                self.write('board', self.dig, 'WAVEFORMS', 'TRUE')
+                self.write('vtrace0', self.dig.vtrace[0], 'VTRACE_PROBE', 'VPROBE_INPUT')
+                self.configure_raw(rec_dict)
             # if DPP, need to specify that you're looking at waveforms specifically.
-            if self.dig.par.FWTYPE.value == 'DPP-PSD':
-                self.dig.par.WAVEFORMS.value = 'TRUE'
+            elif self.dig.par.FWTYPE.value == 'DPP-PSD':
+                self.write('board', self.dig, 'WAVEFORMS', 'TRUE')
                 self.data_format = formats.DPP(int(self.dig.par.NUMCH.value), int(self.reclen))
                 # setting up probe types (READ UP ON THIS)
-                self.dig.vtrace[0].par.VTRACE_PROBE.value = 'VPROBE_INPUT'
+                self.write('vtrace0', self.dig.vtrace[0], 'VTRACE_PROBE', 'VPROBE_INPUT')
             
-            endpoint_path = (self.dig.par.FWTYPE.value).replace('-', '')
-            self.endpoint = self.dig.endpoint[endpoint_path]
-            self.data = self.endpoint.set_read_data_format(self.data_format)
+            if not self.raw:
+                endpoint_path = (self.dig.par.FWTYPE.value).replace('-', '')
+                self.endpoint = self.dig.endpoint[endpoint_path]
+                self.data = self.endpoint.set_read_data_format(self.data_format)
 
+            self.prepare_readout(rec_dict)
         
-            logging.info(f"Digitiser configured:\nrecord length {self.record_length}, pre-trigger {self.pre_trigger}, trigger mode {self.trigger_mode}.")
+            logging.info(f"Digitiser configured ({len(self.written)} parameters written):\nrecord length {self.record_length}, pre-trigger {self.pre_trigger}, trigger mode {self.trigger_mode}.")
         except Exception as e:
             logging.exception(f"Failed to configure recording parameters.\n{e}")
 
+        if self.calibrated and not CALIBRATION_PARAMETERS.intersection(self.written):
+            logging.info("Calibration unaffected by the changes, not recalibrating.")
+            return
 
         try:
             self.dig.cmd.CALIBRATEADC()
+            self.calibrated = True
             logging.info("Digitiser calibrated.")
         except Exception as e:
             logging.exception(f"Failed to calibrate digitiser.\n{e}")
             #raise RuntimeError(f"Failed to calibrate digitiser.\n{e}")
 
 
+    def configure_dig2(self, rec_dict : dict):
+        '''
+        Configure a gen 2 board (DPP firmware) and its RAW endpoint. The gen 2
+        parameter tree differs from gen 1: lengths are set per channel in ns.
+        '''
+        try:
+            self.write('board', self.dig, 'StartSource', 'SWcmd')
+            match self.trigger_mode:
+                case 'SWTRIG':
+                    self.write('board', self.dig, 'AcqTriggerSource', 'SwTrg')
+                    trigger_source = 'SWTrigger'
+                case _:
+                    self.write('board', self.dig, 'AcqTriggerSource', 'ITLA')
+                    trigger_source = 'ChSelfTrigger'
+
+            for i, ch in enumerate(self.dig.ch):
+                ch_dict = rec_dict.get(f'ch{i}')
+                if ch_dict is None:
+                    continue
+
+                node = f'ch{i}'
+                self.write(node, ch, 'ChEnable',           'True' if ch_dict['enabled'] else 'False')
+                self.write(node, ch, 'ChRecordLengthT',    self.record_length)
+                self.write(node, ch, 'ChPreTriggerT',      self.pre_trigger)
+                self.write(node, ch, 'EventTriggerSource', trigger_source)
+                self.write(node, ch, 'WaveTriggerSource',  trigger_source)
+                self.write(node, ch, 'TriggerThr',         ch_dict.get('threshold', 0))
+                self.write(node, ch, 'PulsePolarity',      'Negative' if ch_dict.get('polarity') == 'negative' else 'Positive')
+
+            # record length in samples
+            self.reclen = int(int(self.record_length) / int(1e3 / self.dig_info['sample_rate']))
+
+            self.configure_raw(rec_dict)
+            self.prepare_readout(rec_dict)
+            logging.info(f"Gen 2 digitiser configured ({len(self.written)} parameters written):\nrecord length {self.record_length}, pre-trigger {self.pre_trigger}, trigger mode {self.trigger_mode}.")
+        except Exception as e:
+            logging.exception(f"Failed to configure recording parameters.\n{e}")
+
+    def write(self, node : str, tree, parameter : str, value) -> bool:
+        '''
+        Set a parameter of tree (the board, a channel, vtrace or the endpoint folder,
+        named node in the applied configuration), unless it already holds value.
+        Returns whether the parameter was written.
+        '''
+        value = str(value)
+        if self.applied.get((node, parameter)) == value:
+            return False
+        getattr(tree.par, parameter).value = value
+        self.applied[(node, parameter)] = value
+        self.written.append(parameter)
+        return True
+
+    def configure_raw(self, rec_dict : dict):
+        '''
+        Read whole board aggregates from the RAW endpoint. With raw_decode = 'inline'
+        they are decoded as they are read out, otherwise ('stage' or 'offline') the
+        buffers are handed out undecoded (see read_raw).
+        '''
+        self.raw_buffer_bytes = int(rec_dict.get('raw_buffer_bytes', RAW_BUFFER_BYTES))
+        self.write('endpoint', self.dig.endpoint, 'ActiveEndpoint', 'RAW')
+        self.endpoint = self.dig.endpoint['RAW']
+        self.data = self.endpoint.set_read_data_format(formats.RAW(self.raw_buffer_bytes))
+        self.decoded = None
+
+        raw_decode = rec_dict.get('raw_decode', 'inline')
+        if raw_decode not in ('inline', 'stage', 'offline'):
+            logging.warning(f"Unknown raw_decode '{raw_decode}', defaulting to 'inline'.")
+            raw_decode = 'inline'
+        self.deferred = raw_decode != 'inline'
+        logging.info(f"RAW readout with {raw_decode} decoding ({self.raw_buffer_bytes} byte buffers).")
+
+    def prepare_readout(self, rec_dict : dict):
+        '''
+        Set up software triggering and the readout buffers once the endpoint is configured.
+        '''
+        # software triggers are sent ahead of the readout, at the configured rate
+        if self.trigger_mode == 'SWTRIG':
+            n_enabled = sum(1 for i in range(len(self.dig.ch))
+                            if (rec_dict.get(f'ch{i}') or {}).get('enabled'))
+            self.sw_trigger = SWTrigger(self.dig.cmd.SENDSWTRIGGER,
+                                        mode               = rec_dict.get('sw_trigger_mode', 'single'),
+                                        rate               = float(rec_dict.get('sw_trigger_rate', 1000)),
+                                        burst              = int(rec_dict.get('sw_trigger_burst', 1)),
+                                        max_in_flight      = int(rec_dict.get('sw_trigger_max_in_flight', self.batch_size)),
+                                        events_per_trigger = n_enabled,
+                                        expiry             = float(rec_dict.get('sw_trigger_expiry', 1.0)))
+
+        # preallocate the default batch block and note which endpoint buffers it holds
+        self.batch = EventBatch.empty(self.batch_size, self.reclen)
+        self.batch_fields = [(d.name, d.value) for d in self.data
+                             if d.name in self.batch.data.dtype.names]
+
     def start_acquisition(self):
         '''
         Start the digitiser acquisition.
         '''
         self.isAcquiring = True
+        self.decoded = None
         try:
             self.dig.cmd.ARMACQUISITION()
+            # gen 2 boards start on a separate software command
+            if self.dig_gen == 2:
+                self.dig.cmd.SWSTARTACQUISITION()
+            # triggers sent before the board is armed would be lost
+            if self.sw_trigger is not None:
+                self.sw_trigger.start()
         except Exception as e:
             logging.exception(f"Starting acquisition failed: {e}")
         
@@ -226,67 +370,155 @@ class Digitiser():
         #self.dig.cmd.STOP() # This in reality looks like dig.cmd.DISARMACQUISITION()
         try:
             self.isAcquiring = False
+            if self.sw_trigger is not None:
+                self.sw_trigger.stop()
             self.dig.cmd.DISARMACQUISITION()
             logging.info("Digitiser acquisition stopped.")
+            if self.sw_trigger is not None:
+                report = self.sw_trigger.report()
+                requested = f"{report['requested']:.1f} Hz" if report['requested'] else report['mode']
+                logging.info(f"Software triggers: requested {requested}, sent {report['sent']:.1f} Hz, "
+                             f"achieved {report['achieved']:.1f} Hz ({report['triggers']} triggers, {report['events']} events, "
+                             f"{report['expired']} triggers without events).")
         except Exception as e:
             logging.exception("Stopping acsquisition failed:")
 
-    def acquire(self):
+    def acquire(self, timeout : int = 100, out : Optional[EventBatch] = None):
+        '''
+        Read out the digitiser using the configured trigger mode.
+        timeout is the time (ms) to block waiting for data, 0 polls the endpoint.
+        Events are written into out (e.g. a block reserved in a ring buffer) or,
+        if not given, into the digitiser's own batch which is reused by the next readout.
+        Returns the filled EventBatch, or None if no data arrived within the timeout.
+        '''
         match self.trigger_mode:
             case 'SWTRIG':
-                return self.SW_record()
+                return self.SW_record(timeout, out)
             case 'SELFTRIG':
-                return self.SELFTRIG_record()
+                return self.SELFTRIG_record(timeout, out)
             case _:
                 logging.info(f'Trigger mode {self.trigger_mode} not currently implemented.')
                 self.stop_acquisition()    
 
 
-    def SW_record(self):
+    def read_batch(self, check_timeout : int = 100, out : Optional[EventBatch] = None):
         '''
-        Send software trigger and read the data out.
+        Drain events from the endpoint into out (default: the preallocated batch)
+        until it is full. Blocks for up to check_timeout ms for the first event,
+        then reads whatever is already buffered without waiting.
+
+        By default the decoded DPP endpoint is read, and FELib only returns one
+        event per read_data call on it: that path costs an FFI call and a copy
+        per field for every event, and is not a batched readout. With
+        raw_readout = True (and always for gen 2) the RAW endpoint is read
+        instead (read_raw_batch), a whole board buffer per call.
         '''
-        check_timeout = 100
-        read_timeout  = 50
-        self.dig.cmd.SENDSWTRIGGER()
+        batch  = self.batch if out is None else out
+
+        if self.deferred:
+            return self.read_raw(check_timeout, out)
+        if self.raw:
+            return self.read_raw_batch(check_timeout, batch)
+
+        fields = [(batch.data[name], value) for name, value in self.batch_fields]
+        read_timeout = 50
+        n = 0
         try:
             self.endpoint.has_data(check_timeout)
-            self.endpoint.read_data(read_timeout, self.data) # timeout first number in ms
-            return (self.data[7].value, self.data[3].value)
-        except error.Error as ex:
-            #logging.exception("Error in readout:")
-            if ex.code is error.ErrorCode.TIMEOUT:
-                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
-            if ex.code is error.ErrorCode.STOP:
+            while n < batch.capacity:
+                self.endpoint.read_data(read_timeout if n == 0 else 0, self.data)
+                for block, value in fields:
+                    block[n] = value
+                n += 1
+        except self.errors.Error as ex:
+            if ex.code is self.errors.ErrorCode.STOP:
                 logging.exception("STOP")
                 raise ex
-        
-        # ensure the input and trigger are acceptable (I think?)
-        #assert self.data[3].value == 1 # VPROBE INPUT? I need to understand this
-        #assert self.data[6].value == 1 # VPROBE TRIGGER?
-        
-        #waveform_size = self.data[7].value
-        #valid_sample_range = np.arange(0, waveform_size, dtype = waveform_size.dtype)
+            if ex.code is not self.errors.ErrorCode.TIMEOUT:
+                logging.exception("Error in readout:")
 
-        
-    
-    def SELFTRIG_record(self):
+        batch.n = n
+        batch.board[:] = self.board
+        return batch if n > 0 else None
+
+    def read_buffer(self, check_timeout : int = 100) -> bool:
         '''
-        Trigger on channels
+        Read one RAW buffer into the endpoint data, blocking for up to check_timeout ms.
+        Returns whether a buffer arrived.
         '''
-        check_timeout = 100
-        read_timeout  = 50
         try:
-            self.endpoint.has_data(check_timeout)
-            self.endpoint.read_data(read_timeout, self.data)
-            return (self.data[7].value, self.data[3].value)
-        except error.Error as ex:
-            #logging.exception("Error in readout:")
-            if ex.code is error.ErrorCode.TIMEOUT:
-                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
-            if ex.code is error.ErrorCode.STOP:
+            self.endpoint.read_data(check_timeout, self.data)
+        except self.errors.Error as ex:
+            if ex.code is self.errors.ErrorCode.STOP:
                 logging.exception("STOP")
                 raise ex
+            if ex.code is not self.errors.ErrorCode.TIMEOUT:
+                logging.exception("Error in readout:")
+            return False
+        return int(self.data[1].value) > 0
+
+    def read_raw(self, check_timeout : int = 100, out : Optional[EventBatch] = None):
+        '''
+        Read one RAW buffer undecoded into out, a block of formats.raw_buffer_dtype
+        rows (e.g. reserved in a ring buffer). Returns the filled batch of one
+        buffer, or None if no data arrived within the timeout.
+        '''
+        if not self.read_buffer(check_timeout):
+            return None
+        size = int(self.data[1].value)
+        row  = out.data[0]
+        if size > len(row['DATA']):
+            logging.error(f"RAW buffer of {size} bytes doesn't fit the {len(row['DATA'])} byte slot, dropped.")
+            return None
+        row['DATA'][:size] = self.data[0].value[:size]
+        row['SIZE']        = size
+        row['N_EVENTS']    = self.data[2].value
+        row['BOARD']       = self.board
+        out.n = 1
+        return out
+
+    def read_raw_batch(self, check_timeout : int = 100, out : Optional[EventBatch] = None):
+        '''
+        Read a RAW buffer, decode it in one go, and hand out its events a batch at
+        a time. Blocks for up to check_timeout ms only when no decoded events are left.
+        '''
+        batch = self.batch if out is None else out
+        if self.decoded is None or len(self.decoded) == 0:
+            if not self.read_buffer(check_timeout):
+                return None
+            size = int(self.data[1].value)
+            self.decoded = self.decode(self.data[0].value[:size], self.reclen)
+
+        n = min(len(self.decoded), batch.capacity)
+        batch.data[:n] = self.decoded[:n]
+        self.decoded = self.decoded[n:]
+        batch.n = n
+        batch.board[:] = self.board
+        return batch if n > 0 else None
+
+    def SW_record(self, check_timeout : int = 100, out : Optional[EventBatch] = None):
+        '''
+        Read out the events of the software triggers. In 'single' mode this sends
+        one trigger per readout and waits for its data, the other modes send
+        their triggers on the SWTrigger thread.
+        '''
+        if self.sw_trigger.mode == 'single':
+            self.sw_trigger.fire()
+        batch = self.read_batch(check_timeout, out)
+        if batch is None:
+            if self.sw_trigger.mode == 'single':
+                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
+            return None
+        # undecoded buffers hold many events each
+        self.sw_trigger.count(int(batch.data['N_EVENTS'][:batch.n].sum()) if self.deferred else len(batch))
+        return batch
+
+    def SELFTRIG_record(self, check_timeout : int = 100, out : Optional[EventBatch] = None):
+        '''
+        Trigger on channels. Blocks on the endpoint for up to check_timeout ms,
+        no data within the timeout is not an error (the channels simply didn't trigger).
+        '''
+        return self.read_batch(check_timeout, out)
 
 
     def __del__(self):
@@ -1,4 +1,5 @@
 # location for defining all the data formats of the differing firmwares
+import numpy as np
 
 def DPP(nch, record_length):
     '''
@@ -52,4 +53,63 @@ def DPP(nch, record_length):
         }
     ]
 
-    return data_format
\ No newline at end of file
+    return data_format
+
+
+def RAW(max_size):
+    '''
+    RAW endpoint format, whole undecoded board buffers
+    max_size - largest buffer in bytes
+    '''
+    data_format = [
+        {
+            'name': 'DATA',
+            'type': 'U8',
+            'dim' : 1,
+            'shape': [max_size],
+        },
+        {
+            'name': 'SIZE',
+            'type': 'SIZE_T',
+            'dim': 0,
+        },
+        {
+            'name': 'N_EVENTS',
+            'type': 'U32',
+            'dim': 0,
+        }
+    ]
+
+    return data_format
+
+
+def event_dtype(record_length):
+    '''
+    NumPy structured dtype of a single decoded event, used to hold batches
+    of events (see felib.batch.EventBatch). Field names follow the
+    endpoint data formats above, BOARD is the index of the digitiser the
+    event came from when several are read out together.
+    record_length - number of samples per waveform
+    '''
+    return np.dtype([
+        ('BOARD',          np.uint8),
+        ('CHANNEL',        np.uint8),
+        ('TIMESTAMP',      np.uint64),
+        ('ENERGY',         np.uint16),
+        ('WAVEFORM_SIZE',  np.uint64),
+        ('ANALOG_PROBE_1', np.int16, (record_length,)),
+    ])
+
+
+def raw_buffer_dtype(max_size):
+    '''
+    NumPy structured dtype of one undecoded RAW endpoint buffer, used to pass
+    buffers between the readout, the decoder and the writer.
+    max_size - largest buffer in bytes
+    '''
+    return np.dtype([
+        ('BOARD',    np.uint8),
+        ('N_EVENTS', np.uint32),
+        ('SIZE',     np.uint64),
+        ('DATA',     np.uint8, (max_size,)),
+    ])
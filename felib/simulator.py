@@ -0,0 +1,417 @@
+'''
+Simulated digitiser used when dig_name = 'debug'.
+
+Mimics the parts of the CAEN FELib device tree that CARP uses (par/cmd trees,
+channels, vtraces and the DPP-PSD endpoint with has_data and read_data), and
+generates synthetic pulses so the full pipeline can run, be profiled and be
+load-tested without any CAEN hardware or library installed. With dig_gen = 2
+it uses the gen 2 parameter names. Both generations also serve the pulses as
+RAW aggregates (see felib.dig1 and felib.dig2) through the RAW endpoint.
+
+Simulation settings are read from the digitiser config:
+    sim_n_ch         number of channels                       (default 4)
+    sim_sample_rate  sampling rate in Msps                     (default 500)
+    sim_adc_bits     ADC resolution                            (default 14)
+    sim_rate         total trigger rate over all channels, Hz  (default 1000)
+    sim_amplitude    mean pulse amplitude, ADCs                (default 2000)
+    sim_spread       relative spread of the amplitude          (default 0.2)
+    sim_noise        gaussian noise, ADCs rms                  (default 5)
+    sim_baseline     baseline, ADCs                            (default 1000)
+    sim_rise         pulse rise time constant, ns              (default 10)
+    sim_decay        pulse decay time constant, ns             (default 200)
+    sim_buffer       events the board buffers before losing triggers (default 65536)
+'''
+import logging
+import time
+from enum import IntEnum
+from threading import Lock
+
+import numpy as np
+
+import felib.dig1 as dig1
+import felib.dig2 as dig2
+import felib.formats as formats
+
+
+class ErrorCode(IntEnum):
+    '''
+    Subset of caen_felib.error.ErrorCode raised by the simulated endpoint.
+    '''
+    TIMEOUT = -11
+    STOP    = -12
+
+
+class Error(RuntimeError):
+    '''
+    Mirrors caen_felib.error.Error so readout code handles both alike.
+    '''
+    def __init__(self, message : str, code : ErrorCode):
+        super().__init__(message)
+        self.code = code
+
+
+# numpy types of the endpoint data format types
+DATA_TYPES = {
+    'U8'     : np.uint8,
+    'U16'    : np.uint16,
+    'U32'    : np.uint32,
+    'U64'    : np.uint64,
+    'I8'     : np.int8,
+    'I16'    : np.int16,
+    'I32'    : np.int32,
+    'I64'    : np.int64,
+    'SIZE_T' : np.uintp,
+}
+
+
+class SimParam:
+    '''
+    Parameter node, values are stored as strings like on the real device.
+    '''
+    def __init__(self, value : str = ''):
+        self.value = value
+
+
+class SimTree:
+    '''
+    Folder of parameters (par) accessed as attributes. Unknown parameters are
+    created on first access so any parameter CARP writes is accepted.
+    '''
+    def __init__(self, **defaults):
+        self.__dict__['_nodes'] = {name : SimParam(str(value)) for name, value in defaults.items()}
+
+    def __getattr__(self, name):
+        return self._nodes.setdefault(name, SimParam())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Set parameters through their value, e.g. par.RECLEN.value = '1024'.")
+
+
+class SimCommands:
+    '''
+    Command folder (cmd), commands are forwarded to the device.
+    '''
+    def __init__(self, device):
+        self._device = device
+
+    def RESET(self):
+        self._device.reset()
+
+    def CALIBRATEADC(self):
+        pass
+
+    def ARMACQUISITION(self):
+        self._device.arm()
+
+    def DISARMACQUISITION(self):
+        self._device.disarm()
+
+    def SENDSWTRIGGER(self):
+        self._device.sw_trigger()
+
+    def SWSTARTACQUISITION(self):
+        pass
+
+
+class SimNode:
+    '''
+    Channel or vtrace node, only holds a parameter folder.
+    '''
+    def __init__(self, **defaults):
+        self.par = SimTree(**defaults)
+
+
+class SimData:
+    '''
+    Mirrors caen_felib.device.Data: a named numpy buffer filled by read_data.
+    '''
+    def __init__(self, name : str, type : str, dim : int = 0, shape : list = None):
+        self.name  = name
+        self.type  = type
+        self.value = np.zeros(shape if dim > 0 else (), dtype = DATA_TYPES[type])
+
+
+class SimEndpoint:
+    '''
+    Decoded DPP endpoint producing synthetic pulses.
+
+    Triggers arrive as a Poisson process in real time once the board is armed
+    (or one per enabled channel for each software trigger). Events wait in a
+    board buffer of sim_buffer events, when it is full new triggers are lost
+    like on a busy board.
+
+    Like the FELib DPP endpoint, read_data returns one event per call. The
+    pending events are generated a block at a time, so a read_data only copies
+    one event into the data buffers and the cost measured is that of the
+    per-event readout loop, not of the pulse generation.
+    '''
+    # events generated at once, taken out of the board buffer
+    BLOCK = 1024
+
+    def __init__(self, device):
+        self.device = device
+        self.data   = ()
+        self.reset()
+
+    def reset(self):
+        '''
+        Drop the events generated ahead, on arming.
+        '''
+        self.block  = None
+        self.next   = 0
+        self.fields = None
+
+    def set_read_data_format(self, fmt):
+        self.data = tuple(SimData(**field) for field in fmt)
+        self.fields = None
+        return self.data
+
+    def has_data(self, timeout : int):
+        if self.block is not None and self.next < len(self.block):
+            return
+        if not self.device.wait(timeout):
+            raise Error('Timeout', ErrorCode.TIMEOUT)
+
+    def read_data(self, timeout : int, data):
+        if self.block is None or self.next >= len(self.block):
+            if not self.device.wait(timeout):
+                raise Error('Timeout', ErrorCode.TIMEOUT)
+            self.block  = self.device.generate(self.BLOCK)
+            self.next   = 0
+            self.fields = None
+        if self.fields is None:
+            self.fields = [(d.value, self.block[d.name]) for d in data if d.name in self.block.dtype.names]
+        i = self.next
+        for value, column in self.fields:
+            value[...] = column[i]
+        self.next += 1
+
+
+class SimRawEndpoint(SimEndpoint):
+    '''
+    RAW endpoint, every read returns the pending events as one encoded aggregate
+    in the format of the board's generation.
+    '''
+    def read_data(self, timeout : int, data):
+        if not self.device.wait(timeout):
+            raise Error('Timeout', ErrorCode.TIMEOUT)
+        buffer, size, n_events = data
+        if self.device.gen == 2:
+            # waveform header + samples words + 2 event words, one aggregate header
+            event_bytes = 8 * (3 + -(-self.device.reclen // dig2.SAMPLES_PER_WORD))
+            events = self.device.generate(max(1, (buffer.value.size - 8) // event_bytes))
+            raw = dig2.encode(events, self.device.aggregates)
+        else:
+            # board and pair aggregate headers for at most 8 pairs
+            events = self.device.generate(max(1, (buffer.value.size - 80) // dig1.event_size(self.device.reclen)))
+            raw = dig1.encode(events, self.device.aggregates)
+        self.device.aggregates += 1
+        buffer.value[:len(raw)] = np.frombuffer(raw, dtype = np.uint8)
+        size.value[...]     = len(raw)
+        n_events.value[...] = len(events)
+
+
+class SimEndpoints(dict):
+    '''
+    Endpoint folder, gen 2 boards select the active endpoint through its par.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.par = SimTree(ActiveEndpoint = 'RAW')
+
+
+class SimDevice:
+    '''
+    Simulated DPP board with the same node layout as caen_felib.device.Node.
+    '''
+    def __init__(self, dig_dict : dict):
+        self.gen         = int(dig_dict.get('dig_gen', 1))
+        self.n_ch        = int(dig_dict.get('sim_n_ch', 4))
+        self.sample_rate = float(dig_dict.get('sim_sample_rate', 500))
+        self.rate        = float(dig_dict.get('sim_rate', 1000))
+        self.amplitude   = float(dig_dict.get('sim_amplitude', 2000))
+        self.spread      = float(dig_dict.get('sim_spread', 0.2))
+        self.noise       = float(dig_dict.get('sim_noise', 5))
+        self.baseline    = float(dig_dict.get('sim_baseline', 1000))
+        self.rise        = float(dig_dict.get('sim_rise', 10))
+        self.decay       = float(dig_dict.get('sim_decay', 200))
+        self.buffer_size = int(dig_dict.get('sim_buffer', 65536))
+        self.adc_bits    = int(dig_dict.get('sim_adc_bits', 14))
+
+        self.rng = np.random.default_rng()
+        # software triggers can be sent from another thread than the readout
+        self.lock = Lock()
+        self.cmd = SimCommands(self)
+        self.endpoint = SimEndpoints(DPPPSD = SimEndpoint(self), RAW = SimRawEndpoint(self))
+        self.reset()
+
+    def reset(self):
+        self.armed      = False
+        self.lost       = 0
+        self.aggregates = 0
+        if self.gen == 2:
+            self.par = SimTree(NumCh         = self.n_ch,
+                               ADC_SamplRate = self.sample_rate,
+                               ADC_Nbit      = self.adc_bits,
+                               FwType        = 'DPP_PHA',
+                               AcqTriggerSource = 'SwTrg')
+            self.ch  = [SimNode(ChEnable           = 'False',
+                                ChRecordLengthT    = 2048,
+                                ChPreTriggerT      = 0,
+                                EventTriggerSource = 'SWTrigger',
+                                TriggerThr         = 0,
+                                PulsePolarity      = 'Positive') for _ in range(self.n_ch)]
+            self.vtrace = []
+            return
+
+        self.par = SimTree(NUMCH         = self.n_ch,
+                           ADC_SAMPLRATE = self.sample_rate,
+                           ADC_NBIT      = self.adc_bits,
+                           FWTYPE        = 'DPP-PSD',
+                           RECLEN        = 1024,
+                           TRG_SW_ENABLE = 'FALSE',
+                           WAVEFORMS     = 'FALSE')
+        self.ch     = [SimNode(CH_ENABLED         = 'FALSE',
+                               CH_PRETRG          = 0,
+                               CH_SELF_TRG_ENABLE = 'FALSE',
+                               CH_THRESHOLD       = 0,
+                               CH_POLARITY        = 'POLARITY_POSITIVE') for _ in range(self.n_ch)]
+        self.vtrace = [SimNode(VTRACE_PROBE = 'VPROBE_INPUT') for _ in range(2)]
+
+    def close(self):
+        self.armed = False
+
+    # acquisition control
+
+    def arm(self):
+        '''
+        Latch the configuration and start the trigger clock.
+        '''
+        period      = 1e3 / self.sample_rate  # ns
+        self.tick   = period
+
+        if self.gen == 2:
+            self.reclen    = int(int(self.ch[0].par.ChRecordLengthT.value) / int(period))
+            pre_trigger_ns = int(self.ch[0].par.ChPreTriggerT.value or 0)
+            enabled   = [ch.par.ChEnable.value == 'True' for ch in self.ch]
+            self_trig = [ch.par.EventTriggerSource.value == 'ChSelfTrigger' for ch in self.ch]
+            negative  = [ch.par.PulsePolarity.value == 'Negative' for ch in self.ch]
+        else:
+            self.reclen    = int(int(self.par.RECLEN.value) / int(period))
+            pre_trigger_ns = int(self.ch[0].par.CH_PRETRG.value or 0)
+            enabled   = [ch.par.CH_ENABLED.value == 'TRUE' for ch in self.ch]
+            self_trig = [ch.par.CH_SELF_TRG_ENABLE.value == 'TRUE' for ch in self.ch]
+            negative  = [ch.par.CH_POLARITY.value == 'POLARITY_NEGATIVE' for ch in self.ch]
+        self.enabled   = np.flatnonzero(enabled)
+        self.triggered = np.flatnonzero(np.logical_and(enabled, self_trig))
+        self.sign      = np.where(negative, -1, 1)
+
+        # pulse template (peak normalised to 1) starting at the pre-trigger
+        pre_trigger = int(pre_trigger_ns / period)
+        t = (np.arange(self.reclen) - pre_trigger) * period
+        with np.errstate(over = 'ignore'):
+            pulse = np.where(t >= 0, np.exp(-t / self.decay) - np.exp(-t / self.rise), 0)
+        self.template = ((pulse / pulse.max()) if pulse.max() > 0 else pulse).astype(np.float32)
+
+        # bank of noisy baselines, picked at random per event to keep generation cheap
+        self.noise_bank = (self.baseline + self.rng.normal(0, self.noise, (256, self.reclen))).astype(np.float32)
+
+        # triggers waiting in the board buffer and future Poisson trigger times (ns)
+        self.pending  = np.zeros(0, dtype = [('time', np.float64), ('channel', np.int64), ('amplitude', np.float64)])
+        self.arrivals = np.zeros(0)
+        self.t0       = time.perf_counter()
+        for endpoint in self.endpoint.values():
+            endpoint.reset()
+        self.armed    = True
+        logging.debug(f'Simulated digitiser armed: {self.rate} Hz on channels {list(self.triggered)}.')
+
+    def disarm(self):
+        self.armed = False
+
+    def sw_trigger(self):
+        '''
+        A software trigger produces one event on every enabled channel.
+        '''
+        if self.armed:
+            now = (time.perf_counter() - self.t0) * 1e9
+            self.push(np.full(len(self.enabled), now), self.enabled)
+
+    # event generation
+
+    def push(self, times, channels):
+        '''
+        Store triggers in the board buffer, losing those that don't fit.
+        '''
+        amplitudes = np.clip(self.rng.normal(self.amplitude, self.amplitude * self.spread, len(times)), 0, None)
+        with self.lock:
+            space = self.buffer_size - len(self.pending)
+            if len(times) > space:
+                self.lost += len(times) - space
+                times, channels, amplitudes = times[:space], channels[:space], amplitudes[:space]
+
+            triggers = np.empty(len(times), dtype = self.pending.dtype)
+            triggers['time']      = times
+            triggers['channel']   = channels
+            triggers['amplitude'] = amplitudes
+            self.pending = np.concatenate((self.pending, triggers))
+
+    def poll(self):
+        '''
+        Move the self triggers that have happened by now into the board buffer.
+        '''
+        if not self.armed or self.rate <= 0 or len(self.triggered) == 0:
+            return
+        now = (time.perf_counter() - self.t0) * 1e9
+        while len(self.arrivals) == 0 or self.arrivals[-1] <= now:
+            last  = self.arrivals[-1] if len(self.arrivals) else now
+            block = max(1024, int(self.rate * 0.01))
+            self.arrivals = np.concatenate((self.arrivals,
+                                            last + np.cumsum(self.rng.exponential(1e9 / self.rate, block))))
+        n = np.searchsorted(self.arrivals, now, side = 'right')
+        if n:
+            self.push(self.arrivals[:n], self.rng.choice(self.triggered, n))
+            self.arrivals = self.arrivals[n:]
+
+    def wait(self, timeout : int) -> bool:
+        '''
+        Wait up to timeout ms (-1 forever) for an event in the board buffer.
+        '''
+        if not self.armed:
+            raise Error('Stop', ErrorCode.STOP)
+        deadline = time.perf_counter() + (timeout / 1e3 if timeout >= 0 else float('inf'))
+        while True:
+            self.poll()
+            if len(self.pending):
+                return True
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            # sleep until the next trigger is due, but stay responsive
+            next_due = self.arrivals[0] / 1e9 + self.t0 - time.perf_counter() if len(self.arrivals) else remaining
+            time.sleep(min(max(next_due, 0), remaining, 0.01))
+
+    def generate(self, max_events : int, out : np.ndarray = None):
+        '''
+        Pop up to max_events triggers from the board buffer and write their events
+        into out (a structured array of formats.event_dtype), allocated if not given.
+        Returns the number of events written, or the new array if out was not given.
+        '''
+        with self.lock:
+            triggers = self.pending[:max_events]
+            self.pending = self.pending[len(triggers):]
+        n = len(triggers)
+        events = np.zeros(n, dtype = formats.event_dtype(self.reclen)) if out is None else out[:n]
+
+        channels  = triggers['channel']
+        amplitude = (triggers['amplitude'] * self.sign[channels]).astype(np.float32)
+
+        waveforms = self.noise_bank[self.rng.integers(0, len(self.noise_bank), n)]
+        waveforms += np.multiply.outer(amplitude, self.template)
+        np.clip(waveforms, 0, 2 ** self.adc_bits - 1, out = waveforms)
+
+        events['CHANNEL']        = channels
+        events['TIMESTAMP']      = triggers['time'] / self.tick
+        events['ENERGY']         = np.clip(triggers['amplitude'], 0, np.iinfo(np.uint16).max)
+        events['WAVEFORM_SIZE']  = self.reclen
+        events['ANALOG_PROBE_1'] = waveforms
+        return events if out is None else n
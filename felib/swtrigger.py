@@ -0,0 +1,177 @@
+'''
+Rate controlled software trigger generation, decoupled from the readout.
+'''
+import logging
+import time
+from collections import deque
+from threading import Thread, Event, Condition
+
+
+SW_TRIGGER_MODES = ('single', 'rate', 'burst', 'max')
+
+
+class SWTrigger:
+    '''
+    Sends software triggers on its own thread while the readout drains their
+    events in batches, so many triggers are in flight at once.
+
+    Modes:
+        - single : one trigger per readout, waiting for its events (the original
+                   behaviour, sent by the readout itself with fire(), no thread)
+        - rate   : a fixed frequency, triggers missed while the board was busy are caught up
+        - burst  : burst triggers in total as fast as possible, then none
+        - max    : as fast as possible
+
+    At most max_in_flight triggers are outstanding (sent, events not yet read out)
+    so the board buffer can't overflow. A trigger whose events haven't been read
+    out expiry seconds after it was sent is written off, so triggers that never
+    produce events (lost by a busy board, sent while disarmed) don't hold their
+    place forever.
+    '''
+
+    def __init__(self,
+                 send,
+                 mode              : str   = 'single',
+                 rate              : float = 1000,
+                 burst             : int   = 1,
+                 max_in_flight     : int   = 256,
+                 events_per_trigger: int   = 1,
+                 expiry            : float = 1.0):
+        if mode not in SW_TRIGGER_MODES:
+            logging.warning(f"Unknown software trigger mode '{mode}', defaulting to 'single'.")
+            mode = 'single'
+        self.send               = send
+        self.mode               = mode
+        self.rate               = float(rate)
+        self.burst              = int(burst)
+        self.max_in_flight      = int(max_in_flight)
+        self.events_per_trigger = max(1, int(events_per_trigger))
+        self.expiry             = float(expiry)
+        self.condition          = Condition()
+        self.stop_event         = Event()
+        self.thread             = None
+        self.reset()
+
+    def reset(self):
+        self.t0          = time.perf_counter()
+        self.sent        = 0
+        self.events      = 0
+        self.expired     = 0
+        self.answered    = 0
+        # send times of the triggers whose events are not read out yet, oldest first
+        self.outstanding = deque()
+
+    def start(self):
+        '''
+        Reset the counters and, except in 'single' mode, start sending triggers.
+        '''
+        self.stop()
+        self.reset()
+        if self.mode != 'single':
+            self.stop_event.clear()
+            self.thread = Thread(target = self.run, name = 'sw-trigger', daemon = True)
+            self.thread.start()
+
+    def stop(self):
+        '''
+        Stop sending triggers and wait for the sending thread to exit.
+        '''
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        logging.info(f"Software triggers started in '{self.mode}' mode.")
+        while not self.stop_event.is_set():
+            try:
+                if self.fire():
+                    continue
+            except Exception as e:
+                logging.exception(f"Sending software triggers failed: {e}")
+                break
+            # nothing due: wait for the next trigger time or for events to be read out
+            with self.condition:
+                if not self.stop_event.is_set() and self.due() == 0:
+                    self.condition.wait(self.wait_time())
+        logging.info("Software triggers stopped.")
+
+    @property
+    def in_flight(self):
+        return len(self.outstanding)
+
+    def expire(self, now : float):
+        '''
+        Write off the triggers sent more than expiry seconds ago.
+        '''
+        while self.outstanding and now - self.outstanding[0] > self.expiry:
+            self.outstanding.popleft()
+            self.expired += 1
+
+    def due(self) -> int:
+        '''
+        Number of triggers to send now.
+        '''
+        now = time.perf_counter()
+        self.expire(now)
+        space = self.max_in_flight - self.in_flight
+        match self.mode:
+            case 'single':
+                return 1
+            case 'rate':
+                n = int((now - self.t0) * self.rate) - self.sent
+            case 'burst':
+                n = self.burst - self.sent
+            case _:
+                n = space
+        return max(0, min(n, space))
+
+    def wait_time(self) -> float:
+        '''
+        How long (s) nothing can become due unless events are read out.
+        '''
+        now = time.perf_counter()
+        wait = self.outstanding[0] + self.expiry - now if self.outstanding else self.expiry
+        if self.mode == 'rate' and self.rate > 0:
+            wait = min(wait, self.t0 + (self.sent + 1) / self.rate - now)
+        return min(max(wait, 0), 0.1)
+
+    def fire(self) -> int:
+        '''
+        Send the triggers that are due, returns how many were sent.
+        '''
+        with self.condition:
+            n = self.due()
+            self.outstanding.extend([time.perf_counter()] * n)
+            self.sent += n
+        for _ in range(n):
+            self.send()
+        return n
+
+    def count(self, n_events : int):
+        '''
+        Note the events read out, freeing the place of their triggers.
+        '''
+        with self.condition:
+            self.events += n_events
+            answered = self.events // self.events_per_trigger
+            for _ in range(min(answered - self.answered, len(self.outstanding))):
+                self.outstanding.popleft()
+            self.answered = answered
+            self.condition.notify()
+
+    def report(self) -> dict:
+        '''
+        Requested and achieved trigger rates since the start (Hz).
+        '''
+        elapsed = time.perf_counter() - self.t0
+        return {'mode'      : self.mode,
+                'requested' : self.rate if self.mode == 'rate' else None,
+                'sent'      : self.sent / elapsed if elapsed else 0,
+                'achieved'  : self.events / self.events_per_trigger / elapsed if elapsed else 0,
+                'triggers'  : self.sent,
+                'events'    : self.events,
+                'expired'   : self.expired}
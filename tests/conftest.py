@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import felib.formats as formats
+
+
+def random_events(n, record_length, n_channels, timestamp_bits, seed = 0):
+    '''
+    n events with distinct time ordered timestamps and random 14-bit waveforms.
+    '''
+    rng    = np.random.default_rng(seed)
+    events = np.zeros(n, dtype = formats.event_dtype(record_length))
+    events['CHANNEL']   = rng.integers(0, n_channels, n)
+    events['TIMESTAMP'] = np.sort(rng.choice(1 << timestamp_bits, n, replace = False))
+    events['ENERGY']    = rng.integers(0, 1 << 16, n)
+    events['ANALOG_PROBE_1'] = rng.integers(0, 1 << 14, (n, record_length))
+    events['WAVEFORM_SIZE']  = record_length
+    return events
+
+
+def as_buffer(*chunks):
+    '''
+    A RAW buffer (uint8) of the given aggregates, bytes or word arrays.
+    '''
+    return np.frombuffer(b''.join(bytes(chunk) if isinstance(chunk, bytes) else chunk.tobytes() for chunk in chunks),
+                         dtype = np.uint8)
+
+
+@pytest.fixture
+def make_events():
+    return random_events
+
+
+@pytest.fixture
+def buffer():
+    return as_buffer
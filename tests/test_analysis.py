@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core.analysis import AnalysisStage, FEATURE_DTYPE, channel_polarity
+from core.ringbuffer import RingBuffer
+
+
+def test_channel_polarity_of_every_board():
+    rec_dict = {'ch0' : {'polarity' : 'negative'}, 'ch1' : {'polarity' : 'positive'}, 'chunk' : 1}
+    assert channel_polarity(rec_dict, [0, 1]) == {(0, 0) : -1, (1, 0) : -1, (0, 1) : 1, (1, 1) : 1}
+
+
+def test_polarity_is_looked_up_per_board():
+    ring = RingBuffer()
+    ring.allocate(record_length = 8, n_ch = 1, slots_per_channel = 16, reserve_max = 4)
+    features = RingBuffer()
+    features.allocate_slots(FEATURE_DTYPE, ring.capacity, ring.reserve_max)
+    stage = AnalysisStage(ring.reader('analysis'), features, {(1, 0) : -1}, pre_trigger = 2, period = 2)
+    reader = features.reader('test')
+
+    # the same channel of two boards, positive pulses on board 0 and negative on board 1
+    out = ring.reserve(2)
+    out.data['BOARD']          = [0, 1]
+    out.data['CHANNEL']        = 0
+    out.data['ANALOG_PROBE_1'] = 1000
+    out.data['ANALOG_PROBE_1'][0, 4] = 1500
+    out.data['ANALOG_PROBE_1'][1, 4] = 500
+    ring.commit(2)
+
+    with ThreadPoolExecutor(max_workers = 2) as stage.pool:
+        stage.process(stage.reader.read())
+    result = reader.read().events
+    assert list(result['BOARD']) == [0, 1]
+    assert list(result['AMPLITUDE']) == [500, 500]
@@ -0,0 +1,91 @@
+import numpy as np
+
+from core.builder import BUILT_EVENT_DTYPE, MULTIPLICITY_BINS, EventBuilder, group_hits, hit_dtype, time_order
+from core.ringbuffer import RingBuffer
+
+
+def test_time_order_merges_sources():
+    timestamps = np.array([1, 5, 9, 2, 3, 10])
+    sources    = np.array([0, 0, 0, 1, 1, 1])
+    assert list(timestamps[time_order(timestamps, sources)]) == [1, 2, 3, 5, 9, 10]
+
+
+def test_group_hits():
+    assert list(group_hits(np.array([0, 3, 5, 20, 21, 40], dtype = np.uint64), 5)) == [0, 3, 5]
+
+
+def setup(window = 5, min_multiplicity = 1):
+    ring = RingBuffer()
+    ring.allocate(record_length = 4, n_ch = 4, slots_per_channel = 64, reserve_max = 32)
+    hits = RingBuffer()
+    hits.allocate_slots(hit_dtype(ring.data.dtype), ring.capacity, ring.reserve_max)
+    events = RingBuffer()
+    events.allocate_slots(BUILT_EVENT_DTYPE, ring.capacity, ring.reserve_max)
+    builder = EventBuilder(ring.reader('builder'), hits, events, window, min_multiplicity, idle_timeout = 10)
+    return ring, builder, hits.reader('test'), events.reader('test')
+
+
+def write(ring, hits):
+    '''
+    hits - (channel, timestamp) pairs
+    '''
+    out = ring.reserve(len(hits))
+    out.data['CHANNEL']   = [channel for channel, _ in hits]
+    out.data['TIMESTAMP'] = [timestamp for _, timestamp in hits]
+    ring.commit(len(hits))
+
+
+def test_builds_coincidences():
+    ring, builder, hits, events = setup()
+    write(ring, [(0, 100), (1, 102), (0, 200), (2, 104), (1, 300)])
+    builder.collect()
+    assert builder.build(flush = True) == 3
+
+    built = events.read().events
+    assert list(built['TIMESTAMP'])    == [100, 200, 300]
+    assert list(built['MULTIPLICITY']) == [3, 1, 1]
+    assert list(built['SPAN'])         == [4, 0, 0]
+    built_hits = hits.read().events
+    assert list(built_hits['TIMESTAMP']) == [100, 102, 104, 200, 300]
+    assert list(built_hits['EVENT_ID'])  == [0, 0, 0, 1, 2]
+
+
+def test_open_groups_wait_for_every_source():
+    ring, builder, hits, events = setup()
+    write(ring, [(0, 100), (1, 101), (0, 110)])
+    builder.collect()
+    # channel 1 has only reached 101, a hit of it within the window may still come
+    assert builder.build() == 0
+    assert len(builder.pending) == 3
+
+    write(ring, [(1, 112), (1, 200), (0, 201)])
+    builder.collect()
+    # both channels are past 200, the group starting there may still grow
+    assert builder.build() == 2
+    assert list(events.read().events['MULTIPLICITY']) == [2, 2]
+    assert list(builder.pending['TIMESTAMP']) == [200, 201]
+
+
+def test_low_multiplicity_events_are_dropped():
+    ring, builder, hits, events = setup(min_multiplicity = 2)
+    write(ring, [(0, 100), (1, 101), (0, 200)])
+    builder.collect()
+    assert builder.build(flush = True) == 2
+    assert builder.built == 2 and builder.dropped == 1
+    assert list(events.read().events['EVENT_ID']) == [0]
+    assert len(hits.read()) == 2
+    assert builder.multiplicity[1] == 1 and builder.multiplicity[2] == 1
+
+
+def test_large_groups_keep_their_hits():
+    ring, builder, hits, events = setup()
+    # more hits in one window than a uint16 multiplicity holds
+    n = 70000
+    pending = np.zeros(n + 1, dtype = ring.data.dtype)
+    pending['TIMESTAMP'][-1] = 1000
+    builder.pending = pending
+    assert builder.build(flush = True) == 2
+    assert builder.dropped == 0
+    assert builder.hits.written == n + 1
+    assert builder.multiplicity[1] == 1 and builder.multiplicity[MULTIPLICITY_BINS - 1] == 1
+    assert list(events.read().events['MULTIPLICITY']) == [65535, 1]
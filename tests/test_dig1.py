@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+import felib.dig1 as dig1
+import felib.formats as formats
+from core.rawfile import BufferWriter, read_buffers
+from felib.batch import EventBatch
+
+
+# One board aggregate written out by hand from the DPP-PSD layout (see felib.dig1):
+# board 3, channel pairs 0 and 1, 8 samples, extras (extended time tag) and charge
+GOLDEN = np.array([
+    0xA000001D,     # board aggregate, 29 words
+    0x18000003,     # board id 3, pair mask 0b11
+    0x00000007,     # aggregate counter
+    0x12345678,     # aggregate time tag
+    # pair 0: 2 events of 7 words
+    0x80000010,     # pair aggregate, 16 words
+    0x5A000001,     # charge, extras, samples, extras format 0b010, 8 samples
+    0x00001000,     # channel 0, trigger time tag 0x1000
+    0x00650064, 0x00670066, 0x00690068, 0x006B006A,   # samples 100 - 107
+    0x00020005,     # extended time tag 2, fine time 5
+    0x03000040,     # charge long 0x300, charge short 0x40
+    0x80002000,     # channel 1, trigger time tag 0x2000
+    0x00C900C8, 0x00CB00CA, 0x00CD00CC, 0x00CF00CE,   # samples 200 - 207
+    0x00000000,     # extended time tag 0
+    0x05000010,     # charge long 0x500
+    # pair 1: 1 event
+    0x80000009,     # pair aggregate, 9 words
+    0x5A000001,
+    0x7FFFFFFF,     # channel 2, largest trigger time tag
+    0x0000FFFF, 0x00020001, 0x00040003, 0x00060005,   # samples 0x3fff (bits above 13 set), 0, 1 - 6
+    0x00010000,     # extended time tag 1
+    0x00010000,     # charge long 1
+], dtype = '<u4')
+
+
+def test_golden_aggregate(buffer):
+    events = dig1.decode(buffer(GOLDEN), 8)
+    # decoded in time order
+    assert list(events['CHANNEL'])   == [1, 2, 0]
+    assert list(events['TIMESTAMP']) == [0x2000, 0xFFFFFFFF, (2 << 31) | 0x1000]
+    assert list(events['ENERGY'])    == [0x500, 1, 0x300]
+    assert list(events['WAVEFORM_SIZE']) == [8, 8, 8]
+    assert list(events['ANALOG_PROBE_1'][0]) == list(range(200, 208))
+    assert list(events['ANALOG_PROBE_1'][1]) == [0x3FFF, 0, 1, 2, 3, 4, 5, 6]
+    assert list(events['ANALOG_PROBE_1'][2]) == list(range(100, 108))
+
+
+def test_golden_aggregate_cut_to_the_record_length(buffer):
+    events = dig1.decode(buffer(GOLDEN), 4)
+    assert list(events['ANALOG_PROBE_1'][2]) == [100, 101, 102, 103]
+    assert list(events['WAVEFORM_SIZE']) == [4, 4, 4]
+
+
+def test_encode_matches_the_golden_aggregate(buffer):
+    # the simulated board writes the same layout, in the golden order of events
+    events  = dig1.decode(buffer(GOLDEN), 8)[[2, 0, 1]]
+    encoded = np.frombuffer(dig1.encode(events, counter = 7, board_id = 3), dtype = '<u4')
+    # less what it doesn't fill in: aggregate time tag, fine time, charge short, sample flags
+    expected = GOLDEN.copy()
+    expected[[3, 11, 12, 19, 23]] = [0, 0x00020000, 0x03000000, 0x05000000, 0x00003FFF]
+    assert [hex(word) for word in encoded] == [hex(word) for word in expected]
+
+
+@pytest.mark.parametrize('record_length', [16, 24])
+def test_round_trip(make_events, buffer, record_length):
+    events  = make_events(60, record_length, n_channels = 16, timestamp_bits = 47)
+    encoded = dig1.encode(events)
+    assert len(encoded) == 4 * dig1.BOARD_HEADER_SIZE + 8 * len(np.unique(events['CHANNEL'] // 2)) + 60 * dig1.event_size(record_length)
+    assert np.array_equal(dig1.decode(buffer(encoded), record_length), events)
+
+
+def test_several_board_aggregates_are_time_ordered(make_events, buffer):
+    events  = make_events(20, 8, n_channels = 16, timestamp_bits = 47)
+    decoded = dig1.decode(buffer(dig1.encode(events[:10], 0), dig1.encode(events[10:], 1)), 8)
+    assert np.array_equal(decoded, events)
+
+
+def test_empty_buffer():
+    assert len(dig1.decode(np.zeros(0, dtype = np.uint8), 8)) == 0
+
+
+def test_invalid_header():
+    with pytest.raises(ValueError):
+        dig1.decode(np.zeros(16, dtype = np.uint8), 8)
+
+
+def test_buffer_file_round_trip(make_events, tmp_path):
+    path     = str(tmp_path / 'run.buf')
+    events   = make_events(30, 8, n_channels = 16, timestamp_bits = 47)
+    encoded  = [dig1.encode(events[:10], 0), dig1.encode(events[10:], 1)]
+    batch    = EventBatch(np.zeros(4, dtype = formats.raw_buffer_dtype(4096)), 2)
+    for row, data, n in zip(batch.data, encoded, (10, 20)):
+        row['BOARD'], row['N_EVENTS'], row['SIZE'] = 3, n, len(data)
+        row['DATA'][:len(data)] = np.frombuffer(data, dtype = np.uint8)
+
+    writer = BufferWriter(path, {'dig_gen' : 1})
+    writer.write(batch)
+    writer.close()
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 7)   # a buffer cut short by a crash
+
+    buffers, metadata = read_buffers(path)
+    buffers = list(buffers)
+    assert metadata == {'dig_gen' : 1}
+    assert [(board, n) for board, n, _ in buffers] == [(3, 10), (3, 20)]
+    assert [data.tobytes() for _, _, data in buffers] == encoded
+    decoded = np.concatenate([dig1.decode(data, 8) for _, _, data in buffers])
+    assert np.array_equal(decoded, events)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import felib.dig2 as dig2
+
+
+# One aggregate written out by hand from the gen 2 DPP layout (see felib.dig2):
+# an event with an 8 sample waveform and one without
+GOLDEN = np.array([
+    0x2000000900000008,     # DPP aggregate, counter 9, 8 words
+    0x0500123456789ABC,     # channel 5, timestamp 0x123456789abc
+    0x400000048C3F0ABC,     # waveform, energy short 0x123, fine time 0x3f, energy 0xabc
+    0x0000000000000002,     # 2 waveform words
+    0x000D000C000B000A,     # samples 10 - 13
+    0x80110010000F000E,     # samples 14 - 17, a flag bit above the ADC value
+    0x3F00FFFFFFFFFFFF,     # channel 63, largest timestamp
+    0x0000000000000007,     # no waveform, energy 7
+], dtype = '>u8')
+
+
+def test_golden_aggregate(buffer):
+    events = dig2.decode(buffer(GOLDEN), 8)
+    assert list(events['CHANNEL'])   == [5, 63]
+    assert list(events['TIMESTAMP']) == [0x123456789ABC, 0xFFFFFFFFFFFF]
+    assert list(events['ENERGY'])    == [0xABC, 7]
+    assert list(events['WAVEFORM_SIZE']) == [8, 0]
+    assert list(events['ANALOG_PROBE_1'][0]) == list(range(10, 18))
+    assert not events['ANALOG_PROBE_1'][1].any()
+
+
+def test_encode_matches_the_golden_aggregate(buffer):
+    # the simulated board only writes events with waveforms, take the first one
+    single    = GOLDEN[:6].copy()
+    single[0] = 0x2000000900000006
+    events    = dig2.decode(buffer(single), 8)
+    encoded   = np.frombuffer(dig2.encode(events, counter = 9), dtype = '>u8')
+    # less what it doesn't fill in: energy short, fine time, sample flags
+    expected = single.copy()
+    expected[2] = 0x4000000000000ABC
+    expected[5] = 0x00110010000F000E
+    assert [hex(word) for word in encoded] == [hex(word) for word in expected]
+
+
+@pytest.mark.parametrize('record_length', [16, 10])
+def test_round_trip(make_events, buffer, record_length):
+    events  = make_events(50, record_length, n_channels = 64, timestamp_bits = 48)
+    decoded = dig2.decode(buffer(dig2.encode(events)), record_length)
+    assert np.array_equal(decoded, events)
+
+
+def test_several_aggregates(make_events, buffer):
+    first  = make_events(5, 8, n_channels = 64, timestamp_bits = 48)
+    second = make_events(7, 8, n_channels = 64, timestamp_bits = 48, seed = 1)
+    decoded = dig2.decode(buffer(dig2.encode(first, 0), dig2.encode(second, 1)), 8)
+    assert np.array_equal(decoded, np.concatenate([first, second]))
+
+
+def test_waveforms_longer_than_the_record_are_cut(make_events, buffer):
+    events  = make_events(3, 16, n_channels = 64, timestamp_bits = 48)
+    decoded = dig2.decode(buffer(dig2.encode(events)), 8)
+    assert np.array_equal(decoded['ANALOG_PROBE_1'], events['ANALOG_PROBE_1'][:, :8])
+    assert np.all(decoded['WAVEFORM_SIZE'] == 8)
+
+
+def test_events_of_different_sizes(make_events):
+    events = make_events(3, 8, n_channels = 64, timestamp_bits = 48)
+    words  = np.frombuffer(dig2.encode(events), dtype = '>u8').astype(np.uint64)
+    # drop the waveform of the second event (its waveform header and 2 words)
+    size  = 3 + 2
+    words = np.concatenate((words[:1 + size], words[1 + size : 1 + size + 2], words[1 + 2 * size:]))
+    words[1 + size + 1] &= ~np.uint64(1 << 62)
+    words[0] = (words[0] & ~np.uint64(0xffffffff)) | np.uint64(len(words))
+
+    decoded = dig2.decode(np.frombuffer(words.astype('>u8').tobytes(), dtype = np.uint8), 8)
+    assert np.array_equal(decoded['TIMESTAMP'], events['TIMESTAMP'])
+    assert list(decoded['WAVEFORM_SIZE']) == [8, 0, 8]
+    assert np.array_equal(decoded['ANALOG_PROBE_1'][2], events['ANALOG_PROBE_1'][2])
+    assert not decoded['ANALOG_PROBE_1'][1].any()
+
+
+def test_empty_buffer():
+    assert len(dig2.decode(np.zeros(0, dtype = np.uint8), 8)) == 0
+
+
+def test_invalid_header():
+    with pytest.raises(ValueError):
+        dig2.decode(np.zeros(16, dtype = np.uint8), 8)
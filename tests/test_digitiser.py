@@ -0,0 +1,75 @@
+import copy
+import os
+
+import pytest
+
+import felib.simulator as simulator
+from core.io import read_config_file
+from felib.digitiser import Digitiser
+
+CONFIGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs')
+
+
+@pytest.fixture
+def calibrations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(simulator.SimCommands, 'CALIBRATEADC', lambda self : calls.append(1))
+    return calls
+
+
+@pytest.fixture
+def configs():
+    return (read_config_file(os.path.join(CONFIGS, 'debug.conf')),
+            read_config_file(os.path.join(CONFIGS, 'recording', 'five_ns_window.conf')))
+
+
+def connect(dig_dict, rec_dict):
+    digitiser = Digitiser(dig_dict)
+    digitiser.connect()
+    digitiser.configure(dig_dict, rec_dict)
+    return digitiser
+
+
+def test_first_configure_writes_and_calibrates(configs, calibrations):
+    digitiser = connect(*configs)
+    assert 'RECLEN' in digitiser.written and 'CH_ENABLED' in digitiser.written
+    assert digitiser.calibrated
+    assert len(calibrations) == 1
+
+
+def test_unchanged_configure_writes_nothing(configs, calibrations):
+    dig_dict, rec_dict = configs
+    digitiser = connect(dig_dict, rec_dict)
+    digitiser.configure(dig_dict, copy.deepcopy(rec_dict))
+    assert digitiser.written == []
+    assert len(calibrations) == 1
+
+
+def test_only_changed_parameters_are_written(configs, calibrations):
+    dig_dict, rec_dict = configs
+    digitiser = connect(dig_dict, rec_dict)
+    changed = copy.deepcopy(rec_dict)
+    changed['ch0']['threshold'] += 100
+    digitiser.configure(dig_dict, changed)
+    assert digitiser.written == ['CH_THRESHOLD']
+    assert int(digitiser.dig.ch[0].par.CH_THRESHOLD.value) == rec_dict['ch0']['threshold'] + 100
+    assert len(calibrations) == 1
+
+
+def test_enabling_a_channel_recalibrates(configs, calibrations):
+    dig_dict, rec_dict = configs
+    digitiser = connect(dig_dict, rec_dict)
+    changed = copy.deepcopy(rec_dict)
+    changed['ch1']['enabled'] = not rec_dict['ch1']['enabled']
+    digitiser.configure(dig_dict, changed)
+    assert 'CH_ENABLED' in digitiser.written
+    assert len(calibrations) == 2
+
+
+def test_reconnecting_starts_from_the_defaults(configs, calibrations):
+    dig_dict, rec_dict = configs
+    digitiser = connect(dig_dict, rec_dict)
+    digitiser.connect()
+    digitiser.configure(dig_dict, rec_dict)
+    assert 'RECLEN' in digitiser.written
+    assert len(calibrations) == 2
@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from core.headless import HeadlessRun
+
+CONFIGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs')
+
+
+@pytest.mark.parametrize('boards', [1, 2])
+def test_stops_after_n_events(boards):
+    run = HeadlessRun([os.path.join(CONFIGS, 'debug.conf')] * boards,
+                      os.path.join(CONFIGS, 'recording', 'five_ns_window.conf'),
+                      duration = 20, n_events = 500, record = False)
+    assert run.run() == 0
+    # the simulated boards trigger at 1 kHz each, the duration is only a safety net
+    readout = run.worker.metrics.snapshot()['stages']['readout']
+    assert readout['events'] >= 500
+    assert not run.worker.is_alive()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from core.boards import TimestampMerger
+from core.ringbuffer import RingBuffer
+
+
+def make_ring():
+    ring = RingBuffer()
+    ring.allocate(record_length = 4, n_ch = 1, slots_per_channel = 64, reserve_max = 16)
+    return ring
+
+
+def write(ring, timestamps, board):
+    out = ring.reserve(len(timestamps))
+    out.data['BOARD']     = board
+    out.data['TIMESTAMP'] = timestamps
+    ring.commit(len(timestamps))
+
+
+def setup(idle_timeout = 0.5):
+    boards = [make_ring(), make_ring()]
+    out    = make_ring()
+    merger = TimestampMerger([ring.reader('merge') for ring in boards], out, idle_timeout = idle_timeout)
+    return boards, out.reader('test'), merger
+
+
+def test_holds_events_back_until_every_board_passed_them():
+    boards, reader, merger = setup()
+    write(boards[0], [1, 4, 7], 0)
+    write(boards[1], [2, 3], 1)
+    assert merger.merge() == 3     # watermark is board 1's newest timestamp, 3
+    assert list(reader.read().timestamp) == [1, 2, 3]
+    assert list(merger.pending[0]['TIMESTAMP']) == [4, 7]
+
+    write(boards[1], [5, 9], 1)
+    assert merger.merge() == 3
+    assert list(reader.read().timestamp) == [4, 5, 7]
+    assert merger.late == 0
+
+
+def test_flush_passes_everything_on():
+    boards, reader, merger = setup()
+    write(boards[0], [1, 6], 0)
+    write(boards[1], [2], 1)
+    merger.merge()
+    reader.read()
+    assert merger.merge(flush = True) == 1
+    batch = reader.read()
+    assert list(batch.timestamp) == [6] and list(batch.board) == [0]
+
+
+def test_silent_board_does_not_hold_the_others_back():
+    boards, reader, merger = setup(idle_timeout = 0)
+    write(boards[0], [1, 2, 3], 0)
+    assert merger.merge() == 3
+    assert list(reader.read().timestamp) == [1, 2, 3]
+
+    # late events of the silent board are still passed on and counted
+    write(boards[1], [2], 1)
+    assert merger.merge() == 1
+    assert merger.late == 1
+
+
+def test_output_is_ordered():
+    boards, reader, merger = setup()
+    rng = np.random.default_rng(1)
+    for board, ring in enumerate(boards):
+        write(ring, np.sort(rng.integers(0, 1000, 16)), board)
+    merger.merge(flush = True)
+    merged = []
+    while (batch := reader.read()) is not None:
+        merged.extend(batch.timestamp)
+    assert len(merged) == 32
+    assert merged == sorted(merged)
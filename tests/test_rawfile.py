@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import felib.formats as formats
+from core.rawfile import HEADER_SIZE, RawWriter, read_raw, read_raw_header
+from felib.batch import EventBatch
+
+
+def make_batch(n, record_length = 8, start = 0):
+    batch = EventBatch.empty(n, record_length)
+    batch.data['CHANNEL']   = np.arange(n) % 4
+    batch.data['TIMESTAMP'] = np.arange(start, start + n)
+    batch.data['ANALOG_PROBE_1'] = np.arange(n * record_length).reshape(n, record_length)
+    batch.n = n
+    return batch
+
+
+def test_round_trip(tmp_path):
+    path   = str(tmp_path / 'run.raw')
+    dtype  = formats.event_dtype(8)
+    writer = RawWriter(path, dtype, {'run' : 'test', 'rate' : 1e3})
+    first, second = make_batch(5), make_batch(3, start = 5)
+    writer.write(first)
+    writer.write(second)
+    writer.close()
+
+    events, metadata = read_raw(path)
+    assert metadata == {'run' : 'test', 'rate' : 1e3}
+    assert events.dtype == dtype
+    assert np.array_equal(events, np.concatenate([first.events, second.events]))
+    assert read_raw_header(path)[0] == dtype
+
+
+def test_only_valid_rows_are_written(tmp_path):
+    path   = str(tmp_path / 'run.raw')
+    batch  = make_batch(6)
+    batch.n = 2
+    writer = RawWriter(path, batch.data.dtype, {})
+    writer.write(batch)
+    writer.close()
+    assert len(read_raw(path)[0]) == 2
+
+
+def test_unclosed_file_drops_partial_record(tmp_path):
+    path   = str(tmp_path / 'run.raw')
+    batch  = make_batch(4)
+    writer = RawWriter(path, batch.data.dtype, {})
+    writer.write(batch)
+    writer.flush()
+    with open(path, 'ab') as f:
+        f.write(b'\1' * 10)   # a record cut short by a crash
+
+    events, _ = read_raw(path)
+    assert np.array_equal(events, batch.events)
+    writer.file.close()
+
+
+def test_empty_file(tmp_path):
+    path = str(tmp_path / 'run.raw')
+    RawWriter(path, formats.event_dtype(8), {}).close()
+    events, _ = read_raw(path)
+    assert len(events) == 0
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.raw'
+    path.write_bytes(b'\0' * HEADER_SIZE)
+    with pytest.raises(ValueError):
+        read_raw(str(path))
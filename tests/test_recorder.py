@@ -0,0 +1,100 @@
+import numpy as np
+
+from core.recorder import Recorder
+from core.ringbuffer import RingBuffer
+
+
+class ListWriter:
+    '''
+    Keeps copies of what it is given, optionally letting the ring writer run on
+    during every write, as a slow disk would.
+    '''
+    def __init__(self, during_write = None):
+        self.events = []
+        self.during_write = during_write
+        self.closed = False
+
+    def write(self, batch):
+        if self.during_write is not None:
+            self.during_write()
+        self.events.append(batch.events.copy())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def make_ring():
+    ring = RingBuffer()
+    ring.allocate(record_length = 4, n_ch = 1, slots_per_channel = 16, reserve_max = 4)
+    return ring
+
+
+def write(ring, start, n):
+    '''
+    Commit events start..start + n, each waveform filled with its timestamp.
+    '''
+    for timestamp in range(start, start + n):
+        out = ring.reserve(1)
+        out.data['TIMESTAMP'] = timestamp
+        out.data['ANALOG_PROBE_1'] = timestamp
+        ring.commit(1)
+
+
+def record(ring, writer):
+    recorder = Recorder(ring.reader('recording'), writer, poll_interval = 0.001)
+    return recorder
+
+
+def test_reads_are_capped_at_reserve_max():
+    ring   = make_ring()
+    writer = ListWriter()
+    recorder = record(ring, writer)
+    write(ring, 0, 10)
+    recorder.stop()
+    recorder.run()
+    assert [len(events) for events in writer.events] == [4, 4, 2]
+    assert writer.closed
+
+
+def test_events_overwritten_during_a_write_are_dropped():
+    ring   = make_ring()
+    state  = {'next' : 12}
+    def slow_write():
+        # the worker laps the block being written
+        write(ring, state['next'], 8)
+        state['next'] += 8
+    writer   = ListWriter()
+    recorder = record(ring, writer)
+    write(ring, 0, 12)
+    batch = recorder.reader.read(4)
+    slow_write()
+    copied = recorder.copy(batch)
+    # positions 0..3, the worker is at 20 and may fill up to 24 = 8 + capacity
+    assert len(copied) == 0
+    assert recorder.reader.overruns == 4
+
+    # the next read catches up to the oldest events that are still safe
+    copied = recorder.copy(recorder.reader.read(4))
+    assert list(copied.timestamp) == [8, 9, 10, 11]
+    assert recorder.reader.overruns == 8
+
+
+def test_written_events_are_never_torn():
+    ring   = make_ring()
+    state  = {'next' : 12}
+    def slow_write():
+        if state['next'] < 100:
+            write(ring, state['next'], 5)
+            state['next'] += 5
+    writer   = ListWriter(slow_write)
+    recorder = record(ring, writer)
+    write(ring, 0, 12)
+    recorder.stop()
+    recorder.run()
+
+    events = np.concatenate(writer.events)
+    assert np.all(events['ANALOG_PROBE_1'] == events['TIMESTAMP'][:, None])
+    assert len(events) + recorder.reader.overruns == state['next']
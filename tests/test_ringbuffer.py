@@ -0,0 +1,91 @@
+import numpy as np
+
+from core.ringbuffer import RingBuffer
+
+
+def write(ring, n, start = 0):
+    '''
+    Commit n events, timestamped start, start + 1, ...
+    '''
+    done = 0
+    while done < n:
+        out = ring.reserve(n - done)
+        k   = out.capacity
+        out.data['TIMESTAMP'] = np.arange(start + done, start + done + k)
+        ring.commit(k)
+        done += k
+
+
+def make_ring(slots_per_channel = 8, reserve_max = 4):
+    ring = RingBuffer()
+    ring.allocate(record_length = 16, n_ch = 2, slots_per_channel = slots_per_channel, reserve_max = reserve_max)
+    return ring
+
+
+def test_reader_sees_only_new_events():
+    ring = make_ring()
+    write(ring, 3)
+    reader = ring.reader('test')
+    assert reader.read() is None
+    write(ring, 2, start = 3)
+    assert list(reader.read().timestamp) == [3, 4]
+
+
+def test_read_wraps_without_crossing_the_end():
+    ring   = make_ring()   # 16 slots
+    reader = ring.reader('test')
+    write(ring, 12)
+    assert len(reader.read()) == 12
+    write(ring, 8, start = 12)
+    first  = reader.read()
+    second = reader.read()
+    assert list(first.timestamp)  == [12, 13, 14, 15]
+    assert list(second.timestamp) == [16, 17, 18, 19]
+    assert reader.read() is None
+
+
+def test_reserve_stops_at_the_end():
+    ring = make_ring()
+    write(ring, 14)
+    assert ring.reserve(4).capacity == 2
+
+
+def test_overrun_skips_to_the_oldest_safe_event():
+    ring   = make_ring()   # 16 slots, readers may lag 16 - 4 = 12 events
+    reader = ring.reader('test')
+    write(ring, 20)
+    batch = reader.read()
+    assert reader.overruns == 8
+    assert batch.timestamp[0] == 8
+    assert ring.overruns() == {'test' : 8}
+
+
+def test_latest_skips_older_events():
+    ring   = make_ring()
+    reader = ring.reader('test')
+    write(ring, 6)
+    batch = reader.latest(2)
+    assert list(batch.timestamp) == [4, 5]
+    assert reader.skipped == 4
+    assert reader.overruns == 0
+    assert reader.latest(2) is None
+
+
+def test_readers_are_independent():
+    ring = make_ring()
+    a, b = ring.reader('a'), ring.reader('b')
+    write(ring, 4)
+    assert len(a.read()) == 4
+    assert b.available() == 4
+    assert ring.reader('a') is a
+
+
+def test_reallocation_resets_readers():
+    ring   = make_ring()
+    reader = ring.reader('test')
+    write(ring, 20)
+    reader.read()
+    ring.allocate(record_length = 32, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    assert reader.cursor == 0 and reader.overruns == 0
+    write(ring, 2)
+    assert list(reader.read().timestamp) == [0, 1]
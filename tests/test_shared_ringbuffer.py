@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+import pytest
+
+from core.ringbuffer import RingBuffer
+
+
+@pytest.fixture
+def rings():
+    writer, reader = RingBuffer(shared = True), RingBuffer(shared = True)
+    yield writer, reader
+    reader.release()
+    writer.release()
+
+
+def write(ring, timestamps):
+    out = ring.reserve(len(timestamps))
+    out.data['TIMESTAMP'] = timestamps
+    ring.commit(len(timestamps))
+
+
+def test_attached_reader_sees_the_writer(rings):
+    writer, reader = rings
+    layouts = []
+    writer.on_allocate = layouts.append
+    writer.allocate(record_length = 16, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    reader.attach(layouts[-1])
+
+    cursor = reader.reader('test')
+    write(writer, [1, 2, 3])
+    assert reader.written == 3
+    assert list(cursor.read().timestamp) == [1, 2, 3]
+
+
+def test_reattach_starts_at_the_new_head(rings):
+    writer, reader = rings
+    writer.allocate(record_length = 16, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    reader.attach(writer.layout())
+    cursor = reader.reader('test')
+    write(writer, [1, 2])
+
+    writer.allocate(record_length = 32, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    write(writer, [5, 6])
+    reader.attach(writer.layout())
+    assert reader.data.dtype == writer.data.dtype
+    assert cursor.read() is None
+    write(writer, [7])
+    assert list(cursor.read().timestamp) == [7]
+
+
+def test_readers_never_see_a_missing_buffer(rings):
+    writer, reader = rings
+    writer.allocate(record_length = 16, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    reader.attach(writer.layout())
+    cursor = reader.reader('test')
+
+    stop, errors = threading.Event(), []
+    def read():
+        while not stop.is_set():
+            try:
+                batch = cursor.latest(4)
+                if batch is not None:
+                    batch.timestamp.sum()
+            except Exception as e:
+                errors.append(e)
+    thread = threading.Thread(target = read)
+    thread.start()
+    for record_length in np.arange(50) % 3 + 16:
+        writer.allocate(record_length = int(record_length), n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+        write(writer, [1, 2])
+        reader.attach(writer.layout())
+    stop.set()
+    thread.join()
+    assert errors == []
+
+
+def test_release_removes_the_segment(rings):
+    writer, reader = rings
+    writer.allocate(record_length = 16, n_ch = 2, slots_per_channel = 8, reserve_max = 4)
+    layout = writer.layout()
+    writer.release()
+    assert writer.data is None and writer.shm is None
+    with pytest.raises(FileNotFoundError):
+        reader.attach(layout)
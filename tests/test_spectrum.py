@@ -0,0 +1,31 @@
+import numpy as np
+
+from ui.spectrum import EnergySpectrum
+
+
+def test_boards_have_their_own_spectra():
+    spectrum = EnergySpectrum(bins = 4, energy_range = (0, 400), n_ch = 2, n_boards = 2)
+    board   = np.array([0, 1, 1, 0, 1])
+    channel = np.array([0, 0, 0, 1, 1])
+    energy  = np.array([50, 150, 160, 350, 250])
+    spectrum.fill(board, channel, energy)
+    assert list(spectrum.counts[0, 0]) == [1, 0, 0, 0]
+    assert list(spectrum.counts[1, 0]) == [0, 2, 0, 0]
+    assert list(spectrum.counts[0, 1]) == [0, 0, 0, 1]
+    assert list(spectrum.counts[1, 1]) == [0, 0, 1, 0]
+
+
+def test_out_of_range():
+    spectrum = EnergySpectrum(bins = 4, energy_range = (0, 400), n_ch = 2, n_boards = 1)
+    spectrum.fill(np.array([0, 0, 1]), np.array([0, 3, 0]), np.array([500, 50, 50]))
+    assert spectrum.counts.sum() == 0
+    assert spectrum.out_of_range.sum() == 3
+
+
+def test_save(tmp_path):
+    spectrum = EnergySpectrum(bins = 2, energy_range = (0, 200), n_ch = 2, n_boards = 2)
+    spectrum.fill(np.array([1]), np.array([1]), np.array([150]))
+    spectrum.save(tmp_path / 'spectrum.csv')
+    lines = (tmp_path / 'spectrum.csv').read_text().splitlines()
+    assert lines[0] == 'energy_low,energy_high,b1_ch1'
+    assert lines[2] == '100,200,1'
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import felib.swtrigger as swtrigger
+from felib.swtrigger import SWTrigger
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_trigger(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(swtrigger.time, 'perf_counter', clock)
+    sent = []
+    return SWTrigger(lambda : sent.append(clock.now), **kwargs), clock, sent
+
+
+def test_single_sends_one_per_readout(monkeypatch):
+    trigger, _, sent = make_trigger(monkeypatch, mode = 'single')
+    assert trigger.fire() == 1
+    assert trigger.fire() == 1
+    assert len(sent) == 2
+
+
+def test_rate_catches_up_missed_triggers(monkeypatch):
+    trigger, clock, _ = make_trigger(monkeypatch, mode = 'rate', rate = 1000)
+    assert trigger.due() == 0
+    clock.now += 0.0105
+    assert trigger.fire() == 10
+    assert trigger.due() == 0
+    clock.now += 0.002
+    assert trigger.due() == 2
+
+
+def test_burst_stops_after_the_burst(monkeypatch):
+    trigger, _, _ = make_trigger(monkeypatch, mode = 'burst', burst = 5, max_in_flight = 3)
+    assert trigger.fire() == 3
+    assert trigger.fire() == 0     # three still in flight
+    trigger.count(3)
+    assert trigger.fire() == 2
+    trigger.count(2)
+    assert trigger.due() == 0
+
+
+def test_in_flight_limit(monkeypatch):
+    trigger, _, _ = make_trigger(monkeypatch, mode = 'max', max_in_flight = 8, events_per_trigger = 2)
+    assert trigger.fire() == 8
+    assert trigger.due() == 0
+    trigger.count(6)               # events of three triggers read out
+    assert trigger.in_flight == 5
+    assert trigger.due() == 3
+
+
+def test_unknown_mode_falls_back_to_single(monkeypatch):
+    trigger, _, _ = make_trigger(monkeypatch, mode = 'sometimes')
+    assert trigger.mode == 'single'
+
+
+def test_triggers_without_events_expire(monkeypatch):
+    trigger, clock, _ = make_trigger(monkeypatch, mode = 'max', max_in_flight = 4, expiry = 0.5)
+    assert trigger.fire() == 4
+    trigger.count(2)               # two of the triggers produced no events
+    assert trigger.fire() == 2
+    assert trigger.due() == 0
+    clock.now += 0.6
+    assert trigger.due() == 4
+    assert trigger.expired == 4
+    assert trigger.fire() == 4
+
+
+def test_rate_keeps_firing_when_triggers_are_lost(monkeypatch):
+    trigger, clock, _ = make_trigger(monkeypatch, mode = 'rate', rate = 1000, max_in_flight = 5, expiry = 0.01)
+    for _ in range(10):
+        clock.now += 0.02
+        assert trigger.fire() == 5
+    assert trigger.sent == 50
+    assert trigger.report()['expired'] == 45
+
+
+def test_triggers_are_sent_while_the_readout_drains():
+    board = []
+    lock  = threading.Lock()
+    def send():
+        with lock:
+            # only the first 20 triggers produce events, the board loses the rest
+            board.append(trigger.sent <= 20)
+    trigger = SWTrigger(send, mode = 'max', max_in_flight = 8, expiry = 0.02)
+    trigger.start()
+    try:
+        deadline = time.perf_counter() + 5
+        while trigger.sent < 200 and time.perf_counter() < deadline:
+            with lock:
+                n = sum(board)
+                board.clear()
+            trigger.count(n)
+            time.sleep(0.001)
+    finally:
+        trigger.stop()
+    assert trigger.thread is None
+    assert trigger.sent >= 200
+    assert trigger.expired > 0
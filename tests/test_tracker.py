@@ -0,0 +1,55 @@
+import pytest
+
+from core.tracker import LatencyHistogram, StageMetrics
+
+
+def test_buckets_are_monotonic_and_contain_their_values():
+    previous = 0
+    for us in range(1, 1 << 16):
+        bucket = LatencyHistogram.bucket(us)
+        assert bucket >= previous
+        assert us * 1e-6 < LatencyHistogram.upper_edge(bucket) + 1e-12
+        if bucket > 0:
+            assert us * 1e-6 >= LatencyHistogram.upper_edge(bucket - 1) - 1e-12
+        previous = bucket
+
+
+def test_bucket_resolution():
+    # four buckets per power of two, so edges at most 25% apart
+    for bucket in range(4, 120):
+        lower = LatencyHistogram.upper_edge(bucket - 1)
+        assert LatencyHistogram.upper_edge(bucket) / lower <= 1.25 + 1e-9
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for _ in range(90):
+        histogram.record(100e-6)
+    for _ in range(10):
+        histogram.record(10e-3)
+    assert histogram.n == 100
+    assert 100e-6 <= histogram.percentile(50) <= 125e-6
+    assert 100e-6 <= histogram.percentile(90) <= 125e-6
+    assert histogram.percentile(99) == pytest.approx(10e-3)   # capped at the maximum
+    summary = histogram.summary()
+    assert summary['max'] == pytest.approx(10)
+    assert summary['mean'] == pytest.approx((90 * 0.1 + 10 * 10) / 100)
+
+
+def test_out_of_range_values_go_to_the_last_bucket():
+    histogram = LatencyHistogram()
+    histogram.record(1e9)
+    assert histogram.counts[-1] == 1
+
+
+def test_empty():
+    assert LatencyHistogram().summary() == {'n' : 0, 'mean' : 0.0, 'p50' : 0.0, 'p90' : 0.0, 'p99' : 0.0, 'max' : 0.0}
+
+
+def test_stage_metrics_counts():
+    metrics = StageMetrics('test')
+    metrics.record(0.0, 10, 100)
+    metrics.record(0.0, 5, 50)
+    snapshot = metrics.snapshot()
+    assert (snapshot['events'], snapshot['bytes'], snapshot['batches']) == (15, 150, 2)
+    assert snapshot['latency_ms']['n'] == 2
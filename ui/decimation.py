@@ -0,0 +1,50 @@
+'''
+Peak preserving decimation of waveforms for display.
+'''
+import numpy as np
+
+
+class XAxisCache:
+    '''
+    Sample number arrays cached per record length, so no x-axis is built per event.
+    '''
+    def __init__(self):
+        self.axes = {}
+
+    def get(self, length : int) -> np.ndarray:
+        if length not in self.axes:
+            self.axes[length] = np.arange(length)
+        return self.axes[length]
+
+
+def minmax_indices(y : np.ndarray, n_bins : int) -> np.ndarray:
+    '''
+    Indices of the minimum and maximum of y in each of n_bins equal bins, in time
+    order, so spikes survive decimation. Samples that don't fill a whole bin are
+    kept as they are. Returns None if y is already short enough to draw as is.
+    '''
+    size = len(y) // n_bins
+    if size < 2:
+        return None
+
+    n_full = n_bins * size
+    bins   = y[:n_full].reshape(n_bins, size)
+    offset = np.arange(0, n_full, size)
+
+    idx = np.empty((n_bins, 2), dtype = np.intp)
+    idx[:, 0] = bins.argmin(axis = 1)
+    idx[:, 1] = bins.argmax(axis = 1)
+    idx.sort(axis = 1)
+    idx += offset[:, None]
+
+    return np.concatenate((idx.ravel(), np.arange(n_full, len(y))))
+
+
+def minmax_decimate(x : np.ndarray, y : np.ndarray, n_points : int) -> tuple:
+    '''
+    Reduce a waveform to about n_points points (min and max of n_points / 2 bins).
+    '''
+    idx = minmax_indices(y, max(1, n_points // 2))
+    if idx is None:
+        return x, y
+    return x[idx], y[idx]
@@ -15,6 +15,7 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QGroupBox,
     QLabel,
+    QCheckBox,
     QFileDialog,
     QApplication
 )
@@ -55,6 +56,8 @@ class config_files(QGroupBox):
             else:
                 logging.error("Invalid configuration file type selected.")
                 return
+            # apply it to the connected digitiser, only the changes are written
+            self.controller.update_config()
         else:
             logging.warning("No file selected.")
             return
@@ -64,13 +67,106 @@ class StatsBox(QGroupBox):
         super().__init__("Stats", parent = parent)
 
         self.fps_label = QLabel("FPS: 0")
-        #self.events_collected = QLabel(f'evts: {self.acq.events_collected}')
-        #self.rate = QLabel(f'Rate: {self.acq.rate} Hz')
+        self.pulse_label = QLabel("")
+        self.metrics_label = QLabel("")
+        self.metrics_label.setStyleSheet("font-family: monospace;")
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        top = QHBoxLayout()
+        top.addWidget(self.fps_label)
+        top.addWidget(self.pulse_label)
+        layout.addLayout(top)
+        layout.addWidget(self.metrics_label)
+
+    def show_metrics(self, snapshot : dict):
+        '''
+        Show the rate and latency of every active stage, and the fill level and
+        drops of every queue with a reader (see core.tracker.Metrics.snapshot).
+        '''
+        lines = []
+        for name, stage in snapshot['stages'].items():
+            if not stage['events']:
+                continue
+            latency = stage['latency_ms']
+            lines.append(f"{name:<20} {stage['rate']:>10.0f} ev/s {stage['MB_per_s']:>8.1f} MB/s "
+                         f"p50 {latency['p50']:>7.2f} ms  p99 {latency['p99']:>7.2f} ms")
+        for name, queue in snapshot['queues'].items():
+            lines.append(f"{name:<20} {queue['fill']:>9.0%} full {queue['drops']:>8} drops "
+                         f"wait p99 {queue['latency_ms']['p99']:>7.2f} ms")
+        self.metrics_label.setText("\n".join(lines))
+
+class ChannelDisplay(QGroupBox):
+    '''
+    Visibility toggles of the channels shown on the oscilloscope.
+    '''
+    def __init__(self, controller, parent=None):
+        super().__init__("Channels", parent = parent)
+        self.controller = controller
+        self.checkboxes = {}
+
+        self.layout = QHBoxLayout()
+        self.setLayout(self.layout)
+
+    def set_channels(self, channels):
+        '''
+        Rebuild the toggles for the given channel numbers, all shown.
+        '''
+        for checkbox in self.checkboxes.values():
+            self.layout.removeWidget(checkbox)
+            checkbox.deleteLater()
+        self.checkboxes = {}
+
+        for ch in channels:
+            checkbox = QCheckBox(f"ch{ch}")
+            checkbox.setChecked(True)
+            checkbox.toggled.connect(lambda checked, ch=ch: self.controller.set_channel_display(ch, checked))
+            self.layout.addWidget(checkbox)
+            self.checkboxes[ch] = checkbox
+
+class PersistenceControls(QGroupBox):
+    '''
+    Enable and reset the persistence (density) view.
+    '''
+    def __init__(self, controller, parent=None):
+        super().__init__("Persistence", parent = parent)
+        self.controller = controller
+
+        self.enable = QCheckBox("Show")
+        self.reset  = QPushButton("Reset")
+
+        layout = QHBoxLayout()
+        self.setLayout(layout)
+
+        layout.addWidget(self.enable)
+        layout.addWidget(self.reset)
+
+        self.enable.toggled.connect(lambda checked: self.controller.set_persistence(checked))
+        self.reset.clicked.connect(lambda: self.controller.reset_persistence())
+
+class SpectrumControls(QGroupBox):
+    '''
+    Show, reset and save the live energy spectrum.
+    '''
+    def __init__(self, controller, parent=None):
+        super().__init__("Energy spectrum", parent = parent)
+        self.controller = controller
+
+        self.enable = QCheckBox("Show")
+        self.reset  = QPushButton("Reset")
+        self.save   = QPushButton("Save")
 
         layout = QHBoxLayout()
         self.setLayout(layout)
 
-        layout.addWidget(self.fps_label)
+        layout.addWidget(self.enable)
+        layout.addWidget(self.reset)
+        layout.addWidget(self.save)
+
+        self.enable.toggled.connect(lambda checked: self.controller.set_spectrum(checked))
+        self.reset.clicked.connect(lambda: self.controller.reset_spectrum())
+        self.save.clicked.connect(lambda: self.controller.save_spectrum())
 
 class ConnectDigitiser(QGroupBox):
     def __init__(self, controller, parent=None):
@@ -162,6 +258,8 @@ class Acquisition(QGroupBox):
             self.start_stop.setText("Start")
             self.start_stop.setStyleSheet("background-color: green; color: black")
             self.acquiring = False
+            # stopping acquisition also stops the recording
+            self.set_recording(False)
             # stop the acquisition
             self.controller.stop_acquisition()
         else:
@@ -177,3 +275,28 @@ class Acquisition(QGroupBox):
         if digitiser exists, must force digitiser.isAcquiring
         then enables digitiser.isRecording also
         '''
+        if self.recording:
+            logging.info('Stopping recording...')
+            self.set_recording(False)
+            self.controller.stop_recording()
+        else:
+            logging.info('Starting recording...')
+            # the worker starts acquisition if needed, mirror that on the buttons
+            if not self.acquiring:
+                self.start_stop.setText("Stop")
+                self.start_stop.setStyleSheet("background-color: red; color: white")
+                self.acquiring = True
+            self.set_recording(True)
+            self.controller.start_recording()
+
+    def set_recording(self, recording):
+        '''
+        Update local recording flag and the record button.
+        '''
+        self.recording = recording
+        if recording:
+            self.record.setText("Recording")
+            self.record.setStyleSheet("background-color: orange; color: black")
+        else:
+            self.record.setText("Record")
+            self.record.setStyleSheet("background-color: red; color: black")
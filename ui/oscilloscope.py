@@ -8,6 +8,8 @@ https://github.com/diepala/wicope/
 import sys
 import random
 
+import numpy as np
+
 from PySide6.QtWidgets import (
     QComboBox,
     QFrame,
@@ -24,6 +26,22 @@ from PySide6 import QtCore, QtGui
 import pyqtgraph as pg
 
 from ui import elements
+from ui.persistence import PersistenceHistogram, PersistenceScreen
+from ui.spectrum import EnergySpectrum, SpectrumScreen
+from ui.decimation import XAxisCache, minmax_decimate
+
+
+# curve colours per channel, cycled beyond 8 channels
+CH_COLOURS = ['b', 'r', 'g', 'm', 'c', (255, 140, 0), (128, 0, 128), 'k']
+
+
+def newest_per_channel(channels : np.ndarray, shown : set) -> dict:
+    '''
+    Index of the newest event of each shown channel in a batch.
+    '''
+    reverse = channels[::-1]
+    found, first = np.unique(reverse, return_index = True)
+    return {int(ch) : len(channels) - 1 - int(i) for ch, i in zip(found, first) if int(ch) in shown}
 
 
 
@@ -37,6 +55,9 @@ class ControlPanel(QFrame):
 
         self.connect_digitiser = elements.ConnectDigitiser(self.controller)
         self.stats_box         = elements.StatsBox()
+        self.channel_display   = elements.ChannelDisplay(self.controller)
+        self.persistence       = elements.PersistenceControls(self.controller)
+        self.spectrum          = elements.SpectrumControls(self.controller)
         self.conf_files        = elements.config_files(self.controller)
         self.acquisition       = elements.Acquisition(self.controller)
 
@@ -44,6 +65,9 @@ class ControlPanel(QFrame):
 
         self.layout.addWidget(self.connect_digitiser)
         self.layout.addWidget(self.stats_box)
+        self.layout.addWidget(self.channel_display)
+        self.layout.addWidget(self.persistence)
+        self.layout.addWidget(self.spectrum)
         self.layout.addWidget(self.conf_files)
         self.layout.addWidget(self.acquisition)
 
@@ -64,15 +88,53 @@ class OscilloScopeScreen(pg.PlotWidget):
         self.setXRange(0, 1, padding = 0.02)
         self.setYRange(0, 5, padding = 0.02)
 
-        self.pen_ch1 = pg.mkPen(color = "b", width = 1)
-
-        self.plot_ch([0,1], [0,0])
-    
-    def plot_ch(self, x, y, ch = 1):
-        self.data_line_ch = self.plot(x, y, pen=self.pen_ch1)
-
-    def update_ch(self, x, y, ch = 1):
-        self.data_line_ch.setData(x, y)
+        # x-axis per record length, waveforms are decimated to ~2 points per pixel
+        self.x_axes = XAxisCache()
+
+        # one curve per channel, created when the channel is first shown
+        self.curves = {}
+        self.shown  = set()
+        self.addLegend()
+
+    def plot_ch(self, x, y, ch = 0):
+        pen = pg.mkPen(color = CH_COLOURS[ch % len(CH_COLOURS)], width = 1)
+        self.curves[ch] = self.plot(x, y, pen = pen, name = f'ch{ch}')
+
+    def set_channel_visible(self, ch, visible = True):
+        '''
+        Show or hide a channel's curve. Hidden channels are not processed at all.
+        '''
+        if visible:
+            if ch not in self.curves:
+                self.plot_ch([0, 1], [0, 0], ch)
+            self.curves[ch].show()
+            self.shown.add(ch)
+        else:
+            if ch in self.curves:
+                self.curves[ch].hide()
+            self.shown.discard(ch)
+
+    def n_points(self):
+        '''
+        Number of points worth drawing: twice the plot width in pixels.
+        '''
+        return 2 * max(int(self.getViewBox().width()), 100)
+
+    def update_ch(self, y, ch = 0):
+        '''
+        Draw a waveform, min/max decimated so the cost doesn't grow with the record length.
+        '''
+        x, y = minmax_decimate(self.x_axes.get(len(y)), y, self.n_points())
+        self.curves[ch].setData(x, y)
+
+    def update_channels(self, batch):
+        '''
+        Draw the newest waveform of every shown channel in the batch, in a single pass.
+        Channels with no event in the batch keep their previous trace.
+        '''
+        wf_size = batch.wf_size
+        for ch, i in newest_per_channel(batch.channel, self.shown).items():
+            self.update_ch(batch.waveforms[i][:int(wf_size[i])], ch)
 
 
 class MainWindow(QMainWindow):
@@ -88,10 +150,18 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("CAEN Acqusition and Readout Program (CARP)")
         
         self.screen        = OscilloScopeScreen()
+        self.persistence   = PersistenceScreen(PersistenceHistogram())
+        self.spectrum      = SpectrumScreen(EnergySpectrum(), colours = CH_COLOURS)
         self.control_panel = ControlPanel(self.controller)
 
+        # persistence and spectrum views sit next to the oscilloscope, shown when enabled
+        self.persistence.hide()
+        self.spectrum.hide()
+
         self.content_layout = QHBoxLayout()
         self.content_layout.addWidget(self.screen)
+        self.content_layout.addWidget(self.persistence)
+        self.content_layout.addWidget(self.spectrum)
         self.content_layout.addWidget(self.control_panel)
 
         self.setCentralWidget(QWidget())
@@ -0,0 +1,96 @@
+'''
+Persistence (density) display: a 2D histogram of time bin x ADC bin of all
+incoming waveforms, like the persistence mode of an oscilloscope.
+'''
+import time
+
+import numpy as np
+import pyqtgraph as pg
+
+
+class PersistenceHistogram:
+    '''
+    Accumulates whole batches of waveforms into a (time bin, ADC bin) histogram
+    with vectorised binning. With a decay time, older waveforms fade out
+    exponentially, otherwise they accumulate until reset.
+    '''
+
+    def __init__(self,
+                 time_bins : int   = 512,
+                 adc_bins  : int   = 256,
+                 adc_range : tuple = (0, 16384),
+                 decay     : float = 0):
+        self.time_bins = time_bins
+        self.adc_bins  = adc_bins
+        self.adc_range = adc_range
+        self.decay     = decay   # seconds, 0 keeps everything
+        self.length    = 0
+        self.counts    = np.zeros((time_bins, adc_bins), dtype = np.float32)
+        self.last_decay = time.perf_counter()
+
+    def reset(self):
+        self.counts[:] = 0
+        self.last_decay = time.perf_counter()
+
+    def set_length(self, length : int):
+        '''
+        Rebin the time axis for a new record length, clearing the histogram.
+        '''
+        self.length   = length
+        n_time        = min(self.time_bins, length)
+        self.counts   = np.zeros((n_time, self.adc_bins), dtype = np.float32)
+        # offset of each sample's time bin in the flattened histogram
+        self.time_offset = (np.arange(length) * n_time // length) * self.adc_bins
+        self.last_decay  = time.perf_counter()
+
+    def fill(self, waveforms : np.ndarray):
+        '''
+        Add a (n_events, n_samples) block of waveforms.
+        '''
+        if len(waveforms) == 0:
+            return
+        if waveforms.shape[1] != self.length:
+            self.set_length(waveforms.shape[1])
+
+        lo, hi   = self.adc_range
+        adc_bin  = ((waveforms - lo) * (self.adc_bins / (hi - lo))).astype(np.intp)
+        np.clip(adc_bin, 0, self.adc_bins - 1, out = adc_bin)
+        adc_bin += self.time_offset
+        self.counts += np.bincount(adc_bin.ravel(), minlength = self.counts.size).reshape(self.counts.shape)
+
+    def apply_decay(self):
+        '''
+        Fade the histogram by the time elapsed since the last call.
+        '''
+        now = time.perf_counter()
+        if self.decay > 0:
+            self.counts *= np.exp(-(now - self.last_decay) / self.decay)
+        self.last_decay = now
+
+
+class PersistenceScreen(pg.PlotWidget):
+    '''
+    Shows a PersistenceHistogram as a log scaled image.
+    '''
+    def __init__(self, histogram : PersistenceHistogram, parent = None, **kwargs):
+        super().__init__(parent=parent, background='w', **kwargs)
+        self.histogram = histogram
+
+        styles = {'color': 'k', 'font-size': '12px'}
+        self.setLabel('left', 'Voltage (ADCs)', **styles)
+        self.setLabel('bottom', 'Sample', **styles)
+
+        self.image = pg.ImageItem()
+        self.image.setColorMap(pg.colormap.get('viridis'))
+        self.addItem(self.image)
+
+    def refresh(self):
+        '''
+        Redraw the image from the histogram.
+        '''
+        hist = self.histogram
+        if hist.length == 0:
+            return
+        self.image.setImage(np.log1p(hist.counts), autoLevels = True)
+        lo, hi = hist.adc_range
+        self.image.setRect(0, lo, hist.length, hi - lo)
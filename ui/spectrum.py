@@ -0,0 +1,104 @@
+'''
+Live energy spectrum: per board and channel histograms of the DPP ENERGY field.
+'''
+import numpy as np
+import pyqtgraph as pg
+from PySide6.QtCore import Qt
+
+# line style of each board's curves, the colour is the channel's
+PEN_STYLES = (Qt.SolidLine, Qt.DashLine, Qt.DotLine, Qt.DashDotLine)
+
+
+class EnergySpectrum:
+    '''
+    Energy histograms of every (board, channel), filled incrementally batch by
+    batch. Each batch costs one np.add.at over its own events, the accumulated
+    counts are never re-histogrammed. Energies outside the range, and events of
+    boards or channels beyond n_boards or n_ch, are counted separately.
+    '''
+
+    def __init__(self,
+                 bins         : int   = 4096,
+                 energy_range : tuple = (0, 65536),
+                 n_ch         : int   = 64,
+                 n_boards     : int   = 1):
+        self.configure(bins, energy_range, n_ch, n_boards)
+
+    def configure(self, bins : int, energy_range : tuple, n_ch : int = 64, n_boards : int = 1):
+        '''
+        Set the binning, clearing the histograms.
+        '''
+        self.bins         = int(bins)
+        self.energy_range = tuple(energy_range)
+        self.n_ch         = int(n_ch)
+        self.n_boards     = max(1, int(n_boards))
+        lo, hi            = self.energy_range
+        self.edges        = np.linspace(lo, hi, self.bins + 1)
+        self.scale        = self.bins / (hi - lo)
+        self.counts       = np.zeros((self.n_boards, self.n_ch, self.bins), dtype = np.uint64)
+        self.out_of_range = np.zeros((self.n_boards, self.n_ch), dtype = np.uint64)
+
+    def reset(self):
+        self.counts[:]       = 0
+        self.out_of_range[:] = 0
+
+    def fill(self, board : np.ndarray, channel : np.ndarray, energy : np.ndarray):
+        '''
+        Add a batch of events given their board, channel and energy.
+        '''
+        if len(energy) == 0:
+            return
+        lo, _   = self.energy_range
+        e_bin   = ((energy.astype(np.float32) - lo) * self.scale).astype(np.intp)
+        inside  = (e_bin >= 0) & (e_bin < self.bins) & (channel < self.n_ch) & (board < self.n_boards)
+        if not inside.all():
+            np.add.at(self.out_of_range, (board[~inside] % self.n_boards, channel[~inside] % self.n_ch), 1)
+        np.add.at(self.counts, (board[inside], channel[inside], e_bin[inside]), 1)
+
+    def label(self, board : int, ch : int) -> str:
+        return f'ch{ch}' if self.n_boards == 1 else f'b{board}_ch{ch}'
+
+    def save(self, path : str, spectra = None):
+        '''
+        Write the given (board, channel) spectra (default: all with counts) as CSV,
+        one row per bin: bin low edge, bin high edge, counts per spectrum.
+        '''
+        if spectra is None:
+            spectra = list(zip(*np.nonzero(self.counts.sum(axis = 2))))
+        columns = [self.edges[:-1], self.edges[1:]] + [self.counts[board, ch] for board, ch in spectra]
+        header  = ','.join(['energy_low', 'energy_high'] + [self.label(board, ch) for board, ch in spectra])
+        np.savetxt(path, np.column_stack(columns), delimiter = ',', header = header,
+                   comments = '', fmt = ['%g', '%g'] + ['%d'] * len(spectra))
+
+
+class SpectrumScreen(pg.PlotWidget):
+    '''
+    Shows the EnergySpectrum of the shown channels, on every board, as step curves.
+    '''
+    def __init__(self, spectrum : EnergySpectrum, colours : list = ('b',), parent = None, **kwargs):
+        super().__init__(parent=parent, background='w', **kwargs)
+        self.spectrum = spectrum
+        self.colours  = colours
+        self.curves   = {}
+
+        styles = {'color': 'k', 'font-size': '12px'}
+        self.setLabel('left', 'Counts', **styles)
+        self.setLabel('bottom', 'Energy (ADC channels)', **styles)
+        self.showGrid(x = True, y = True)
+        self.addLegend()
+
+    def refresh(self, shown : set):
+        '''
+        Redraw the spectra of the shown channels.
+        '''
+        spectrum = self.spectrum
+        keys = {(board, ch) for board in range(spectrum.n_boards) for ch in shown if ch < spectrum.n_ch}
+        for key in list(self.curves):
+            if key not in keys:
+                self.removeItem(self.curves.pop(key))
+        for board, ch in sorted(keys):
+            if (board, ch) not in self.curves:
+                self.curves[board, ch] = self.plot(stepMode = 'center', name = spectrum.label(board, ch),
+                                                   pen = pg.mkPen(color = self.colours[ch % len(self.colours)],
+                                                                  style = PEN_STYLES[board % len(PEN_STYLES)]))
+            self.curves[board, ch].setData(spectrum.edges, spectrum.counts[board, ch])